@@ -1,57 +1,136 @@
-from flask import Flask, jsonify, render_template_string, request
+from flask import Flask, jsonify, render_template_string, request, Response, g
 from flask_restful import Api, Resource
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from bs4 import BeautifulSoup
-from datetime import datetime, timedelta
+try:
+    from lxml import etree, html as lxml_html
+except ImportError:
+    etree = lxml_html = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlparse
+from werkzeug.http import http_date
 import threading
+from collections import deque, OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+import bisect
 import time
 import os
-import firebase_admin
-from firebase_admin import credentials, firestore
+import importlib
 import json
 import logging
+import atexit
+import re
+import sys
+import sqlite3
+import hashlib
+import gzip
+import mmap
+import struct
+import tempfile
+import zlib
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+class LazyImport:
+    """Stand-in for a module, or a name in a module, that is imported on first use"""
+    
+    def __init__(self, module, attribute=None):
+        self._module = module
+        self._attribute = attribute
+        self._target = None
+    
+    def _load(self):
+        if self._target is None:
+            target = importlib.import_module(self._module)
+            if self._attribute:
+                target = getattr(target, self._attribute)
+            self._target = target
+        return self._target
+    
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+    
+    def __call__(self, *args, **kwargs):
+        return self._load()(*args, **kwargs)
+
+# Selenium, Firebase, numpy and friends take most of a second to import, so
+# they are loaded on first use and the app can serve requests while they warm up
+webdriver = LazyImport('selenium.webdriver')
+Service = LazyImport('selenium.webdriver.chrome.service', 'Service')
+ChromeDriverManager = LazyImport('webdriver_manager.chrome', 'ChromeDriverManager')
+By = LazyImport('selenium.webdriver.common.by', 'By')
+WebDriverWait = LazyImport('selenium.webdriver.support.ui', 'WebDriverWait')
+EC = LazyImport('selenium.webdriver.support.expected_conditions')
+BeautifulSoup = LazyImport('bs4', 'BeautifulSoup')
+firebase_admin = LazyImport('firebase_admin')
+credentials = LazyImport('firebase_admin.credentials')
+firestore = LazyImport('firebase_admin.firestore')
+np = LazyImport('numpy')
+requests = LazyImport('requests')
+HTTPAdapter = LazyImport('requests.adapters', 'HTTPAdapter')
+
+# Under gunicorn's gevent worker the standard library is monkey-patched before
+# the app is imported. gRPC, which Firestore talks through, does its own I/O
+# and would block the hub (and every stream and request of the worker) unless
+# told to cooperate before its first channel is created.
+GEVENT_PATCHED = 'gevent.monkey' in sys.modules and sys.modules['gevent.monkey'].is_module_patched('socket')
+if GEVENT_PATCHED:
+    from grpc.experimental import gevent as grpc_gevent
+    grpc_gevent.init_gevent()
+
+def run_blocking(function, *args, **kwargs):
+    """Call something that blocks in C code (SQLite, numpy) on a native thread when running under gevent"""
+    if not GEVENT_PATCHED:
+        return function(*args, **kwargs)
+    import gevent
+    return gevent.get_hub().threadpool.apply(function, args, kwargs)
+
 app = Flask(__name__)
 api = Api(app)
 
-# Initialize Firebase
-try:
-    # Try to get Firebase credentials from environment variable
-    firebase_credentials = os.environ.get('FIREBASE_CREDENTIALS')
-    if firebase_credentials:
-        cred_dict = json.loads(firebase_credentials)
-        cred = credentials.Certificate(cred_dict)
-    else:
-        # Fallback to local credentials file
-        cred = credentials.Certificate("floodpath-1c7ef-firebase-adminsdk-fbsvc-957288a212.json")
-    
-    firebase_admin.initialize_app(cred, {
-        'databaseURL': os.environ.get('FIREBASE_DATABASE_URL', 'https://floodpath-1c7ef.firebaseio.com')
-    })
-    db = firestore.client()
-    logger.info("Firebase initialized successfully")
-except Exception as e:
-    logger.error(f"Warning: Firebase initialization failed: {str(e)}")
-    db = None
+# Snapshot storage: firestore, sqlite, memory or none
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'firestore').lower()
+
+db = None  # Firestore client, set up in the background by warm_up()
+
+def initialize_firebase():
+    """Initialize Firebase and return a Firestore client, or None"""
+    try:
+        # Try to get Firebase credentials from environment variable
+        firebase_credentials = os.environ.get('FIREBASE_CREDENTIALS')
+        if firebase_credentials:
+            cred_dict = json.loads(firebase_credentials)
+            cred = credentials.Certificate(cred_dict)
+        else:
+            # Fallback to local credentials file
+            cred = credentials.Certificate("floodpath-1c7ef-firebase-adminsdk-fbsvc-957288a212.json")
+        
+        firebase_admin.initialize_app(cred, {
+            'databaseURL': os.environ.get('FIREBASE_DATABASE_URL', 'https://floodpath-1c7ef.firebaseio.com')
+        })
+        client = firestore.client()
+        logger.info("Firebase initialized successfully")
+        return client
+    except Exception as e:
+        logger.error(f"Warning: Firebase initialization failed: {str(e)}")
+        return None
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
 
 # Global variables to store the latest data
-latest_water_data = None
-latest_rainfall_data = None
 last_updated = None
+last_published_at = None  # When any source last published, for Last-Modified
 scraping_active = True
-last_water_hash = None  # Add this to track changes
-last_rainfall_hash = None  # Add this to track changes
-water_thread = None  # Add global thread variables
-rainfall_thread = None
+scraper_thread = None
 
 # Add this HTML template at the top of the file after the imports
 HTML_TEMPLATE = """
@@ -89,22 +168,23 @@ HTML_TEMPLATE = """
         function updateData() {
             const waterDate = document.getElementById('waterDate').value;
             const rainfallDate = document.getElementById('rainfallDate').value;
+            const dates = [waterDate, rainfallDate, 'latest'].filter(date => date);
             
-            // Fetch water level data
-            fetch(`/water-level?date=${waterDate}`)
+            // Fetch both tables in one request, falling back to the latest data for dates without any
+            fetch(`/batch?source=water_level,rainfall&date=${dates.join(',')}`)
                 .then(response => response.json())
-                .then(data => {
-                    if (data.status === 'success') {
-                        updateWaterTable(data.data, data.last_updated);
+                .then(result => {
+                    if (result.status !== 'success') {
+                        return;
                     }
-                });
-            
-            // Fetch rainfall data
-            fetch(`/rainfall?date=${rainfallDate}`)
-                .then(response => response.json())
-                .then(data => {
-                    if (data.status === 'success') {
-                        updateRainfallTable(data.data, data.last_updated);
+                    const pick = (entries, date) => (entries[date] && entries[date].data) ? entries[date] : entries.latest;
+                    const water = pick(result.results.water_level, waterDate);
+                    if (water && water.data) {
+                        updateWaterTable(water.data, water.last_updated);
+                    }
+                    const rainfall = pick(result.results.rainfall, rainfallDate);
+                    if (rainfall && rainfall.data) {
+                        updateRainfallTable(rainfall.data, rainfall.last_updated);
                     }
                 });
         }
@@ -152,10 +232,97 @@ HTML_TEMPLATE = """
             document.getElementById('rainfallTimestamp').textContent = `Last updated: ${timestamp}`;
         }
 
-        // Update data every 5 minutes
-        setInterval(updateData, 300000);
-        // Initial load
-        document.addEventListener('DOMContentLoaded', updateData);
+        // Pushed snapshots only apply while the newest date is selected
+        function showsLatest(selectId) {
+            return document.getElementById(selectId).selectedIndex <= 0;
+        }
+
+        // Latest table of each source as received from the stream
+        const latest = {
+            'water-level': {version: null, data: [], selectId: 'waterDate', render: updateWaterTable},
+            'rainfall': {version: null, data: [], selectId: 'rainfallDate', render: updateRainfallTable}
+        };
+
+        function applyChanges(table, change) {
+            const rows = new Map(table.data.map(row => [row.station, Object.assign({}, row)]));
+            change.removed.forEach(station => rows.delete(station));
+            change.changed.forEach(entry => {
+                if (rows.has(entry.station)) {
+                    Object.assign(rows.get(entry.station), entry.new);
+                }
+            });
+            change.added.forEach(row => rows.set(row.station, Object.assign({}, row)));
+            const order = change.order || Array.from(rows.keys());
+            table.data = order.filter(station => rows.has(station)).map(station => {
+                const row = rows.get(station);
+                row.timestamp = change.last_updated;
+                return row;
+            });
+            table.version = change.version;
+            table.last_updated = change.last_updated;
+        }
+
+        function showTable(table) {
+            if (showsLatest(table.selectId)) {
+                table.render(table.data, table.last_updated);
+            }
+        }
+
+        function resync(name) {
+            const table = latest[name];
+            const since = table.version === null ? '' : table.version;
+            fetch(`/${name}/changes?since=${since}`)
+                .then(response => response.json())
+                .then(result => {
+                    if (result.status !== 'success') {
+                        return;
+                    }
+                    if (result.full) {
+                        table.data = result.data;
+                        table.version = result.version;
+                        table.last_updated = result.last_updated;
+                    } else {
+                        result.changes.forEach(change => applyChanges(table, change));
+                    }
+                    showTable(table);
+                });
+        }
+
+        function subscribe() {
+            if (!window.EventSource) {
+                // Fall back to polling every 5 minutes
+                setInterval(updateData, 300000);
+                return;
+            }
+            const source = new EventSource('/stream');
+            Object.keys(latest).forEach(name => {
+                const table = latest[name];
+                // Whole table, sent on connect
+                source.addEventListener(name, event => {
+                    const data = JSON.parse(event.data);
+                    table.data = data.data;
+                    table.version = data.version;
+                    table.last_updated = data.last_updated;
+                    showTable(table);
+                });
+                // Station-level changes, applied to the table we hold
+                source.addEventListener(`${name}-changes`, event => {
+                    const change = JSON.parse(event.data);
+                    if (change.base_version !== table.version) {
+                        resync(name);
+                        return;
+                    }
+                    applyChanges(table, change);
+                    showTable(table);
+                });
+            });
+        }
+
+        // Initial load, then live updates
+        document.addEventListener('DOMContentLoaded', () => {
+            updateData();
+            subscribe();
+        });
     </script>
 </head>
 <body>
@@ -322,460 +489,3952 @@ def get_chrome_options():
     
     return options
 
-def calculate_data_hash(data):
-    """Calculate a hash of the data to detect changes"""
-    import hashlib
-    return hashlib.md5(str(data).encode()).hexdigest()
-
-def save_to_firebase(collection_name, data, timestamp):
-    """Save data to Firebase if available"""
-    if db is not None:
-        try:
-            # Parse the timestamp to get the date
-            try:
-                date_obj = datetime.strptime(timestamp, "%Y-%m-%d %H:%M")
-                date_str = date_obj.strftime("%Y-%m-%d")
-            except:
-                date_str = datetime.now().strftime("%Y-%m-%d")
-
-            # Create a copy of the data to avoid modifying the original
-            data_copy = []
-            for item in data:
-                item_copy = item.copy()
-                # Remove the firebase_timestamp from individual items
-                if 'firebase_timestamp' in item_copy:
-                    del item_copy['firebase_timestamp']
-                data_copy.append(item_copy)
-            
-            # Save to date-based collection
-            date_collection = f"{collection_name}_{date_str}"
-            db.collection(date_collection).document('latest').set({
-                'data': data_copy,
-                'last_updated': timestamp,
-                'firebase_timestamp': firestore.SERVER_TIMESTAMP
-            })
-            
-            # Also save to the main collection for latest data
-            db.collection(collection_name).document('latest').set({
-                'data': data_copy,
-                'last_updated': timestamp,
-                'firebase_timestamp': firestore.SERVER_TIMESTAMP
-            })
-            
-            logger.info(f"Data saved to Firebase {date_collection} at {timestamp}")
-        except Exception as e:
-            logger.error(f"Error saving to Firebase {collection_name}: {str(e)}")
-
-def initialize_webdriver():
-    """Initialize and return a configured webdriver instance"""
-    try:
-        logger.info("Initializing webdriver...")
-        options = get_chrome_options()
-        
-        # Log Chrome binary path in production
-        if os.environ.get('RENDER'):
-            logger.info("Running in production environment (Render)")
-            chrome_path = os.environ.get('CHROME_BIN', '/usr/bin/google-chrome-stable')
-            logger.info(f"Chrome binary path: {chrome_path}")
-            
-            # Verify Chrome binary exists
-            if not os.path.exists(chrome_path):
-                logger.error(f"Chrome binary not found at {chrome_path}")
-                # Try to find Chrome in common locations
-                common_paths = [
-                    '/usr/bin/google-chrome-stable',
-                    '/usr/bin/google-chrome',
-                    '/usr/bin/chrome',
-                    '/usr/bin/chromium',
-                    '/usr/bin/chromium-browser'
-                ]
-                for path in common_paths:
-                    if os.path.exists(path):
-                        logger.info(f"Found Chrome at {path}")
-                        chrome_path = path
-                        break
-                else:
-                    logger.error("Chrome not found in common locations")
-                    return None
-            
-            options.binary_location = chrome_path
-            
-            # Add display configuration for headless mode
-            os.environ['DISPLAY'] = ':99'
-            
-            # Add additional options for Render environment
-            options.add_argument('--disable-dev-shm-usage')
-            options.add_argument('--no-sandbox')
-            options.add_argument('--disable-gpu')
-            options.add_argument('--disable-software-rasterizer')
-            options.add_argument('--disable-extensions')
-            options.add_argument('--single-process')
-            options.add_argument('--no-zygote')
-            options.add_argument('--disable-dev-shm-usage')
-        
-        # Try to use Chrome from PATH first
-        try:
-            logger.info("Attempting to use Chrome from PATH...")
-            service = Service()
-            driver = webdriver.Chrome(service=service, options=options)
-            driver.set_page_load_timeout(30)
-            logger.info("Successfully initialized Chrome from PATH")
-            return driver
-        except Exception as e:
-            logger.warning(f"Failed to use Chrome from PATH: {str(e)}")
-        
-        # Fallback to ChromeDriverManager
-        try:
-            logger.info("Attempting to use ChromeDriverManager...")
-            service = Service(ChromeDriverManager().install())
-            driver = webdriver.Chrome(service=service, options=options)
-            driver.set_page_load_timeout(30)
-            logger.info("Successfully initialized Chrome with ChromeDriverManager")
-            return driver
-        except Exception as e:
-            logger.error(f"Failed to initialize Chrome with ChromeDriverManager: {str(e)}")
-            raise
-        
-    except Exception as e:
-        logger.error(f"Error initializing webdriver: {str(e)}")
-        return None
+class Counter:
+    """Monotonic counter with optional labels"""
+    kind = 'counter'
+    
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+    
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+    
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for label_values, value in values.items():
+            yield self.name, dict(zip(self.labels, label_values)), value
 
-def scrape_pagasa_water_level():
-    """Scrapes the water level data table from PAGASA website"""
-    global latest_water_data, last_updated, last_water_hash
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense.
     
-    consecutive_failures = 0
-    max_failures = 5  # Maximum number of consecutive failures before longer delay
+    Observing costs one bisect and a few additions under a lock, so it can sit
+    on the scrape and request paths.
+    """
+    kind = 'histogram'
+    DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
     
-    while scraping_active:
-        driver = None
-        try:
-            logger.info("Starting water level scraping...")
-            driver = initialize_webdriver()
-            if not driver:
-                logger.error("Failed to initialize webdriver for water level scraping")
-                consecutive_failures += 1
-                time.sleep(60 * min(consecutive_failures, max_failures))
-                continue
-            
-            # Navigate to the page
-            logger.info("Navigating to water level page...")
-            driver.get("https://pasig-marikina-tullahanffws.pagasa.dost.gov.ph/water/table.do")
-            
-            # Wait for table to load with increased timeout
-            logger.info("Waiting for water level table to load...")
-            WebDriverWait(driver, 30).until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, "table.table-type1"))
-            )
-            time.sleep(10)  # Increased wait time
-            
-            # Check if page is loaded
-            if "table.do" not in driver.current_url:
-                logger.error("Failed to load water level page")
-                consecutive_failures += 1
-                time.sleep(60 * min(consecutive_failures, max_failures))
-                continue
-            
-            html = driver.page_source
-            soup = BeautifulSoup(html, 'html.parser')
-            
-            search_time_div = soup.find('div', {'class': 'search-time'})
-            search_time = search_time_div.get_text(strip=True) if search_time_div else datetime.now().strftime("%Y-%m-%d %H:%M")
-            
-            table = soup.find('table', {'class': 'table-type1'})
-            if not table:
-                logger.error("Could not find water level data table")
-                consecutive_failures += 1
-                time.sleep(60 * min(consecutive_failures, max_failures))
-                continue
-            
-            data = []
-            for row in table.find('tbody').find_all('tr'):
-                cols = row.find_all(['th', 'td'])
-                if len(cols) >= 7:
-                    station = cols[0].get_text(strip=True)
-                    current_wl = cols[1].get_text(strip=True)
-                    wl_30min = cols[2].get_text(strip=True)
-                    wl_1hr = cols[3].get_text(strip=True)
-                    alert = cols[4].get_text(strip=True)
-                    alarm = cols[5].get_text(strip=True)
-                    critical = cols[6].get_text(strip=True)
-                    
-                    data.append({
-                        'station': station,
-                        'current_wl': current_wl,
-                        'wl_30min': wl_30min,
-                        'wl_1hr': wl_1hr,
-                        'alert_level': alert,
-                        'alarm_level': alarm,
-                        'critical_level': critical,
-                        'timestamp': search_time
-                    })
-            
-            if not data:
-                logger.error("No water level data was scraped")
-                consecutive_failures += 1
-                time.sleep(60 * min(consecutive_failures, max_failures))
-                continue
-            
-            # Reset consecutive failures on success
-            consecutive_failures = 0
-            
-            # Calculate hash of new data
-            new_hash = calculate_data_hash(data)
-            
-            # Only update if data has changed
-            if new_hash != last_water_hash:
-                latest_water_data = data
-                last_updated = search_time
-                last_water_hash = new_hash
-                
-                # Save to Firebase
-                save_to_firebase('water_levels', data, search_time)
-                logger.info(f"Water level data updated at {search_time}")
-            else:
-                logger.info("No changes in water level data")
-            
-        except Exception as e:
-            logger.error(f"Error during water level scraping: {str(e)}")
-            consecutive_failures += 1
-            time.sleep(60 * min(consecutive_failures, max_failures))
-        finally:
-            if driver:
-                try:
-                    driver.quit()
-                except Exception as e:
-                    logger.error(f"Error quitting webdriver: {str(e)}")
-        
-        # Calculate next scrape time to maintain 5-minute intervals
-        next_scrape = datetime.now() + timedelta(minutes=5)
-        time.sleep(max(0, (next_scrape - datetime.now()).total_seconds()))
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+    
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(label_values)
+            if entry is None:
+                entry = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+    
+    def samples(self):
+        with self._lock:
+            values = {key: (list(counts), total, count) for key, (counts, total, count) in self._values.items()}
+        for label_values, (counts, total, count) in values.items():
+            labels = dict(zip(self.labels, label_values))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket", dict(labels, le='+Inf' if bound == float('inf') else repr(float(bound))), cumulative
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, count
 
-def scrape_pagasa_rainfall():
-    """Scrapes the rainfall data table from PAGASA website"""
-    global latest_rainfall_data, last_updated, last_rainfall_hash
+class CollectedMetric:
+    """Gauge or counter read from existing state when metrics are rendered"""
     
-    consecutive_failures = 0
-    max_failures = 5  # Maximum number of consecutive failures before longer delay
+    def __init__(self, name, help_text, kind, labels, collect):
+        self.name = name
+        self.help_text = help_text
+        self.kind = kind
+        self.labels = labels
+        self.collect = collect
     
-    while scraping_active:
-        driver = None
-        try:
-            logger.info("Starting rainfall scraping...")
-            driver = initialize_webdriver()
-            if not driver:
-                logger.error("Failed to initialize webdriver for rainfall scraping")
-                consecutive_failures += 1
-                time.sleep(60 * min(consecutive_failures, max_failures))
-                continue
-            
-            # Navigate to the page
-            driver.get("https://pasig-marikina-tullahanffws.pagasa.dost.gov.ph/rainfall/table.do")
-            
-            # Wait for table to load with increased timeout
-            WebDriverWait(driver, 30).until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, "table.table-type1"))
-            )
-            time.sleep(10)  # Increased wait time
-            
-            html = driver.page_source
-            soup = BeautifulSoup(html, 'html.parser')
-            
-            search_time_div = soup.find('div', {'class': 'search-time'})
-            search_time = search_time_div.get_text(strip=True) if search_time_div else datetime.now().strftime("%Y-%m-%d %H:%M")
-            
-            table = soup.find('table', {'class': 'table-type1'})
-            if not table:
-                logger.error("Could not find rainfall data table")
-                consecutive_failures += 1
-                time.sleep(60 * min(consecutive_failures, max_failures))
-                continue
-            
-            data = []
-            for row in table.find('tbody').find_all('tr'):
-                cols = row.find_all(['th', 'td'])
-                if len(cols) >= 8:
-                    station = cols[0].get_text(strip=True)
-                    current_rf = cols[1].get_text(strip=True)
-                    rf_30min = cols[2].get_text(strip=True)
-                    rf_1hr = cols[3].get_text(strip=True)
-                    rf_3hr = cols[4].get_text(strip=True)
-                    rf_6hr = cols[5].get_text(strip=True)
-                    rf_12hr = cols[6].get_text(strip=True)
-                    rf_24hr = cols[7].get_text(strip=True)
-                    
-                    data.append({
-                        'station': station,
-                        'current_rf': current_rf,
-                        'rf_30min': rf_30min,
-                        'rf_1hr': rf_1hr,
-                        'rf_3hr': rf_3hr,
-                        'rf_6hr': rf_6hr,
-                        'rf_12hr': rf_12hr,
-                        'rf_24hr': rf_24hr,
-                        'timestamp': search_time
-                    })
-            
-            if not data:
-                logger.error("No rainfall data was scraped")
-                consecutive_failures += 1
-                time.sleep(60 * min(consecutive_failures, max_failures))
-                continue
-            
-            # Reset consecutive failures on success
-            consecutive_failures = 0
-            
-            # Calculate hash of new data
-            new_hash = calculate_data_hash(data)
-            
-            # Only update if data has changed
-            if new_hash != last_rainfall_hash:
-                latest_rainfall_data = data
-                last_updated = search_time
-                last_rainfall_hash = new_hash
-                
-                # Save to Firebase
-                save_to_firebase('rainfall_data', data, search_time)
-                logger.info(f"Rainfall data updated at {search_time}")
-            else:
-                logger.info("No changes in rainfall data")
-            
-        except Exception as e:
-            logger.error(f"Error during rainfall scraping: {str(e)}")
-            consecutive_failures += 1
-            time.sleep(60 * min(consecutive_failures, max_failures))
-        finally:
-            if driver:
-                try:
-                    driver.quit()
-                except:
-                    pass
-        
-        # Calculate next scrape time to maintain 5-minute intervals
-        next_scrape = datetime.now() + timedelta(minutes=5)
-        time.sleep(max(0, (next_scrape - datetime.now()).total_seconds()))
+    def samples(self):
+        for label_values, value in self.collect().items():
+            if not isinstance(label_values, tuple):
+                label_values = (label_values,)
+            yield self.name, dict(zip(self.labels, label_values)), value
 
-class WaterLevelData(Resource):
-    def get(self):
-        date = request.args.get('date')
-        if date:
+class MetricsRegistry:
+    """Process-local metrics rendered in the Prometheus text format"""
+    
+    def __init__(self):
+        self._metrics = []
+    
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+    
+    @staticmethod
+    def _format_labels(labels):
+        if not labels:
+            return ''
+        escaped = (
+            f'{key}="' + str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+            for key, value in labels.items()
+        )
+        return '{' + ','.join(escaped) + '}'
+    
+    @staticmethod
+    def _format_value(value):
+        if value is None:
+            return 'NaN'
+        if isinstance(value, (bool, int)):
+            return str(int(value))
+        return repr(float(value))
+    
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
             try:
-                # Try to get data for specific date
-                doc = db.collection(f'water_levels_{date}').document('latest').get()
-                if doc.exists:
-                    return {
-                        'status': 'success',
-                        'last_updated': doc.get('last_updated'),
-                        'data': doc.get('data')
-                    }
+                for name, labels, value in metric.samples():
+                    lines.append(f"{name}{self._format_labels(labels)} {self._format_value(value)}")
             except Exception as e:
-                logger.error(f"Error fetching water level data for date {date}: {str(e)}")
-        
-        # Fallback to latest data
-        if latest_water_data is None:
-            return {'error': 'Water level data not available yet'}, 503
-        
-        return {
-            'status': 'success',
-            'last_updated': last_updated,
-            'data': latest_water_data
-        }
+                logger.error(f"Error collecting metric {metric.name}: {str(e)}")
+        return '\n'.join(lines) + '\n'
 
-class RainfallData(Resource):
-    def get(self):
-        date = request.args.get('date')
-        if date:
-            try:
-                # Try to get data for specific date
-                doc = db.collection(f'rainfall_data_{date}').document('latest').get()
-                if doc.exists:
-                    return {
-                        'status': 'success',
-                        'last_updated': doc.get('last_updated'),
-                        'data': doc.get('data')
-                    }
-            except Exception as e:
-                logger.error(f"Error fetching rainfall data for date {date}: {str(e)}")
-        
-        # Fallback to latest data
-        if latest_rainfall_data is None:
-            return {'error': 'Rainfall data not available yet'}, 503
-        
-        return {
-            'status': 'success',
-            'last_updated': last_updated,
-            'data': latest_rainfall_data
-        }
+metrics = MetricsRegistry()
+scrape_phase_seconds = metrics.register(Histogram(
+    'floodpath_scrape_phase_seconds', 'Duration of each phase of a scrape cycle', ('phase', 'source')
+))
+scrape_cycle_seconds = metrics.register(Histogram(
+    'floodpath_scrape_cycle_seconds', 'Duration of whole scrape cycles'
+))
+scrapes_total = metrics.register(Counter(
+    'floodpath_scrapes_total', 'Scrapes by source and outcome (changed, unchanged, failed)', ('source', 'result')
+))
+scrape_failures_total = metrics.register(Counter(
+    'floodpath_scrape_failures_total', 'Failed scrapes by source and reason', ('source', 'reason')
+))
+thread_restarts_total = metrics.register(Counter(
+    'floodpath_scraper_thread_restarts_total', 'Scraper threads restarted by the thread monitor'
+))
+http_request_seconds = metrics.register(Histogram(
+    'floodpath_http_request_duration_seconds', 'API request latency', ('endpoint', 'method', 'status')
+))
+storage_seconds = metrics.register(Histogram(
+    'floodpath_storage_operation_seconds', 'Latency of snapshot storage reads and writes', ('operation', 'backend')
+))
 
-@app.route('/')
-def index():
-    # Get available dates from Firebase
-    available_dates = []
+# Recent scrape cycles for /debug/scrapes, and the cycle the current thread is running
+recent_scrapes = deque(maxlen=int(os.environ.get('DEBUG_SCRAPES_SIZE', 50)))
+scrape_trace = threading.local()
+
+def record_phase(phase, source, seconds):
+    """Record a phase duration in the histogram and in the running cycle, if any"""
+    scrape_phase_seconds.observe(seconds, phase, source)
+    cycle = getattr(scrape_trace, 'cycle', None)
+    if cycle is not None:
+        cycle['phases'].append({'phase': phase, 'source': source, 'ms': round(seconds * 1000, 2)})
+
+@contextmanager
+def timed_phase(phase, source=''):
+    """Time the enclosed block as one phase of a scrape"""
+    started = time.perf_counter()
     try:
-        if db:
-            # Get all collections
-            collections = db.collections()
-            for collection in collections:
-                if collection.id.startswith('water_levels_') or collection.id.startswith('rainfall_data_'):
-                    date = collection.id.split('_')[-1]
-                    if date not in available_dates:
-                        available_dates.append(date)
-    except Exception as e:
-        logger.error(f"Error fetching available dates: {str(e)}")
+        yield
+    finally:
+        record_phase(phase, source, time.perf_counter() - started)
+
+def note_scrape_failure(source, reason):
+    """Remember why a source failed in the running cycle (the first reason wins)"""
+    cycle = getattr(scrape_trace, 'cycle', None)
+    if cycle is not None:
+        cycle['failures'].setdefault(source, reason)
+
+NUMBER_PATTERN = re.compile(r'-?\d+(?:\.\d+)?')
+
+def parse_reading(text):
+    """Convert a table cell to a float, using NaN for '-', blank or non-numeric cells"""
+    match = NUMBER_PATTERN.search(text.replace(',', ''))
+    return float(match.group(0)) if match else float('nan')
+
+class TableSnapshot:
+    """Columnar snapshot of one scraped table.
     
-    # Sort dates in descending order
-    available_dates.sort(reverse=True)
+    Station names and cell text are interned and stored once per column, next
+    to a float64 array per column for numeric work. The search time is kept
+    once for the whole snapshot instead of on every row. Each station row has
+    a stable hash over its canonical values, and the snapshot digest combines
+    them with the search time to detect changes.
+    """
+    __slots__ = ('source', 'search_time', 'columns', 'stations', 'raw', '_values',
+                 'hashes', 'index', 'digest', 'version', '_rows')
     
-    return render_template_string(HTML_TEMPLATE, 
-                                water_data={'data': latest_water_data, 'last_updated': last_updated} if latest_water_data else None,
-                                rainfall_data={'data': latest_rainfall_data, 'last_updated': last_updated} if latest_rainfall_data else None,
-                                available_dates=available_dates)
+    def __init__(self, source, search_time, columns, stations, raw, version=None):
+        self.source = source
+        self.search_time = search_time
+        self.columns = columns
+        self.stations = stations
+        self.raw = raw
+        self._values = None
+        self.hashes = tuple(
+            station_hash(station, [raw[column][i] for column in columns[1:]])
+            for i, station in enumerate(stations)
+        )
+        self.index = {station: i for i, station in enumerate(stations)}
+        digest = hashlib.blake2b(str(search_time).encode(), digest_size=16)
+        for row_hash in self.hashes:
+            digest.update(row_hash.encode())
+        self.digest = digest.hexdigest()
+        self.version = version
+        self._rows = None
+    
+    @classmethod
+    def from_rows(cls, source, data, search_time):
+        """Build a snapshot from the row dicts produced by the table extractors"""
+        columns = source['columns']
+        stations = tuple(sys.intern(row[columns[0]]) for row in data)
+        raw = {
+            column: tuple(sys.intern(row[column]) for row in data)
+            for column in columns[1:]
+        }
+        return cls(source['name'], search_time, columns, stations, raw)
+    
+    def __len__(self):
+        return len(self.stations)
+    
+    @property
+    def values(self):
+        """Float64 array per value column, parsed on first use"""
+        if self._values is None:
+            self._values = {
+                column: np.array([parse_reading(text) for text in texts], dtype=np.float64)
+                for column, texts in self.raw.items()
+            }
+        return self._values
+    
+    def to_dicts(self):
+        """Return the rows in the original API shape, one dict per station"""
+        if self._rows is None:
+            value_columns = self.columns[1:]
+            rows = []
+            for i, station in enumerate(self.stations):
+                row = {self.columns[0]: station}
+                for column in value_columns:
+                    row[column] = self.raw[column][i]
+                row['timestamp'] = self.search_time
+                rows.append(row)
+            self._rows = rows
+        return self._rows
 
-api.add_resource(WaterLevelData, '/water-level')
-api.add_resource(RainfallData, '/rainfall')
+def canonical_value(text):
+    """Normalize cell text so layout-only whitespace changes don't count as changes"""
+    return ' '.join(str(text).split())
 
-def start_scrapers():
-    """Start the background scraper threads"""
-    global water_thread, rainfall_thread, scraping_active
+def station_hash(station, values):
+    """Return a stable hash of one station row"""
+    canonical = '\x1f'.join(canonical_value(value) for value in (station, *values))
+    return hashlib.blake2b(canonical.encode(), digest_size=8).hexdigest()
+
+def next_version(previous):
+    """Return a snapshot version: epoch milliseconds, strictly increasing"""
+    version = int(time.time() * 1000)
+    if previous is not None and previous.version is not None:
+        version = max(version, previous.version + 1)
+    return version
+
+def compute_delta(previous, snapshot):
+    """Return the station-level changes from the previous snapshot to this one"""
+    rows = snapshot.to_dicts()
+    added = []
+    changed = []
+    for i, station in enumerate(snapshot.stations):
+        j = previous.index.get(station) if previous is not None else None
+        if j is None:
+            added.append(rows[i])
+        elif previous.hashes[j] != snapshot.hashes[i]:
+            old = {}
+            new = {}
+            for column in snapshot.columns[1:]:
+                before = previous.raw[column][j] if column in previous.raw else None
+                after = snapshot.raw[column][i]
+                if before != after:
+                    old[column] = before
+                    new[column] = after
+            changed.append({'station': station, 'old': old, 'new': new})
     
-    try:
-        # Test webdriver initialization before starting threads
+    removed = []
+    if previous is not None:
+        removed = [station for station in previous.stations if station not in snapshot.index]
+    delta = {
+        'version': snapshot.version,
+        'base_version': previous.version if previous is not None else None,
+        'last_updated': snapshot.search_time,
+        'added': added,
+        'removed': removed,
+        'changed': changed
+    }
+    # Row order only needs to be sent when it isn't implied by the changes
+    if previous is not None:
+        implied = [station for station in previous.stations if station in snapshot.index]
+        implied += [row[snapshot.columns[0]] for row in added]
+        if implied != list(snapshot.stations):
+            delta['order'] = list(snapshot.stations)
+    return delta
+
+def apply_delta(rows, delta, key='station'):
+    """Apply a delta to a list of row dicts, returning the new rows"""
+    by_station = {row[key]: dict(row) for row in rows}
+    for station in delta['removed']:
+        by_station.pop(station, None)
+    for change in delta['changed']:
+        if change['station'] in by_station:
+            by_station[change['station']].update(change['new'])
+    for row in delta['added']:
+        by_station[row[key]] = dict(row)
+    
+    order = delta.get('order')
+    if order:
+        result = [by_station[station] for station in order if station in by_station]
+    else:
+        result = list(by_station.values())
+    for row in result:
+        row['timestamp'] = delta['last_updated']
+    return result
+
+class SnapshotChangeLog:
+    """Recent deltas of one source, for clients syncing with ?since="""
+    
+    def __init__(self, maxlen=288):
+        self._deltas = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+    
+    def append(self, delta):
+        with self._lock:
+            # A delta that doesn't continue the chain starts a new one
+            if self._deltas and delta['base_version'] != self._deltas[-1]['version']:
+                self._deltas.clear()
+            self._deltas.append(delta)
+    
+    def clear(self):
+        with self._lock:
+            self._deltas.clear()
+    
+    def since(self, version):
+        """Return the deltas after a version, or None if they are not all buffered"""
+        with self._lock:
+            if self._deltas and self._deltas[-1]['version'] == version:
+                return []
+            for i, delta in enumerate(self._deltas):
+                if delta['base_version'] == version:
+                    return list(self._deltas)[i:]
+        return None
+    
+    def __len__(self):
+        return len(self._deltas)
+
+# PAGASA publishes search times in Philippine Standard Time
+PAGASA_TZ = timezone(timedelta(hours=8))
+SEARCH_TIME_FORMATS = ("%Y-%m-%d %H:%M", "%Y-%m-%d %H:%M:%S", "%Y.%m.%d %H:%M", "%m/%d/%Y %H:%M")
+
+def parse_search_time(search_time):
+    """Parse a PAGASA search time into an aware datetime, or None if unrecognised"""
+    for fmt in SEARCH_TIME_FORMATS:
+        try:
+            return datetime.strptime(search_time.strip(), fmt).replace(tzinfo=PAGASA_TZ)
+        except (ValueError, AttributeError):
+            continue
+    return None
+
+def snapshot_epoch(snapshot):
+    """Return the snapshot's search time as epoch seconds, defaulting to now"""
+    parsed = parse_search_time(snapshot.search_time)
+    return int(parsed.timestamp()) if parsed else int(time.time())
+
+def day_epoch(day):
+    """Return the epoch seconds of PAGASA midnight starting a YYYY-MM-DD day"""
+    return int(datetime.fromisoformat(day).replace(tzinfo=PAGASA_TZ).timestamp())
+
+def timestamp_date(timestamp):
+    """Return the YYYY-MM-DD date a snapshot timestamp is filed under"""
+    # Parse the timestamp to get the date
+    try:
+        date_obj = datetime.strptime(timestamp, "%Y-%m-%d %H:%M")
+        return date_obj.strftime("%Y-%m-%d")
+    except:
+        return datetime.now().strftime("%Y-%m-%d")
+
+class DateDocumentCache:
+    """LRU cache of the dated 'latest' documents read from storage.
+    
+    Documents for past dates never change and stay cached until evicted.
+    Recent dates expire after a short TTL and are invalidated as soon as the
+    local scraper writes a newer snapshot. Missing dates are cached too, for
+    a limited time.
+    """
+    
+    def __init__(self, max_entries=256, recent_ttl=300, negative_ttl=300):
+        self.max_entries = max_entries
+        self.recent_ttl = recent_ttl
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'negative_hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+    
+    def _is_recent(self, date):
+        # Yesterday can still receive its final snapshot shortly after midnight
+        yesterday = (datetime.now(PAGASA_TZ) - timedelta(days=1)).strftime("%Y-%m-%d")
+        return date >= yesterday
+    
+    def _lookup(self, key, now):
+        """Return (True, document) for a live entry or (False, None) on a miss; the caller holds the lock"""
+        entry = self._entries.get(key)
+        if entry is not None and (entry['expires'] is None or entry['expires'] > now):
+            self._entries.move_to_end(key)
+            self.stats['negative_hits' if entry['document'] is None else 'hits'] += 1
+            return True, entry['document']
+        self.stats['misses'] += 1
+        return False, None
+    
+    def _store(self, key, document, now):
+        if document is None:
+            expires = now + self.negative_ttl
+        elif self._is_recent(key[1]):
+            expires = now + self.recent_ttl
+        else:
+            expires = None
+        with self._lock:
+            self._entries[key] = {'document': document, 'expires': expires}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+    
+    def get(self, collection_name, date, loader):
+        """Return the cached document for (collection, date), calling loader on a miss"""
+        key = (collection_name, date)
+        now = time.time()
+        with self._lock:
+            found, document = self._lookup(key, now)
+        if found:
+            return document
+        
+        document = loader()
+        self._store(key, document, now)
+        return document
+    
+    def get_many(self, keys, loader):
+        """Return {(collection, date): document} for several keys, loading all misses with one loader(missing) call"""
+        now = time.time()
+        documents = {}
+        missing = []
+        with self._lock:
+            for key in keys:
+                found, document = self._lookup(key, now)
+                if found:
+                    documents[key] = document
+                else:
+                    missing.append(key)
+        
+        if missing:
+            loaded = loader(missing)
+            for key in missing:
+                documents[key] = loaded.get(key)
+                self._store(key, documents[key], now)
+        return documents
+    
+    def invalidate(self, collection_name, date):
+        with self._lock:
+            if self._entries.pop((collection_name, date), None) is not None:
+                self.stats['invalidations'] += 1
+    
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['entries'] = len(self._entries)
+        return stats
+
+date_cache = DateDocumentCache(
+    max_entries=int(os.environ.get('DATE_CACHE_SIZE', 256)),
+    recent_ttl=int(os.environ.get('DATE_CACHE_RECENT_TTL', 300)),
+    negative_ttl=int(os.environ.get('DATE_CACHE_NEGATIVE_TTL', 300))
+)
+
+DATE_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+
+def is_valid_date(value):
+    """Return whether a query value is a real YYYY-MM-DD date"""
+    if not DATE_PATTERN.match(value):
+        return False
+    try:
+        datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        return False
+    return True
+
+# Bounded pool for the reads of one batch that can't share a round-trip: a
+# greenlet pool under the gevent worker (where gRPC is made cooperative),
+# native threads otherwise
+BATCH_READ_WORKERS = int(os.environ.get('BATCH_READ_WORKERS', 8))
+if GEVENT_PATCHED:
+    import gevent.pool
+    batch_read_pool = gevent.pool.Pool(BATCH_READ_WORKERS)
+else:
+    batch_read_pool = ThreadPoolExecutor(max_workers=BATCH_READ_WORKERS, thread_name_prefix='batch-read')
+
+class FirestoreStorage:
+    """Snapshots kept in Firestore.
+    
+    Each source has a main collection holding its 'latest' document and one
+    collection per date ('<collection>_<YYYY-MM-DD>'). The dated 'latest'
+    document is the day's checkpoint and the changes written after it go to
+    its 'deltas' subcollection. The known dates are mirrored to one index
+    document, so they can be listed without enumerating every collection.
+    """
+    name = 'firestore'
+    
+    def __init__(self, client, index_collection='meta', index_document='date_index'):
+        self.client = client
+        self.index_collection = index_collection
+        self.index_document = index_document
+    
+    def _index(self):
+        return self.client.collection(self.index_collection).document(self.index_document)
+    
+    def write_checkpoint(self, collection_name, date, document, new_date=False):
+        """Write the dated and main 'latest' documents in one batch"""
+        document = dict(document, firebase_timestamp=firestore.SERVER_TIMESTAMP)
+        batch = self.client.batch()
+        batch.set(self.client.collection(f"{collection_name}_{date}").document('latest'), document)
+        # Also save to the main collection for latest data
+        batch.set(self.client.collection(collection_name).document('latest'), document)
+        # Record a newly created dated collection in the date index
+        if new_date:
+            batch.set(self._index(), {'dates': firestore.ArrayUnion([date])}, merge=True)
+        batch.commit()
+    
+    def write_delta(self, collection_name, date, delta):
+        """Write a change to the 'deltas' subcollection of the dated 'latest' document"""
+        ref = (self.client.collection(f"{collection_name}_{date}").document('latest')
+               .collection('deltas').document(f"{delta['version']:016d}"))
+        ref.set(dict(delta, firebase_timestamp=firestore.SERVER_TIMESTAMP))
+    
+    def read_latest(self, collection_name):
+        """Return the main 'latest' document of a collection, or None"""
+        doc = self.client.collection(collection_name).document('latest').get()
+        if not doc.exists:
+            return None
+        checkpoint = doc.to_dict()
+        checkpoint.pop('firebase_timestamp', None)
+        checkpoint['update_time'] = doc.update_time
+        return checkpoint
+    
+    def read_dated(self, collection_name, date):
+        """Return (checkpoint, deltas written after it) for a date, or None"""
+        doc = self.client.collection(f'{collection_name}_{date}').document('latest').get()
+        if not doc.exists:
+            return None
+        return self._checkpoint_with_deltas(doc)
+    
+    def read_dated_many(self, keys):
+        """Return {(collection, date): (checkpoint, deltas) or None}, fetching every checkpoint in one get_all round-trip"""
+        refs = {}
+        for collection_name, date in keys:
+            ref = self.client.collection(f'{collection_name}_{date}').document('latest')
+            refs[ref.path] = ((collection_name, date), ref)
+        docs = [doc for doc in self.client.get_all([ref for _, ref in refs.values()]) if doc.exists]
+        
+        results = dict.fromkeys(keys)
+        # Delta queries can't be batched, so they run side by side on the shared pool
+        for doc, stored in zip(docs, batch_read_pool.map(self._checkpoint_with_deltas, docs)):
+            results[refs[doc.reference.path][0]] = stored
+        return results
+    
+    def _checkpoint_with_deltas(self, doc):
+        """Return (checkpoint, deltas written after it) for an existing dated 'latest' document"""
+        checkpoint = doc.to_dict()
+        checkpoint.pop('firebase_timestamp', None)
+        checkpoint['update_time'] = doc.update_time
+        deltas = []
+        if checkpoint.get('version') is not None:
+            query = doc.reference.collection('deltas').where('version', '>', checkpoint['version']).order_by('version')
+            for delta_doc in query.stream():
+                delta = delta_doc.to_dict()
+                delta['update_time'] = delta_doc.update_time
+                deltas.append(delta)
+        return checkpoint, deltas
+    
+    def load_dates(self):
+        """Return the dates stored in the index document"""
+        doc = self._index().get()
+        return set(doc.get('dates') or []) if doc.exists else set()
+    
+    def scan_dates(self, collection_names):
+        """Return the dates of the dated collections found in a collection listing"""
+        prefixes = tuple(f"{name}_" for name in collection_names)
+        dates = set()
+        for collection in self.client.collections():
+            if collection.id.startswith(prefixes):
+                date = collection.id.split('_')[-1]
+                if DATE_PATTERN.match(date):
+                    dates.add(date)
+        return dates
+    
+    def save_dates(self, dates):
+        self._index().set({'dates': sorted(dates)})
+
+class SQLiteStorage:
+    """Snapshots kept in a local SQLite database.
+    
+    Checkpoints are stored per (collection, date), with the date left empty
+    for the main 'latest' document, and deltas per (collection, date, version),
+    mirroring the Firestore layout.
+    """
+    name = 'sqlite'
+    
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        with self._lock:
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS checkpoints (
+                    collection TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    version INTEGER,
+                    document TEXT NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (collection, date)
+                ) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS deltas (
+                    collection TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    version INTEGER NOT NULL,
+                    delta TEXT NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (collection, date, version)
+                ) WITHOUT ROWID;
+            """)
+    
+    def write_checkpoint(self, collection_name, date, document, new_date=False):
+        """Write the dated and main 'latest' documents in one transaction"""
+        encoded = json.dumps(document, default=str)
+        now = time.time()
+        with self._lock:
+            self._conn.execute('BEGIN')
+            try:
+                self._conn.executemany(
+                    'INSERT OR REPLACE INTO checkpoints (collection, date, version, document, updated_at) VALUES (?, ?, ?, ?, ?)',
+                    [(collection_name, date, document.get('version'), encoded, now),
+                     (collection_name, '', document.get('version'), encoded, now)]
+                )
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+    
+    def write_delta(self, collection_name, date, delta):
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO deltas (collection, date, version, delta, updated_at) VALUES (?, ?, ?, ?, ?)',
+                (collection_name, date, delta['version'], json.dumps(delta, default=str), time.time())
+            )
+    
+    def read_latest(self, collection_name):
+        """Return the main 'latest' document of a collection, or None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT document, updated_at FROM checkpoints WHERE collection = ? AND date = ''", (collection_name,)
+            ).fetchone()
+        if row is None:
+            return None
+        checkpoint = json.loads(row[0])
+        checkpoint['update_time'] = datetime.fromtimestamp(row[1], timezone.utc)
+        return checkpoint
+    
+    def read_dated(self, collection_name, date):
+        """Return (checkpoint, deltas written after it) for a date, or None"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT version, document, updated_at FROM checkpoints WHERE collection = ? AND date = ?',
+                (collection_name, date)
+            ).fetchone()
+            if row is None:
+                return None
+            version, document, updated_at = row
+            rows = []
+            if version is not None:
+                rows = self._conn.execute(
+                    'SELECT delta, updated_at FROM deltas WHERE collection = ? AND date = ? AND version > ? ORDER BY version',
+                    (collection_name, date, version)
+                ).fetchall()
+        checkpoint = json.loads(document)
+        checkpoint['update_time'] = datetime.fromtimestamp(updated_at, timezone.utc)
+        deltas = []
+        for delta, delta_updated_at in rows:
+            delta = json.loads(delta)
+            delta['update_time'] = datetime.fromtimestamp(delta_updated_at, timezone.utc)
+            deltas.append(delta)
+        return checkpoint, deltas
+    
+    def read_dated_many(self, keys):
+        # Local reads are cheap enough one at a time
+        return {key: self.read_dated(*key) for key in keys}
+    
+    def load_dates(self):
+        with self._lock:
+            return {date for (date,) in self._conn.execute("SELECT DISTINCT date FROM checkpoints WHERE date != ''")}
+    
+    def scan_dates(self, collection_names):
+        with self._lock:
+            rows = self._conn.execute("SELECT collection, date FROM checkpoints WHERE date != ''").fetchall()
+        return {date for collection, date in rows if collection in collection_names}
+    
+    def save_dates(self, dates):
+        # The dates are always derived from the checkpoints table
+        pass
+
+class MemoryStorage:
+    """Snapshots kept in process memory, for local runs and benchmarks"""
+    name = 'memory'
+    
+    def __init__(self):
+        self._checkpoints = {}  # (collection, date) -> checkpoint
+        self._deltas = {}  # (collection, date) -> [delta], in version order
+        self._lock = threading.Lock()
+    
+    def write_checkpoint(self, collection_name, date, document, new_date=False):
+        document = dict(document, update_time=datetime.now(timezone.utc))
+        with self._lock:
+            self._checkpoints[(collection_name, date)] = document
+            self._checkpoints[(collection_name, '')] = document
+    
+    def write_delta(self, collection_name, date, delta):
+        delta = dict(delta, update_time=datetime.now(timezone.utc))
+        with self._lock:
+            deltas = self._deltas.setdefault((collection_name, date), [])
+            if deltas and deltas[-1]['version'] >= delta['version']:
+                # Rewritten after a retry, keep one copy per version in order
+                deltas[:] = [d for d in deltas if d['version'] != delta['version']]
+                deltas.append(delta)
+                deltas.sort(key=lambda d: d['version'])
+            else:
+                deltas.append(delta)
+    
+    def read_latest(self, collection_name):
+        with self._lock:
+            checkpoint = self._checkpoints.get((collection_name, ''))
+        return dict(checkpoint) if checkpoint is not None else None
+    
+    def read_dated(self, collection_name, date):
+        """Return (checkpoint, deltas written after it) for a date, or None"""
+        with self._lock:
+            checkpoint = self._checkpoints.get((collection_name, date))
+            if checkpoint is None:
+                return None
+            version = checkpoint.get('version')
+            deltas = [] if version is None else [
+                delta for delta in self._deltas.get((collection_name, date), ()) if delta['version'] > version
+            ]
+        return dict(checkpoint), deltas
+    
+    def read_dated_many(self, keys):
+        return {key: self.read_dated(*key) for key in keys}
+    
+    def load_dates(self):
+        with self._lock:
+            return {date for _, date in self._checkpoints if date}
+    
+    def scan_dates(self, collection_names):
+        with self._lock:
+            return {date for collection, date in self._checkpoints if date and collection in collection_names}
+    
+    def save_dates(self, dates):
+        pass
+
+def create_storage(backend):
+    """Return the storage selected by STORAGE_BACKEND, or None if snapshots are not stored"""
+    if backend == 'firestore':
+        return FirestoreStorage(db) if db is not None else None
+    if backend == 'sqlite':
+        try:
+            storage = SQLiteStorage(os.environ.get('STORAGE_SQLITE_PATH', 'data/storage.sqlite3'))
+            logger.info(f"SQLite storage opened at {storage.path}")
+            return storage
+        except Exception as e:
+            logger.error(f"Warning: SQLite storage initialization failed: {str(e)}")
+            return None
+    if backend == 'memory':
+        return MemoryStorage()
+    if backend != 'none':
+        logger.error(f"Unknown STORAGE_BACKEND '{backend}', snapshots will not be stored")
+    return None
+
+storage = None  # Set up in the background by warm_up()
+
+class DateIndex:
+    """Sorted set of dates that have dated collections.
+    
+    Kept in memory and mirrored to storage, so pages can list the available
+    dates without enumerating every collection. It is rebuilt from storage
+    once at startup and then updated incrementally as new dated collections
+    are written.
+    """
+    
+    def __init__(self):
+        self._dates = set()
+        self._sorted = []
+        self._lock = threading.Lock()
+    
+    def _replace(self, dates):
+        with self._lock:
+            self._dates = set(dates)
+            self._sorted = sorted(self._dates, reverse=True)
+    
+    def rebuild(self):
+        """Rebuild the index from the stored collections and save it back to storage"""
+        if storage is None:
+            return
+        try:
+            dates = storage.scan_dates([source['collection'] for source in SCRAPE_SOURCES])
+            self._replace(dates | self._dates)
+            storage.save_dates(self._dates)
+            logger.info(f"Date index rebuilt with {len(self._dates)} dates")
+        except Exception as e:
+            logger.error(f"Error rebuilding date index: {str(e)}")
+            self.load()
+    
+    def load(self):
+        """Load the index from storage"""
+        if storage is None:
+            return
+        try:
+            self._replace(storage.load_dates() | self._dates)
+        except Exception as e:
+            logger.error(f"Error loading date index: {str(e)}")
+    
+    def __contains__(self, date):
+        return date in self._dates
+    
+    def add(self, date):
+        """Add a date to the in-memory index, returning True if it was new"""
+        with self._lock:
+            if date in self._dates:
+                return False
+            self._dates.add(date)
+            self._sorted = sorted(self._dates, reverse=True)
+            return True
+    
+    def dates(self):
+        """Return the indexed dates, newest first"""
+        return self._sorted
+
+date_index = DateIndex()
+
+def payload_etag(*parts):
+    """Return a strong entity tag for a response built from the given parts"""
+    return hashlib.md5('\x1f'.join(str(part) for part in parts).encode()).hexdigest()
+
+class EncodedPayload:
+    """A JSON response serialized once, with precompressed variants.
+    
+    The body is encoded exactly as flask-restful would encode it, so serving
+    these bytes directly leaves responses unchanged. Each encoding gets its own
+    strong ETag derived from the payload's tag.
+    """
+    __slots__ = ('etag', 'last_modified', 'bodies')
+    
+    def __init__(self, payload, etag, last_modified):
+        self.etag = etag
+        self.last_modified = last_modified
+        body = (json.dumps(payload) + "\n").encode()
+        self.bodies = {'identity': body, 'gzip': gzip.compress(body, compresslevel=6, mtime=0)}
+        if brotli is not None:
+            self.bodies['br'] = brotli.compress(body)
+    
+    @classmethod
+    def from_bodies(cls, etag, last_modified, bodies):
+        """Wrap bodies that were already encoded elsewhere"""
+        encoded = cls.__new__(cls)
+        encoded.etag = etag
+        encoded.last_modified = last_modified
+        encoded.bodies = bodies
+        return encoded
+    
+    def tag(self, encoding):
+        return self.etag if encoding == 'identity' else f"{self.etag}-{encoding}"
+    
+    def respond(self):
+        """Serve the best encoding the client accepts, or a bodiless 304 if its validators match"""
+        encoding = request.accept_encodings.best_match(
+            [encoding for encoding in ('br', 'gzip') if encoding in self.bodies]
+        ) or 'identity'
+        headers = {
+            'ETag': f'"{self.tag(encoding)}"',
+            'Cache-Control': 'no-cache',
+            'Vary': 'Accept-Encoding'
+        }
+        if self.last_modified is not None:
+            headers['Last-Modified'] = http_date(self.last_modified)
+        
+        # If-None-Match takes precedence over If-Modified-Since when both are sent
+        if request.if_none_match:
+            if any(request.if_none_match.contains_weak(self.tag(name)) for name in self.bodies):
+                return Response(status=304, headers=headers)
+        elif self.last_modified is not None and request.if_modified_since is not None:
+            if self.last_modified.replace(microsecond=0) <= request.if_modified_since:
+                return Response(status=304, headers=headers)
+        
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        return Response(self.bodies[encoding], status=200, headers=headers, mimetype='application/json')
+
+class SnapshotEventBus:
+    """Fan-out of published snapshots to Server-Sent Events subscribers.
+    
+    Recent events stay in a small ring buffer so reconnecting clients can
+    resume from their Last-Event-ID. Subscribers block on a shared condition
+    rather than polling, which under the gevent worker costs a greenlet per
+    connection instead of a thread.
+    """
+    
+    def __init__(self, buffer_size=256, max_subscribers=5000):
+        self.max_subscribers = max_subscribers
+        self._events = deque(maxlen=buffer_size)
+        self._last_id = 0
+        self._subscribers = 0
+        self._condition = threading.Condition()
+    
+    @property
+    def last_id(self):
+        return self._last_id
+    
+    def publish(self, event, data):
+        with self._condition:
+            self._last_id += 1
+            self._events.append((self._last_id, event, data))
+            self._condition.notify_all()
+    
+    def full(self):
+        with self._condition:
+            return self._subscribers >= self.max_subscribers
+    
+    def subscribe(self):
+        """Reserve a subscriber slot, returning False when the cap is reached"""
+        with self._condition:
+            if self._subscribers >= self.max_subscribers:
+                return False
+            self._subscribers += 1
+            return True
+    
+    def unsubscribe(self):
+        with self._condition:
+            self._subscribers -= 1
+    
+    def events_since(self, last_id, timeout):
+        """Wait up to timeout for events after last_id.
+        
+        Returns the list of newer events (empty on timeout), or None when
+        last_id has already fallen out of the buffer.
+        """
+        with self._condition:
+            if self._last_id <= last_id:
+                self._condition.wait(timeout)
+            if self._last_id <= last_id:
+                return []
+            if not self._events or self._events[0][0] > last_id + 1:
+                return None
+            return [event for event in self._events if event[0] > last_id]
+    
+    def get_stats(self):
+        with self._condition:
+            return {
+                'subscribers': self._subscribers,
+                'last_event_id': self._last_id,
+                'buffered_events': len(self._events)
+            }
+
+snapshot_events = SnapshotEventBus(
+    buffer_size=int(os.environ.get('STREAM_BUFFER_SIZE', 256)),
+    max_subscribers=int(os.environ.get('STREAM_MAX_SUBSCRIBERS', 5000))
+)
+STREAM_HEARTBEAT = int(os.environ.get('STREAM_HEARTBEAT', 15))
+
+def stream_event_name(source_name):
+    """Return the SSE event name of a source, matching its API path"""
+    return source_name.replace('_', '-')
+
+def format_sse(event_id, event, data):
+    return f"id: {event_id}\nevent: {event}\ndata: {data}\n\n"
+
+def refresh_latest_payloads():
+    """Re-encode the current snapshot responses of every source"""
+    for name, state in source_states.items():
+        if state['snapshot'] is None:
+            continue
+        payload = {
+            'status': 'success',
+            'last_updated': last_updated,
+            'data': state['snapshot'].to_dicts()
+        }
+        if state['stale']:
+            # Restored at startup and not confirmed by a scrape yet
+            payload['stale'] = True
+        state['payload'] = EncodedPayload(
+            payload,
+            # The payload carries the global last_updated, so it is part of the tag
+            payload_etag(state['hash'], last_updated, state['stale']),
+            last_published_at
+        )
+
+# Only one worker process scrapes; the others serve what it shares with them
+SHARED_STATE_DIR = os.environ.get(
+    'SHARED_STATE_DIR',
+    os.path.join('/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(), 'pagasa-scraper')
+)
+SHARED_POLL_INTERVAL = float(os.environ.get('SHARED_POLL_INTERVAL', 1))
+LEADER_RETRY_INTERVAL = float(os.environ.get('LEADER_RETRY_INTERVAL', 30))
+
+class ScraperLeadership:
+    """Exclusive, non-blocking flock on a lock file shared by all workers.
+    
+    The worker holding the lock runs the scrapers. The kernel releases it when
+    that process exits, so a follower takes over on its next attempt. Without
+    fcntl (Windows) every process is its own leader.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+    
+    @property
+    def is_leader(self):
+        return fcntl is None or self.fd is not None
+    
+    def try_acquire(self):
+        """Try to become the leader, returning True if this process is the leader"""
+        if self.is_leader:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self.fd = fd
+        return True
+    
+    def release(self):
+        if self.fd is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
+            self.fd = None
+
+class SharedSnapshotRegion:
+    """Memory-mapped file holding the latest shared record of one source.
+    
+    The header is a seqlock: the writer makes the sequence odd while it
+    rewrites the record and even again once it is complete. Readers compare
+    the sequence with the last one they applied, and only copy the record out
+    when it changed and stayed the same while they copied it.
+    """
+    HEADER = struct.Struct('<8sQQ')
+    MAGIC = b'PGSNAP01'
+    MIN_SIZE = 1 << 16
+    
+    def __init__(self, path):
+        self.path = path
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        if os.fstat(self.fd).st_size < self.MIN_SIZE:
+            os.ftruncate(self.fd, self.MIN_SIZE)
+        self.map = mmap.mmap(self.fd, 0)
+    
+    def _remap(self):
+        self.map.close()
+        self.map = mmap.mmap(self.fd, 0)
+    
+    def version(self):
+        """Return the current sequence number; odd while a write is in progress"""
+        return struct.unpack_from('<Q', self.map, 8)[0]
+    
+    def write(self, record):
+        """Replace the record (single writer only)"""
+        sequence = self.version()
+        sequence += 1 if sequence % 2 == 0 else 2
+        struct.pack_into('<Q', self.map, 8, sequence)
+        end = self.HEADER.size + len(record)
+        if end > len(self.map):
+            os.ftruncate(self.fd, max(end, 2 * len(self.map)))
+            self._remap()
+        self.map[self.HEADER.size:end] = record
+        self.HEADER.pack_into(self.map, 0, self.MAGIC, sequence + 1, len(record))
+    
+    def read(self, retries=100):
+        """Return (sequence, record), or None if no complete record is available"""
+        for _ in range(retries):
+            magic, sequence, length = self.HEADER.unpack_from(self.map, 0)
+            if magic != self.MAGIC:
+                return None
+            if sequence % 2 == 0:
+                end = self.HEADER.size + length
+                if end > len(self.map):
+                    # The writer grew the file since it was mapped
+                    self._remap()
+                    continue
+                record = self.map[self.HEADER.size:end]
+                if self.version() == sequence:
+                    return sequence, record
+            time.sleep(0.001)
+        return None
+
+scraper_leadership = ScraperLeadership(os.path.join(SHARED_STATE_DIR, 'scraper.lock'))
+shared_regions = {}
+
+def get_shared_region(name):
+    region = shared_regions.get(name)
+    if region is None:
+        region = shared_regions[name] = SharedSnapshotRegion(os.path.join(SHARED_STATE_DIR, f"{name}.snapshot"))
+    return region
+
+def encode_shared_state(state):
+    """Serialize a source's snapshot and its encoded responses into one record"""
+    snapshot = state['snapshot']
+    payload = state['payload']
+    meta = json.dumps({
+        'source': snapshot.source,
+        'search_time': snapshot.search_time,
+        'columns': list(snapshot.columns),
+        'stations': snapshot.stations,
+        'raw': snapshot.raw,
+        'hash': state['hash'],
+        'version': snapshot.version,
+        'delta': state['delta'],
+        'stale': state['stale'],
+        'last_updated': last_updated,
+        'published_at': last_published_at.isoformat(),
+        'etag': payload.etag,
+        'last_modified': payload.last_modified.isoformat(),
+        'bodies': [[encoding, len(body)] for encoding, body in payload.bodies.items()]
+    }).encode()
+    return b''.join([struct.pack('<I', len(meta)), meta, *payload.bodies.values()])
+
+def share_latest_snapshots():
+    """Write the current state of every source to its shared region"""
+    # Only a leader elected through the lock has followers to share with
+    if fcntl is None or scraper_leadership.fd is None:
+        return
+    for name, state in source_states.items():
+        if state['payload'] is None:
+            continue
+        try:
+            get_shared_region(name).write(encode_shared_state(state))
+        except Exception as e:
+            logger.error(f"Error sharing {name} snapshot: {str(e)}")
+
+def apply_shared_state(record):
+    """Adopt a snapshot shared by the leader"""
+    global last_updated, last_published_at
+    
+    meta_length = struct.unpack_from('<I', record)[0]
+    offset = 4 + meta_length
+    meta = json.loads(record[4:offset])
+    source = SOURCES_BY_NAME.get(meta['source'])
+    if source is None:
+        return
+    state = source_states[source['name']]
+    
+    bodies = {}
+    for encoding, length in meta['bodies']:
+        bodies[encoding] = record[offset:offset + length]
+        offset += length
+    published_at = datetime.fromisoformat(meta['published_at'])
+    if last_published_at is None or published_at >= last_published_at:
+        last_updated = meta['last_updated']
+        last_published_at = published_at
+    state['payload'] = EncodedPayload.from_bodies(
+        meta['etag'], datetime.fromisoformat(meta['last_modified']), bodies
+    )
+    state['stale'] = meta.get('stale', False)
+    
+    if meta['hash'] != state['hash']:
+        state['snapshot'] = TableSnapshot(
+            source['name'],
+            meta['search_time'],
+            meta['columns'],
+            tuple(sys.intern(station) for station in meta['stations']),
+            {column: tuple(sys.intern(text) for text in texts) for column, texts in meta['raw'].items()},
+            meta['version']
+        )
+        state['last_updated'] = meta['search_time']
+        state['hash'] = meta['hash']
+        state['delta'] = meta['delta']
+        announce_snapshot(source)
+        if storage is not None and timestamp_date(meta['search_time']) not in date_index:
+            date_index.load()
+
+# Every published snapshot is also kept on local disk, so a restarted process
+# serves the last known data (marked stale) before its first scrape finishes
+SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR', os.path.join('data', 'snapshots'))
+SNAPSHOT_FILE_HEADER = struct.Struct('<8sIQH')  # magic, crc32 of the URL and body, snapshot version, URL length
+SNAPSHOT_FILE_MAGIC = b'PGSTATE2'
+
+def snapshot_path(name):
+    return os.path.join(SNAPSHOT_DIR, f"{name}.snapshot")
+
+def persist_snapshot(state):
+    """Atomically replace a source's snapshot file with zlib-compressed JSON behind a checksummed header"""
+    snapshot = state['snapshot']
+    body = zlib.compress(json.dumps({
+        'source': snapshot.source,
+        'search_time': snapshot.search_time,
+        'columns': list(snapshot.columns),
+        'stations': snapshot.stations,
+        'raw': snapshot.raw,
+        'version': snapshot.version,
+        'published_at': last_published_at.isoformat()
+    }, separators=(',', ':')).encode(), 6)
+    # The page the data came from, so data scraped from another site (a benchmark stand-in) is never restored
+    url = SOURCES_BY_NAME[snapshot.source]['url'].encode()
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(prefix=f".{snapshot.source}-", dir=SNAPSHOT_DIR)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(SNAPSHOT_FILE_HEADER.pack(SNAPSHOT_FILE_MAGIC, zlib.crc32(body, zlib.crc32(url)), snapshot.version or 0, len(url)))
+            f.write(url)
+            f.write(body)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, snapshot_path(snapshot.source))
+    except Exception:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+
+def read_persisted_snapshot(name):
+    """Return the snapshot saved for a source and when it was published, or None"""
+    try:
+        with open(snapshot_path(name), 'rb') as f:
+            record = f.read()
+    except FileNotFoundError:
+        return None
+    if len(record) < SNAPSHOT_FILE_HEADER.size or record[:8] != SNAPSHOT_FILE_MAGIC:
+        logger.warning(f"Ignoring snapshot file for {name} in an unknown format")
+        return None
+    _, checksum, _, url_length = SNAPSHOT_FILE_HEADER.unpack_from(record)
+    url = record[SNAPSHOT_FILE_HEADER.size:SNAPSHOT_FILE_HEADER.size + url_length]
+    body = record[SNAPSHOT_FILE_HEADER.size + url_length:]
+    if zlib.crc32(body, zlib.crc32(url)) != checksum:
+        logger.warning(f"Ignoring corrupt snapshot file for {name}")
+        return None
+    if url.decode() != SOURCES_BY_NAME[name]['url']:
+        logger.warning(f"Ignoring snapshot file for {name} scraped from {url.decode()}")
+        return None
+    meta = json.loads(zlib.decompress(body))
+    snapshot = TableSnapshot(
+        meta['source'],
+        meta['search_time'],
+        meta['columns'],
+        tuple(sys.intern(station) for station in meta['stations']),
+        {column: tuple(sys.intern(text) for text in texts) for column, texts in meta['raw'].items()},
+        meta['version']
+    )
+    return snapshot, datetime.fromisoformat(meta['published_at'])
+
+def read_stored_snapshot(source):
+    """Rebuild a source's latest snapshot from storage: the last checkpoint plus the deltas after it"""
+    checkpoint = storage.read_latest(source['collection'])
+    if checkpoint is None:
+        return None
+    stored = (checkpoint, [])
+    if checkpoint.get('date') and checkpoint.get('version') is not None:
+        stored = storage.read_dated(source['collection'], checkpoint['date']) or stored
+    data, search_time, version, update_time = replay_stored(source['collection'], *stored)
+    if not data:
+        return None
+    snapshot = TableSnapshot.from_rows(source, data, search_time)
+    snapshot.version = version
+    return snapshot, update_time or datetime.now(timezone.utc)
+
+def restore_snapshots(from_storage=False):
+    """Serve the last known snapshots, marked stale, until fresh ones are published"""
+    global last_updated, last_published_at
+    
+    restored = []
+    for source in SCRAPE_SOURCES:
+        state = source_states[source['name']]
+        if state['snapshot'] is not None:
+            continue
+        try:
+            if from_storage:
+                result = read_stored_snapshot(source) if storage is not None else None
+            else:
+                result = read_persisted_snapshot(source['name']) if SNAPSHOT_DIR else None
+        except Exception as e:
+            logger.error(f"Error restoring {source['label']} snapshot: {str(e)}")
+            continue
+        if result is None:
+            continue
+        
+        snapshot, published_at = result
+        state['snapshot'] = snapshot
+        state['last_updated'] = snapshot.search_time
+        state['hash'] = snapshot.digest
+        state['delta'] = None
+        state['stale'] = True
+        state['stream_snapshot'] = json.dumps(full_changes(snapshot))
+        if last_published_at is None or published_at > last_published_at:
+            last_updated = snapshot.search_time
+            last_published_at = published_at
+        evaluate_alerts(source)
+        update_analytics(source)
+        restored.append(source['label'])
+    
+    if restored:
+        refresh_latest_payloads()
+        logger.info(f"Restored {', '.join(restored)} data from {'storage' if from_storage else 'local snapshot files'}")
+
+def follow_shared_snapshots():
+    """Apply the leader's snapshots and take over if the leader goes away"""
+    versions = {}
+    next_attempt = time.monotonic() + LEADER_RETRY_INTERVAL
+    while scraping_active:
+        try:
+            for source in SCRAPE_SOURCES:
+                region = get_shared_region(source['name'])
+                if region.version() == versions.get(source['name']):
+                    continue
+                result = region.read()
+                if result is None:
+                    continue
+                versions[source['name']], record = result
+                apply_shared_state(record)
+            
+            if time.monotonic() >= next_attempt:
+                next_attempt = time.monotonic() + LEADER_RETRY_INTERVAL
+                if scraper_leadership.try_acquire():
+                    logger.info("Scraper lock acquired, taking over scraping")
+                    start_scrapers()
+                    return
+        except Exception as e:
+            logger.error(f"Error following shared snapshots: {str(e)}")
+        time.sleep(SHARED_POLL_INTERVAL)
+
+def replay_stored(collection_name, checkpoint, deltas):
+    """Apply the deltas written after a checkpoint, returning (data, last_updated, version, update_time)"""
+    data = checkpoint.get('data')
+    last_updated = checkpoint.get('last_updated')
+    version = checkpoint.get('version')
+    update_time = checkpoint.get('update_time')
+    if version is not None:
+        key = next((source['columns'][0] for source in SCRAPE_SOURCES if source['collection'] == collection_name), 'station')
+        for delta in deltas:
+            data = apply_delta(data, delta, key)
+            last_updated = delta['last_updated']
+            version = delta['version']
+            if delta['update_time'] and (update_time is None or delta['update_time'] > update_time):
+                update_time = delta['update_time']
+    return data, last_updated, version, update_time
+
+def build_dated_document(collection_name, date, stored):
+    """Return {'last_updated', 'data', 'payload'} from a stored (checkpoint, deltas), or None if nothing was stored"""
+    if stored is None:
+        return None
+    data, last_updated, version, update_time = replay_stored(collection_name, *stored)
+    if version is None:
+        tag = payload_etag(json.dumps(data, sort_keys=True, default=str), last_updated)
+    else:
+        tag = payload_etag(collection_name, date, version)
+    return {
+        'last_updated': last_updated,
+        'data': data,
+        'payload': EncodedPayload(
+            {
+                'status': 'success',
+                'last_updated': last_updated,
+                'data': data
+            },
+            tag,
+            update_time or datetime.now(timezone.utc)
+        )
+    }
+
+def get_dated_document(collection_name, date):
+    """Return {'last_updated', 'data'} of a dated 'latest' document, or None if it doesn't exist"""
+    if storage is None:
+        return None
+    
+    def load():
+        started = time.perf_counter()
+        stored = storage.read_dated(collection_name, date)
+        storage_seconds.observe(time.perf_counter() - started, 'read', storage.name)
+        return build_dated_document(collection_name, date, stored)
+    
+    return date_cache.get(collection_name, date, load)
+
+def get_dated_documents(keys):
+    """Return {(collection, date): document or None}, reading every uncached document in one storage call"""
+    if storage is None:
+        return dict.fromkeys(keys)
+    
+    def load(missing):
+        started = time.perf_counter()
+        stored = storage.read_dated_many(missing)
+        storage_seconds.observe(time.perf_counter() - started, 'read_many', storage.name)
+        # Replaying and encoding many documents is CPU work, kept off the gevent hub
+        return run_blocking(lambda: {key: build_dated_document(*key, stored.get(key)) for key in missing})
+    
+    return date_cache.get_many(keys, load)
+
+class StorageWriter:
+    """Background writer that persists snapshots to storage off the scraper thread.
+    
+    Pending snapshots are coalesced per collection, so if storage falls behind
+    only the newest snapshot of each collection is written. Usually only the
+    snapshot's delta is written, next to the dated 'latest' document. A full
+    checkpoint goes to the dated collection and the main collection at once.
+    This happens on the first write of a day, every `checkpoint_every` deltas,
+    and whenever the delta chain is broken (coalesced or dropped snapshots).
+    Failed commits are retried with exponential backoff.
+    """
+    
+    def __init__(self, max_pending=16, max_backoff=300, checkpoint_every=12):
+        self.max_pending = max_pending
+        self.max_backoff = max_backoff
+        self.checkpoint_every = checkpoint_every
+        self._pending = OrderedDict()
+        self._committed = {}  # collection -> {'date', 'version', 'deltas'}
+        self._condition = threading.Condition()
+        self._thread = None
+        self._running = False
+        self.stats = {
+            'enqueued': 0,
+            'coalesced': 0,
+            'dropped': 0,
+            'commits': 0,
+            'checkpoints': 0,
+            'failures': 0,
+            'last_commit_ms': None,
+            'total_commit_ms': 0.0,
+            'last_error': None
+        }
+    
+    def start(self):
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name='storage-writer')
+        self._thread.daemon = True
+        self._thread.start()
+    
+    def stop(self, timeout=5):
+        """Stop the writer, giving it a moment to flush what is queued"""
+        deadline = time.time() + timeout
+        with self._condition:
+            while self._pending and time.time() < deadline:
+                self._condition.wait(0.1)
+            self._running = False
+            self._condition.notify_all()
+    
+    def enqueue(self, collection_name, data, timestamp, version=None, delta=None):
+        """Queue a snapshot, replacing any unwritten snapshot for the same collection"""
+        with self._condition:
+            self.stats['enqueued'] += 1
+            if collection_name in self._pending:
+                self.stats['coalesced'] += 1
+                del self._pending[collection_name]
+                # The skipped delta is lost, so write a checkpoint instead
+                delta = None
+            elif len(self._pending) >= self.max_pending:
+                dropped, _ = self._pending.popitem(last=False)
+                self.stats['dropped'] += 1
+                logger.warning(f"Storage write queue full, dropping pending snapshot for {dropped}")
+            self._pending[collection_name] = (data, timestamp, version, delta)
+            self._condition.notify()
+    
+    def _run(self):
+        attempt = 0
+        retry_at = 0
+        while True:
+            with self._condition:
+                while self._running and not self._pending:
+                    self._condition.wait()
+                # Sit out the backoff even when new snapshots arrive, they only replace the pending ones
+                while self._running and time.monotonic() < retry_at:
+                    self._condition.wait(retry_at - time.monotonic())
+                if not self._running:
+                    return
+                collection_name, pending = self._pending.popitem(last=False)
+            
+            try:
+                self._commit(collection_name, *pending)
+                attempt = 0
+                retry_at = 0
+                with self._condition:
+                    self._condition.notify_all()
+            except Exception as e:
+                attempt += 1
+                delay = min(self.max_backoff, 2 ** attempt)
+                logger.error(f"Error saving {collection_name} to {storage.name}, retrying in {delay}s: {str(e)}")
+                with self._condition:
+                    self.stats['failures'] += 1
+                    self.stats['last_error'] = str(e)
+                    # A newer snapshot queued in the meantime supersedes the failed one
+                    if collection_name not in self._pending:
+                        self._pending[collection_name] = pending
+                        self._pending.move_to_end(collection_name, last=False)
+                    retry_at = time.monotonic() + delay
+    
+    def _commit(self, collection_name, data, timestamp, version=None, delta=None):
+        """Write a snapshot's delta, or a checkpoint to its dated collection and the main collection"""
+        date_str = timestamp_date(timestamp)
+        committed = self._committed.get(collection_name)
+        checkpoint = (
+            delta is None
+            or committed is None
+            or committed['date'] != date_str
+            or committed['version'] != delta['base_version']
+            or committed['deltas'] >= self.checkpoint_every
+        )
+        
+        started = time.perf_counter()
+        new_date = False
+        if checkpoint:
+            document = {
+                'data': data,
+                'last_updated': timestamp
+            }
+            if version is not None:
+                document['version'] = version
+                document['date'] = date_str
+            new_date = date_str not in date_index
+            storage.write_checkpoint(collection_name, date_str, document, new_date)
+        else:
+            storage.write_delta(collection_name, date_str, delta)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        record_phase('storage_write', collection_name, elapsed_ms / 1000)
+        storage_seconds.observe(elapsed_ms / 1000, 'checkpoint' if checkpoint else 'delta', storage.name)
+        if new_date:
+            date_index.add(date_str)
+        if version is not None:
+            self._committed[collection_name] = {
+                'date': date_str,
+                'version': version,
+                'deltas': 0 if checkpoint else committed['deltas'] + 1
+            }
+        
+        with self._condition:
+            self.stats['commits'] += 1
+            if checkpoint:
+                self.stats['checkpoints'] += 1
+            self.stats['last_commit_ms'] = round(elapsed_ms, 1)
+            self.stats['total_commit_ms'] += elapsed_ms
+        date_cache.invalidate(collection_name, date_str)
+        logger.info(f"Data saved to {storage.name} {collection_name}_{date_str} at {timestamp}")
+    
+    def get_stats(self):
+        with self._condition:
+            stats = dict(self.stats)
+            stats['queue_depth'] = len(self._pending)
+        commits = stats.pop('total_commit_ms')
+        stats['mean_commit_ms'] = round(commits / stats['commits'], 1) if stats['commits'] else None
+        return stats
+
+storage_writer = StorageWriter(checkpoint_every=int(os.environ.get('STORAGE_CHECKPOINT_EVERY', 12)))
+
+def save_to_storage(collection_name, data, timestamp, version=None, delta=None):
+    """Queue data for saving to storage if available"""
+    if storage is not None:
+        storage_writer.enqueue(collection_name, data, timestamp, version, delta)
+
+class HistoryStore:
+    """Append-only local history of every published snapshot, kept in SQLite.
+    
+    New readings go into a per-source samples table keyed by (station, time).
+    Once a day is over its readings are compacted into one segment per station
+    holding packed time and value arrays, so range scans over long windows read
+    a handful of blobs instead of thousands of rows. Old days are dropped by
+    retention age and by a cap on the database size.
+    
+    Every compaction stamps the days it rewrote with a new revision. Bucket
+    aggregates of whole compacted days are cached per process under that
+    revision, so a worker that didn't write the history still notices when a
+    day it cached was compacted again.
+    """
+    
+    def __init__(self, path, retention_days=180, max_bytes=1024 * 1024 * 1024, cache_bytes=32 * 1024 * 1024):
+        self.path = path
+        self.retention_days = retention_days
+        self.max_bytes = max_bytes
+        self.cache_bytes = cache_bytes
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._station_ids = {}
+        self._sample_columns = {}
+        self._segment_layouts = {}
+        self._day_buckets = OrderedDict()  # (source, column, day, bucket) -> (revision, {station: aggregates}, bytes)
+        self._day_buckets_bytes = 0
+        self._day_buckets_lock = threading.Lock()
+        self.cache_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+        self.last_compacted_day = None
+        
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        self._conn = self._connect()
+        with self._lock:
+            # auto_vacuum only takes effect if set before the first table is created
+            self._conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS stations (
+                    id INTEGER PRIMARY KEY,
+                    source TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    UNIQUE (source, name)
+                );
+                CREATE TABLE IF NOT EXISTS segments (
+                    source TEXT NOT NULL,
+                    station_id INTEGER NOT NULL,
+                    day TEXT NOT NULL,
+                    columns TEXT NOT NULL,
+                    count INTEGER NOT NULL,
+                    ts BLOB NOT NULL,
+                    vals BLOB NOT NULL,
+                    PRIMARY KEY (source, station_id, day)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS segments_day ON segments (day);
+                CREATE TABLE IF NOT EXISTS segment_days (
+                    source TEXT NOT NULL,
+                    day TEXT NOT NULL,
+                    revision INTEGER NOT NULL,
+                    PRIMARY KEY (source, day)
+                ) WITHOUT ROWID;
+                INSERT OR IGNORE INTO segment_days (source, day, revision) SELECT DISTINCT source, day, 0 FROM segments;
+            """)
+            for station_id, source, name in self._conn.execute('SELECT id, source, name FROM stations'):
+                self._station_ids[(source, name)] = station_id
+            for (table,) in self._conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'samples_%'").fetchall():
+                columns = [row[1] for row in self._conn.execute(f'PRAGMA table_info("{table}")')]
+                self._sample_columns[table[len('samples_'):]] = columns[2:]
+    
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+    
+    def _reader(self):
+        """Return this thread's read connection so queries don't wait on writes"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+        return conn
+    
+    @staticmethod
+    def _samples_table(source):
+        return f'"samples_{source}"'
+    
+    def _ensure_samples_table(self, source, columns):
+        """Create or widen the samples table for a source"""
+        known = self._sample_columns.get(source)
+        if known is not None and all(column in known for column in columns):
+            return
+        table = self._samples_table(source)
+        self._conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                station_id INTEGER NOT NULL,
+                ts INTEGER NOT NULL,
+                PRIMARY KEY (station_id, ts)
+            ) WITHOUT ROWID
+        """)
+        existing = [row[1] for row in self._conn.execute(f'PRAGMA table_info({table})')]
+        for column in columns:
+            if column not in existing:
+                self._conn.execute(f'ALTER TABLE {table} ADD COLUMN "{column}" REAL')
+                existing.append(column)
+        self._conn.execute(f'CREATE INDEX IF NOT EXISTS "samples_{source}_ts" ON {table} (ts)')
+        self._sample_columns[source] = [column for column in existing if column not in ('station_id', 'ts')]
+    
+    def _station_id(self, source, name):
+        station_id = self._station_ids.get((source, name))
+        if station_id is None:
+            self._conn.execute('INSERT OR IGNORE INTO stations (source, name) VALUES (?, ?)', (source, name))
+            station_id = self._conn.execute(
+                'SELECT id FROM stations WHERE source = ? AND name = ?', (source, name)
+            ).fetchone()[0]
+            self._station_ids[(source, name)] = station_id
+        return station_id
+    
+    def append(self, snapshot):
+        """Append every station reading of a published snapshot"""
+        columns = list(snapshot.values)
+        ts = snapshot_epoch(snapshot)
+        with self._lock:
+            self._ensure_samples_table(snapshot.source, columns)
+            rows = []
+            for i, station in enumerate(snapshot.stations):
+                values = [snapshot.values[column][i] for column in columns]
+                rows.append([self._station_id(snapshot.source, station), ts] +
+                            [None if np.isnan(value) else float(value) for value in values])
+            
+            column_list = ', '.join(f'"{column}"' for column in columns)
+            placeholders = ', '.join('?' * (len(columns) + 2))
+            self._conn.execute('BEGIN')
+            try:
+                self._conn.executemany(
+                    f'INSERT OR REPLACE INTO {self._samples_table(snapshot.source)} '
+                    f'(station_id, ts, {column_list}) VALUES ({placeholders})',
+                    rows
+                )
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+        
+        today = datetime.now(PAGASA_TZ).strftime('%Y-%m-%d')
+        if self.last_compacted_day != today:
+            self.compact()
+    
+    def compact(self):
+        """Pack finished days into segments and enforce retention and the size cap"""
+        today = datetime.now(PAGASA_TZ)
+        day_start = int(today.replace(hour=0, minute=0, second=0, microsecond=0).timestamp())
+        
+        with self._lock:
+            self._conn.execute('BEGIN')
+            try:
+                revision = self._conn.execute('SELECT COALESCE(MAX(revision), 0) + 1 FROM segment_days').fetchone()[0]
+                for source, columns in self._sample_columns.items():
+                    self._compact_source(source, columns, day_start, revision)
+                
+                cutoff = (today - timedelta(days=self.retention_days)).strftime('%Y-%m-%d')
+                self._conn.execute('DELETE FROM segments WHERE day < ?', (cutoff,))
+                self._conn.execute('DELETE FROM segment_days WHERE day < ?', (cutoff,))
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+            
+            # Drop whole days, oldest first, until the database fits the cap
+            while self.size_bytes() > self.max_bytes:
+                oldest = self._conn.execute('SELECT MIN(day) FROM segments').fetchone()[0]
+                if oldest is None:
+                    break
+                logger.warning(f"History store over {self.max_bytes} bytes, dropping {oldest}")
+                self._conn.execute('DELETE FROM segments WHERE day = ?', (oldest,))
+                self._conn.execute('DELETE FROM segment_days WHERE day = ?', (oldest,))
+                self._conn.execute('PRAGMA incremental_vacuum')
+                self._conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            
+            self._conn.execute('PRAGMA incremental_vacuum')
+            self._conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            self.last_compacted_day = today.strftime('%Y-%m-%d')
+        logger.info(f"History store compacted, {self.size_bytes()} bytes on disk")
+    
+    def _compact_source(self, source, columns, before_ts, revision):
+        table = self._samples_table(source)
+        column_list = ', '.join(f'"{column}"' for column in columns)
+        rows = self._conn.execute(
+            f'SELECT station_id, ts, {column_list} FROM {table} WHERE ts < ? ORDER BY station_id, ts',
+            (before_ts,)
+        ).fetchall()
+        if not rows:
+            return
+        
+        matrix = np.array(rows, dtype=np.float64)
+        station_ids = matrix[:, 0].astype(np.int64)
+        timestamps = matrix[:, 1].astype(np.int64)
+        days = np.array([datetime.fromtimestamp(ts, PAGASA_TZ).strftime('%Y-%m-%d') for ts in timestamps])
+        
+        for station_id in np.unique(station_ids):
+            for day in np.unique(days[station_ids == station_id]):
+                mask = (station_ids == station_id) & (days == day)
+                segment_ts = timestamps[mask]
+                segment_vals = matrix[mask, 2:]
+                
+                # Merge with a segment already written for that day, if any
+                existing = self._conn.execute(
+                    'SELECT columns, ts, vals FROM segments WHERE source = ? AND station_id = ? AND day = ?',
+                    (source, int(station_id), str(day))
+                ).fetchone()
+                if existing:
+                    # New samples go first so they win on a repeated timestamp, as INSERT OR REPLACE does
+                    old_ts, old_vals = self._unpack_segment(existing, columns)
+                    segment_ts = np.concatenate([segment_ts, old_ts])
+                    segment_vals = np.vstack([segment_vals, old_vals])
+                    segment_ts, unique_index = np.unique(segment_ts, return_index=True)
+                    segment_vals = segment_vals[unique_index]
+                
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO segments (source, station_id, day, columns, count, ts, vals) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (source, int(station_id), str(day), json.dumps(columns), len(segment_ts),
+                     segment_ts.astype('<i8').tobytes(), np.ascontiguousarray(segment_vals, dtype='<f8').tobytes())
+                )
+        
+        self._conn.executemany(
+            'INSERT OR REPLACE INTO segment_days (source, day, revision) VALUES (?, ?, ?)',
+            [(source, str(day), revision) for day in np.unique(days)]
+        )
+        self._conn.execute(f'DELETE FROM {table} WHERE ts < ?', (before_ts,))
+    
+    @staticmethod
+    def _unpack_segment(row, columns):
+        """Decode a segment row into (ts, values) with values laid out as `columns`"""
+        segment_columns = json.loads(row[0])
+        ts = np.frombuffer(row[1], dtype='<i8')
+        vals = np.frombuffer(row[2], dtype='<f8').reshape(len(ts), len(segment_columns))
+        out = np.full((len(ts), len(columns)), np.nan)
+        for i, column in enumerate(columns):
+            if column in segment_columns:
+                out[:, i] = vals[:, segment_columns.index(column)]
+        return ts, out
+    
+    def query(self, source, columns, stations=None, start=None, end=None):
+        """Return {station: (ts array, values matrix)} for readings in [start, end]"""
+        start = 0 if start is None else int(start)
+        end = 253402300799 if end is None else int(end)  # 9999-12-31 23:59:59 UTC
+        conn = self._reader()
+        
+        names = {
+            station_id: name
+            for station_id, name in conn.execute('SELECT id, name FROM stations WHERE source = ?', (source,))
+        }
+        if stations is not None:
+            wanted = set(stations)
+            names = {station_id: name for station_id, name in names.items() if name in wanted}
+        if not names:
+            return {}
+        
+        parts = {station_id: [] for station_id in names}
+        station_filter = ''
+        if stations is not None:
+            station_filter = f" AND station_id IN ({', '.join(str(station_id) for station_id in names)})"
+        first_day = datetime.fromtimestamp(start, PAGASA_TZ).strftime('%Y-%m-%d')
+        last_day = datetime.fromtimestamp(min(end, 253402300799 - 86400), PAGASA_TZ).strftime('%Y-%m-%d')
+        for station_id, columns_json, ts_blob, vals_blob in conn.execute(
+            f'SELECT station_id, columns, ts, vals FROM segments '
+            f'WHERE source = ? AND day BETWEEN ? AND ?{station_filter} ORDER BY day',
+            (source, first_day, last_day)
+        ):
+            if station_id in parts:
+                parts[station_id].append(self._unpack_segment((columns_json, ts_blob, vals_blob), columns))
+        
+        sample_columns = self._sample_columns.get(source)
+        if sample_columns is None:
+            table_exists = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (f'samples_{source}',)
+            ).fetchone()
+            if table_exists:
+                sample_columns = [row[1] for row in conn.execute(f'PRAGMA table_info({self._samples_table(source)})')][2:]
+        if sample_columns:
+            selected = ', '.join(f'"{column}"' if column in sample_columns else 'NULL' for column in columns)
+            rows = conn.execute(
+                f'SELECT station_id, ts, {selected} FROM {self._samples_table(source)} '
+                f'WHERE ts BETWEEN ? AND ?{station_filter} ORDER BY station_id, ts',
+                (start, end)
+            ).fetchall()
+            if rows:
+                matrix = np.array(rows, dtype=np.float64).reshape(len(rows), len(columns) + 2)
+                station_ids = matrix[:, 0].astype(np.int64)
+                for station_id in np.unique(station_ids):
+                    if int(station_id) in parts:
+                        mask = station_ids == station_id
+                        parts[int(station_id)].append((matrix[mask, 1].astype(np.int64), matrix[mask, 2:]))
+        
+        result = {}
+        for station_id, chunks in parts.items():
+            if not chunks:
+                continue
+            ts = np.concatenate([chunk[0] for chunk in chunks])
+            vals = np.vstack([chunk[1] for chunk in chunks])
+            mask = (ts >= start) & (ts <= end)
+            result[names[station_id]] = (ts[mask], vals[mask])
+        return result
+    
+    def _segment_column(self, columns_json, vals_blob, count, column):
+        """Decode one column of a segment's values, or None if the segment doesn't have it"""
+        layout = self._segment_layouts.get(columns_json)
+        if layout is None:
+            layout = self._segment_layouts[columns_json] = json.loads(columns_json)
+        if column not in layout:
+            return None
+        return np.frombuffer(vals_blob, dtype='<f8').reshape(count, len(layout))[:, layout.index(column)]
+    
+    def _load_day_buckets(self, conn, source, column, bucket, days):
+        """Aggregate whole compacted days from their segments, returning {day: {station: aggregates}}"""
+        names = dict(conn.execute('SELECT id, name FROM stations WHERE source = ?', (source,)).fetchall())
+        series = {}
+        for station_id, day, columns_json, count, ts_blob, vals_blob in conn.execute(
+            f"SELECT station_id, day, columns, count, ts, vals FROM segments "
+            f"WHERE source = ? AND day IN ({', '.join('?' * len(days))}) ORDER BY station_id, day",
+            [source] + list(days)
+        ):
+            values = self._segment_column(columns_json, vals_blob, count, column)
+            if values is not None and station_id in names:
+                series.setdefault(names[station_id], []).append((day, np.frombuffer(ts_blob, dtype='<i8'), values))
+        
+        # One pass per station over all the days, then cut into days on the (day aligned) bucket grid
+        per_day = 86400 // bucket
+        offsets = {day: (day_epoch(day) + BUCKET_OFFSET) // bucket for day in days}
+        first_bucket = offsets[days[0]]
+        span = offsets[days[-1]] + per_day - first_bucket
+        loaded = {day: {} for day in days}
+        for station, chunks in series.items():
+            grid = downsample(np.concatenate([ts for _, ts, _ in chunks]), np.concatenate([values for _, _, values in chunks]),
+                              bucket, first_bucket, span)
+            for day, _, _ in chunks:
+                offset = offsets[day] - first_bucket
+                loaded[day][station] = tuple(array[offset:offset + per_day].copy() for array in grid)
+        return loaded
+    
+    def _cached_day_buckets(self, conn, source, column, bucket, revisions):
+        """Return {day: {station: aggregates}} for whole compacted days, loading the ones not cached at their revision"""
+        found = {}
+        missing = []
+        with self._day_buckets_lock:
+            for day, revision in revisions.items():
+                entry = self._day_buckets.get((source, column, day, bucket))
+                if entry is not None and entry[0] == revision:
+                    self._day_buckets.move_to_end((source, column, day, bucket))
+                    found[day] = entry[1]
+                    self.cache_stats['hits'] += 1
+                else:
+                    missing.append(day)
+                    self.cache_stats['misses'] += 1
+        if not missing:
+            return found
+        
+        loaded = self._load_day_buckets(conn, source, column, bucket, sorted(missing))
+        with self._day_buckets_lock:
+            for day, stations in loaded.items():
+                size = sum(array.nbytes for aggregates in stations.values() for array in aggregates)
+                previous = self._day_buckets.pop((source, column, day, bucket), None)
+                if previous is not None:
+                    self._day_buckets_bytes -= previous[2]
+                self._day_buckets[(source, column, day, bucket)] = (revisions[day], stations, size)
+                self._day_buckets_bytes += size
+            while self._day_buckets_bytes > self.cache_bytes and self._day_buckets:
+                self._day_buckets_bytes -= self._day_buckets.popitem(last=False)[1][2]
+                self.cache_stats['evictions'] += 1
+        found.update(loaded)
+        return found
+    
+    def aggregate(self, source, column, bucket, start, end, stations=None):
+        """Downsample one column over [start, end] to {station: (min, max, mean, last, count)} on the bucket grid.
+        
+        When buckets divide a day, whole days in the window that are only in
+        segments come from the cache; the partial days at either end and days
+        with readings not yet compacted are read and aggregated per request.
+        """
+        first_bucket = (start + BUCKET_OFFSET) // bucket
+        bucket_count = (end + BUCKET_OFFSET) // bucket - first_bucket + 1
+        wanted = set(stations) if stations is not None else None
+        result = {}
+        
+        def place(station, offset, aggregates):
+            if wanted is not None and station not in wanted:
+                return
+            grid = result.get(station)
+            if grid is None:
+                grid = result[station] = tuple(np.full(bucket_count, np.nan) for _ in range(4)) + (np.zeros(bucket_count, dtype=np.int64),)
+            for target, values in zip(grid, aggregates):
+                target[offset:offset + len(values)] = values
+        
+        def aggregate_range(range_start, range_end):
+            range_first = (range_start + BUCKET_OFFSET) // bucket
+            range_count = (range_end + BUCKET_OFFSET) // bucket - range_first + 1
+            for station, (ts, values) in self.query(source, [column], stations, range_start, range_end).items():
+                if len(ts):
+                    place(station, range_first - first_bucket,
+                          downsample(ts, values[:, 0], bucket, range_first, range_count))
+        
+        conn = self._reader()
+        # One read transaction, so segments and their revisions come from the same compaction
+        conn.execute('BEGIN')
+        try:
+            sealed = []
+            if 86400 % bucket == 0:
+                # Days from the first reading still waiting for compaction onwards can change
+                pending = None
+                if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (f'samples_{source}',)).fetchone():
+                    pending = conn.execute(f'SELECT MIN(ts) FROM {self._samples_table(source)}').fetchone()[0]
+                day = datetime.fromtimestamp(start, PAGASA_TZ).replace(hour=0, minute=0, second=0, microsecond=0)
+                if int(day.timestamp()) < start:
+                    day += timedelta(days=1)
+                while int(day.timestamp()) + 86399 <= end and (pending is None or int(day.timestamp()) + 86399 < pending):
+                    sealed.append(day.strftime('%Y-%m-%d'))
+                    day += timedelta(days=1)
+            
+            if sealed:
+                revisions = dict(conn.execute(
+                    'SELECT day, revision FROM segment_days WHERE source = ? AND day BETWEEN ? AND ?',
+                    (source, sealed[0], sealed[-1])
+                ).fetchall())
+                days = self._cached_day_buckets(conn, source, column, bucket, revisions)
+                for day, day_stations in days.items():
+                    offset = (day_epoch(day) + BUCKET_OFFSET) // bucket - first_bucket
+                    for station, aggregates in day_stations.items():
+                        place(station, offset, aggregates)
+                
+                if start < day_epoch(sealed[0]):
+                    aggregate_range(start, day_epoch(sealed[0]) - 1)
+                if end >= day_epoch(sealed[-1]) + 86400:
+                    aggregate_range(day_epoch(sealed[-1]) + 86400, end)
+            else:
+                aggregate_range(start, end)
+        finally:
+            conn.execute('COMMIT')
+        return result
+    
+    def publication_times(self, source, limit=48):
+        """Return the most recent distinct reading times stored for a source"""
+        conn = self._reader()
+        times = []
+        table_exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (f'samples_{source}',)
+        ).fetchone()
+        if table_exists:
+            times = [ts for (ts,) in conn.execute(
+                f'SELECT DISTINCT ts FROM {self._samples_table(source)} ORDER BY ts DESC LIMIT ?', (limit,)
+            )]
+        if len(times) < limit:
+            # Readings from earlier days are packed into segments
+            row = conn.execute(
+                'SELECT ts FROM segments WHERE source = ? ORDER BY day DESC LIMIT 1', (source,)
+            ).fetchone()
+            if row:
+                times.extend(np.frombuffer(row[0], dtype='<i8').tolist())
+        return sorted(set(times))[-limit:]
+    
+    def size_bytes(self):
+        """Return the size of the database and its WAL on disk"""
+        total = 0
+        for suffix in ('', '-wal'):
+            try:
+                total += os.path.getsize(self.path + suffix)
+            except OSError:
+                pass
+        return total
+    
+    def get_stats(self):
+        conn = self._reader()
+        return {
+            'path': self.path,
+            'size_bytes': self.size_bytes(),
+            'segments': conn.execute('SELECT COUNT(*) FROM segments').fetchone()[0],
+            'stations': len(self._station_ids),
+            'last_compacted_day': self.last_compacted_day,
+            'bucket_cache': dict(self.cache_stats, days=len(self._day_buckets), bytes=self._day_buckets_bytes)
+        }
+
+history_store = None
+if os.environ.get('HISTORY_DB_PATH', 'data/history.sqlite3'):
+    try:
+        history_store = HistoryStore(
+            os.environ.get('HISTORY_DB_PATH', 'data/history.sqlite3'),
+            retention_days=int(os.environ.get('HISTORY_RETENTION_DAYS', 180)),
+            max_bytes=int(os.environ.get('HISTORY_MAX_MB', 1024)) * 1024 * 1024,
+            cache_bytes=int(os.environ.get('HISTORY_CACHE_MB', 32)) * 1024 * 1024
+        )
+        logger.info(f"History store opened at {history_store.path}")
+    except Exception as e:
+        logger.error(f"Warning: History store initialization failed: {str(e)}")
+        history_store = None
+
+def initialize_webdriver():
+    """Initialize and return a configured webdriver instance"""
+    try:
+        logger.info("Initializing webdriver...")
+        options = get_chrome_options()
+        
+        # Log Chrome binary path in production
+        if os.environ.get('RENDER'):
+            logger.info("Running in production environment (Render)")
+            chrome_path = os.environ.get('CHROME_BIN', '/usr/bin/google-chrome-stable')
+            logger.info(f"Chrome binary path: {chrome_path}")
+            
+            # Verify Chrome binary exists
+            if not os.path.exists(chrome_path):
+                logger.error(f"Chrome binary not found at {chrome_path}")
+                # Try to find Chrome in common locations
+                common_paths = [
+                    '/usr/bin/google-chrome-stable',
+                    '/usr/bin/google-chrome',
+                    '/usr/bin/chrome',
+                    '/usr/bin/chromium',
+                    '/usr/bin/chromium-browser'
+                ]
+                for path in common_paths:
+                    if os.path.exists(path):
+                        logger.info(f"Found Chrome at {path}")
+                        chrome_path = path
+                        break
+                else:
+                    logger.error("Chrome not found in common locations")
+                    return None
+            
+            options.binary_location = chrome_path
+            
+            # Add display configuration for headless mode
+            os.environ['DISPLAY'] = ':99'
+            
+            # Add additional options for Render environment
+            options.add_argument('--disable-dev-shm-usage')
+            options.add_argument('--no-sandbox')
+            options.add_argument('--disable-gpu')
+            options.add_argument('--disable-software-rasterizer')
+            options.add_argument('--disable-extensions')
+            options.add_argument('--single-process')
+            options.add_argument('--no-zygote')
+            options.add_argument('--disable-dev-shm-usage')
+        
+        # Try to use Chrome from PATH first
+        try:
+            logger.info("Attempting to use Chrome from PATH...")
+            service = Service()
+            driver = webdriver.Chrome(service=service, options=options)
+            driver.set_page_load_timeout(30)
+            logger.info("Successfully initialized Chrome from PATH")
+            return driver
+        except Exception as e:
+            logger.warning(f"Failed to use Chrome from PATH: {str(e)}")
+        
+        # Fallback to ChromeDriverManager
+        try:
+            logger.info("Attempting to use ChromeDriverManager...")
+            service = Service(ChromeDriverManager().install())
+            driver = webdriver.Chrome(service=service, options=options)
+            driver.set_page_load_timeout(30)
+            logger.info("Successfully initialized Chrome with ChromeDriverManager")
+            return driver
+        except Exception as e:
+            logger.error(f"Failed to initialize Chrome with ChromeDriverManager: {str(e)}")
+            raise
+        
+    except Exception as e:
+        logger.error(f"Error initializing webdriver: {str(e)}")
+        return None
+
+def get_process_tree_rss(pid):
+    """Return the combined RSS in bytes of a process and all of its descendants (Linux only)"""
+    try:
+        children = {}
+        for entry in os.listdir('/proc'):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    # The command name may contain spaces, so split after its closing paren
+                    ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+                children.setdefault(ppid, []).append(int(entry))
+            except (OSError, ValueError, IndexError):
+                continue
+        
+        total = 0
+        pending = [pid]
+        while pending:
+            current = pending.pop()
+            try:
+                with open(f'/proc/{current}/statm') as f:
+                    total += int(f.read().split()[1]) * PAGE_SIZE
+            except (OSError, ValueError, IndexError):
+                continue
+            pending.extend(children.get(current, []))
+        return total
+    except OSError:
+        return None
+
+class DriverPool:
+    """Keeps warm Chrome sessions alive across scrape cycles"""
+    
+    def __init__(self, max_idle=2, max_page_loads=50, max_rss_mb=700):
+        self.max_idle = max_idle
+        self.max_page_loads = max_page_loads
+        self.max_rss_bytes = max_rss_mb * 1024 * 1024
+        self._idle = []
+        self._meta = {}
+        self._lock = threading.Lock()
+        self.stats = {
+            'hits': 0,
+            'cold_starts': 0,
+            'failed_starts': 0,
+            'recycles': 0,
+            'health_check_failures': 0
+        }
+    
+    def _is_healthy(self, driver):
+        """Check that the browser session still responds before lending it out"""
+        try:
+            driver.execute_script('return 1')
+            return len(driver.window_handles) > 0
+        except Exception:
+            return False
+    
+    def _driver_rss(self, driver):
+        """Return the RSS of the chromedriver process tree backing a session"""
+        try:
+            return get_process_tree_rss(driver.service.process.pid)
+        except Exception:
+            return None
+    
+    def _quit(self, driver):
+        self._meta.pop(id(driver), None)
+        try:
+            driver.quit()
+        except Exception as e:
+            logger.error(f"Error quitting webdriver: {str(e)}")
+    
+    def acquire(self):
+        """Return a healthy webdriver, reusing a warm session when one is idle"""
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                driver = self._idle.pop()
+            
+            if self._is_healthy(driver):
+                with self._lock:
+                    self.stats['hits'] += 1
+                return driver
+            
+            logger.warning("Pooled webdriver failed health check, discarding it")
+            with self._lock:
+                self.stats['health_check_failures'] += 1
+            self._quit(driver)
+        
+        with timed_phase('driver_start'):
+            driver = initialize_webdriver()
+        with self._lock:
+            if driver is None:
+                self.stats['failed_starts'] += 1
+                return None
+            self.stats['cold_starts'] += 1
+            self._meta[id(driver)] = {'page_loads': 0, 'started_at': time.time()}
+        return driver
+    
+    def release(self, driver, page_loads=0, discard=False):
+        """Return a webdriver to the pool, recycling it if it has been used up"""
+        if driver is None:
+            return
+        
+        meta = self._meta.setdefault(id(driver), {'page_loads': 0, 'started_at': time.time()})
+        meta['page_loads'] += page_loads
+        
+        reason = None
+        if discard:
+            reason = 'discarded by caller'
+        elif meta['page_loads'] >= self.max_page_loads:
+            reason = f"reached {meta['page_loads']} page loads"
+        else:
+            rss = self._driver_rss(driver)
+            if rss is not None and rss > self.max_rss_bytes:
+                reason = f"RSS {rss // (1024 * 1024)} MB over limit"
+        
+        if reason is None:
+            with self._lock:
+                if len(self._idle) < self.max_idle:
+                    self._idle.append(driver)
+                    return
+            reason = 'pool is full'
+        
+        logger.info(f"Recycling webdriver: {reason}")
+        with self._lock:
+            self.stats['recycles'] += 1
+        self._quit(driver)
+    
+    def shutdown(self):
+        """Quit every idle session"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for driver in idle:
+            self._quit(driver)
+    
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['idle'] = len(self._idle)
+            stats['in_use'] = len(self._meta) - len(self._idle)
+        return stats
+
+driver_pool = DriverPool(
+    max_idle=int(os.environ.get('DRIVER_POOL_SIZE', 2)),
+    max_page_loads=int(os.environ.get('DRIVER_MAX_PAGE_LOADS', 50)),
+    max_rss_mb=int(os.environ.get('DRIVER_MAX_RSS_MB', 700))
+)
+atexit.register(driver_pool.shutdown)
+
+PAGASA_BASE_URL = os.environ.get('PAGASA_BASE_URL', 'https://pasig-marikina-tullahanffws.pagasa.dost.gov.ph')
+
+# Every PAGASA table the scheduler fetches. New pages on the same site are
+# added here (or through EXTRA_SCRAPE_SOURCES) rather than with new threads.
+SCRAPE_SOURCES = [
+    {
+        'name': 'water_level',
+        'label': 'water level',
+        'url': f"{PAGASA_BASE_URL}/water/table.do",
+        'table_selector': 'table.table-type1',
+        'columns': ['station', 'current_wl', 'wl_30min', 'wl_1hr', 'alert_level', 'alarm_level', 'critical_level'],
+        'min_columns': 7,
+        'collection': 'water_levels'
+    },
+    {
+        'name': 'rainfall',
+        'label': 'rainfall',
+        'url': f"{PAGASA_BASE_URL}/rainfall/table.do",
+        'table_selector': 'table.table-type1',
+        'columns': ['station', 'current_rf', 'rf_30min', 'rf_1hr', 'rf_3hr', 'rf_6hr', 'rf_12hr', 'rf_24hr'],
+        'min_columns': 8,
+        'collection': 'rainfall_data'
+    }
+]
+
+# Additional sources as a JSON list of objects with the same keys
+if os.environ.get('EXTRA_SCRAPE_SOURCES'):
+    try:
+        for extra_source in json.loads(os.environ['EXTRA_SCRAPE_SOURCES']):
+            extra_source.setdefault('label', extra_source['name'].replace('_', ' '))
+            extra_source.setdefault('table_selector', 'table.table-type1')
+            extra_source.setdefault('min_columns', len(extra_source['columns']))
+            extra_source.setdefault('collection', extra_source['name'])
+            SCRAPE_SOURCES.append(extra_source)
+    except Exception as e:
+        logger.error(f"Ignoring invalid EXTRA_SCRAPE_SOURCES: {str(e)}")
+
+SOURCES_BY_NAME = {source['name']: source for source in SCRAPE_SOURCES}
+
+# Seconds between scrapes of a source
+SCRAPE_INTERVAL = int(os.environ.get('SCRAPE_INTERVAL', 300))
+# 'serial' navigates one tab from page to page, 'tabs' loads every page in
+# its own tab of the same browser concurrently
+SCRAPE_TAB_MODE = os.environ.get('SCRAPE_TAB_MODE', 'serial')
+
+# Latest published state per source
+source_states = {
+    source['name']: {'snapshot': None, 'payload': None, 'last_updated': None, 'hash': None, 'delta': None,
+                     'stream_snapshot': None, 'stale': False, 'consecutive_failures': 0, 'next_due': 0}
+    for source in SCRAPE_SOURCES
+}
+
+# Recent deltas per source for /<source>/changes?since=
+source_changes = {
+    source['name']: SnapshotChangeLog(int(os.environ.get('CHANGES_BUFFER_SIZE', 288)))
+    for source in SCRAPE_SOURCES
+}
+
+ALERT_LEVELS = ('normal', 'alert', 'alarm', 'critical')
+
+class FloodAlertEngine:
+    """Flood threshold state of every water level station.
+    
+    Each published snapshot is classified in one vectorized pass: every
+    station's current level is compared with its own alert, alarm and critical
+    levels, and its rate of rise is taken from the 1 hour (or 30 minute)
+    reading. The responses are encoded once per snapshot, so /alerts costs
+    the same however many clients ask. Only changes of level are kept, tagged
+    with the snapshot version, for clients syncing with ?since=. A station
+    without a current reading is reported without a level, but keeps its last
+    known level for detecting transitions.
+    """
+    
+    def __init__(self, source_name='water_level', max_transitions=1000):
+        self.source_name = source_name
+        self.version = None
+        self.over_payload = None  # Stations at alert level or above, most severe first
+        self.all_payload = None
+        self._stations = ()
+        self._levels = None  # Last known level per station, -1 if never known
+        self._transitions = deque(maxlen=max_transitions)
+        self._evicted_version = None
+        self._lock = threading.Lock()
+        self.stats = {'evaluations': 0, 'transitions': 0, 'last_evaluation_ms': None, 'counts': None}
+    
+    @staticmethod
+    def classify(snapshot):
+        """Return (level, rise in m/hr, next threshold, minutes to reach it) arrays for every station"""
+        values = snapshot.values
+        current = values['current_wl']
+        thresholds = np.vstack([values['alert_level'], values['alarm_level'], values['critical_level']])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            # NaN never compares as reached, and a missing lower threshold doesn't hide a higher one
+            reached = current >= thresholds
+            levels = np.where(reached[2], 3, np.where(reached[1], 2, np.where(reached[0], 1, 0))).astype(np.int8)
+            levels[np.isnan(current)] = -1
+            rate = current - values['wl_1hr']
+            rate = np.where(np.isnan(rate), (current - values['wl_30min']) * 2, rate)
+            next_threshold = np.fmin.reduce(np.where(thresholds > current, thresholds, np.nan), axis=0)
+            minutes = np.where(rate > 0, (next_threshold - current) / rate * 60, np.nan)
+        return levels, rate, next_threshold, minutes
+    
+    def evaluate(self, snapshot):
+        """Classify a new snapshot and return the level transitions it caused"""
+        started = time.perf_counter()
+        levels, rate, next_threshold, minutes = self.classify(snapshot)
+        stations = snapshot.stations
+        
+        # Line the previous levels up with this snapshot's stations
+        if self._levels is None:
+            previous = np.full(len(stations), -1, dtype=np.int8)
+        elif stations == self._stations:
+            previous = self._levels
+        else:
+            known = dict(zip(self._stations, self._levels.tolist()))
+            previous = np.fromiter((known.get(station, -1) for station in stations), dtype=np.int8, count=len(stations))
+        
+        # New stations only count when they appear above normal
+        changed = np.flatnonzero((levels >= 0) & (levels != previous) & ((previous >= 0) | (levels > 0)))
+        current = float_list(snapshot.values['current_wl'])
+        rates = float_list(rate)
+        transitions = [
+            {
+                'version': snapshot.version,
+                'last_updated': snapshot.search_time,
+                'station': stations[i],
+                'from': ALERT_LEVELS[previous[i]] if previous[i] >= 0 else None,
+                'to': ALERT_LEVELS[levels[i]],
+                'current_wl': current[i],
+                'rate_m_per_hr': rates[i]
+            }
+            for i in changed.tolist()
+        ]
+        
+        rows = [
+            {
+                'station': station,
+                'level': ALERT_LEVELS[level] if level >= 0 else None,
+                'current_wl': current_wl,
+                'rate_m_per_hr': rate_per_hour,
+                'next_threshold': threshold,
+                'minutes_to_next': minutes_left
+            }
+            for station, level, current_wl, rate_per_hour, threshold, minutes_left in zip(
+                stations, levels.tolist(), current, rates, float_list(next_threshold), float_list(np.round(minutes))
+            )
+        ]
+        over = np.flatnonzero(levels > 0)
+        # Most severe first, then fastest rising
+        over = over[np.lexsort((-np.nan_to_num(rate[over], nan=-np.inf), -levels[over]))]
+        counts = np.bincount(levels.astype(np.int64) + 1, minlength=len(ALERT_LEVELS) + 1).tolist()
+        base = {
+            'status': 'success',
+            'last_updated': snapshot.search_time,
+            'version': snapshot.version,
+            'counts': dict(zip(('unknown',) + ALERT_LEVELS, counts))
+        }
+        published_at = last_published_at or datetime.now(timezone.utc)
+        over_payload = EncodedPayload(dict(base, stations=[rows[i] for i in over.tolist()]),
+                                      payload_etag('alerts', snapshot.version, snapshot.digest), published_at)
+        all_payload = EncodedPayload(dict(base, stations=rows),
+                                     payload_etag('alerts-all', snapshot.version, snapshot.digest), published_at)
+        
+        with self._lock:
+            for transition in transitions:
+                if len(self._transitions) == self._transitions.maxlen:
+                    self._evicted_version = self._transitions[0]['version']
+                self._transitions.append(transition)
+            self._stations = stations
+            self._levels = np.where(levels >= 0, levels, previous).astype(np.int8)
+            self.over_payload = over_payload
+            self.all_payload = all_payload
+            self.version = snapshot.version
+            self.stats['evaluations'] += 1
+            self.stats['transitions'] += len(transitions)
+            self.stats['counts'] = base['counts']
+            self.stats['last_evaluation_ms'] = round((time.perf_counter() - started) * 1000, 2)
+        return transitions
+    
+    def transitions_since(self, version=None):
+        """Return the buffered transitions after a snapshot version, and whether older ones were dropped"""
+        with self._lock:
+            transitions = [t for t in self._transitions if version is None or t['version'] > version]
+            truncated = self._evicted_version is not None and (version is None or version < self._evicted_version)
+        return transitions, truncated
+    
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['buffered_transitions'] = len(self._transitions)
+        return stats
+
+flood_alerts = FloodAlertEngine(max_transitions=int(os.environ.get('ALERT_TRANSITIONS_SIZE', 1000)))
+
+# Adaptive scheduling: scrape shortly after PAGASA is expected to publish
+# instead of on a fixed timer
+ADAPTIVE_CADENCE = os.environ.get('ADAPTIVE_CADENCE', '1') != '0'
+# Shortest interval between polls while an expected update is overdue
+CADENCE_MIN_INTERVAL = int(os.environ.get('CADENCE_MIN_INTERVAL', 20))
+# Polls at the shortest interval before backing off
+CADENCE_TIGHT_POLLS = int(os.environ.get('CADENCE_TIGHT_POLLS', 6))
+# Extra seconds allowed after the expected publication before scraping
+CADENCE_GRACE = int(os.environ.get('CADENCE_GRACE', 5))
+# Every this many publications, try one poll interval earlier than the learned delay
+CADENCE_PROBE_EVERY = int(os.environ.get('CADENCE_PROBE_EVERY', 6))
+
+class PublicationCadence:
+    """Learns when a source publishes from the search times it has shown.
+    
+    The period is the median gap between consecutive search times, and the
+    availability delay is the shortest time seen between a search time and
+    the start of the scrape that first returned it. The next scrape is
+    planned just after the next expected publication. While that update is
+    overdue, it is polled CADENCE_TIGHT_POLLS times at CADENCE_MIN_INTERVAL
+    and then with exponential backoff, never past the following expected
+    publication. Delays are only learned from scrapes planned this way, as
+    fixed-interval scrapes can see a publication long after it appeared.
+    
+    A scrape only bounds the delay: the data was there when it started, and
+    was not yet there when the last unchanged scrape started. The grace added
+    to planned scrapes is left out of what they learn, or the estimate would
+    creep up by it every time the history rolls over. A miss drops the
+    estimates it disproves, and every CADENCE_PROBE_EVERY publications one
+    scrape is tried a poll interval early, so the estimate also comes down.
+    """
+    
+    def __init__(self, default_interval, history_size=48):
+        self.default_interval = default_interval
+        self.publications = deque(maxlen=history_size)  # Distinct search times, epoch seconds
+        self.delays = deque(maxlen=history_size)  # Seconds from search time to the scrape that saw it
+        self.lags = deque(maxlen=history_size)  # Seconds from search time to our publish
+        self.misses = 0
+        self.scrapes = 0
+        self.unchanged_scrapes = 0
+        self.published = 0  # Publications seen by this process
+        self.planned = None  # How the pending scrape was planned: 'expected', 'probe', 'poll' or None
+        self.last_miss = None  # Start of the last unchanged scrape since the last publication
+    
+    def seed(self, times):
+        """Load earlier search times, e.g. from the history store"""
+        for published_at in sorted(times):
+            if not self.publications or published_at > self.publications[-1]:
+                self.publications.append(published_at)
+    
+    def period(self):
+        """Return the estimated publication period in seconds, or None while unknown"""
+        if len(self.publications) < 3:
+            return None
+        gaps = np.diff(np.fromiter(self.publications, dtype=np.int64))
+        gaps = gaps[gaps > 0]
+        if not gaps.size:
+            return None
+        return max(int(np.median(gaps)), CADENCE_MIN_INTERVAL)
+    
+    def availability_delay(self):
+        return max(0, int(min(self.delays))) if self.delays else 0
+    
+    def observe(self, published_at, changed, started, now):
+        """Record a successful scrape and the search time it returned"""
+        self.scrapes += 1
+        planned, self.planned = self.planned, None
+        if not changed:
+            self.unchanged_scrapes += 1
+            self.misses += 1
+            self.last_miss = started
+            return
+        self.misses = 0
+        last_miss, self.last_miss = self.last_miss, None
+        if published_at is None:
+            return
+        if self.publications and published_at <= self.publications[-1]:
+            return
+        # The first scrape of a process may see a publication long after it
+        # appeared, so it is not counted towards the lag
+        if self.scrapes > 1:
+            if planned is not None:
+                self._learn_delay(published_at, started, planned, last_miss)
+            self.lags.append(now - published_at)
+        self.publications.append(published_at)
+        self.published += 1
+    
+    def _learn_delay(self, published_at, started, planned, last_miss):
+        delay = started - published_at
+        if planned == 'expected' and last_miss is None:
+            # Found on the first try, so the grace we added was not needed
+            delay -= CADENCE_GRACE
+        if last_miss is not None and last_miss > published_at:
+            # The data was not there yet when the last miss started
+            floor = last_miss - published_at
+            kept = [d for d in self.delays if d > floor]
+            self.delays.clear()
+            self.delays.extend(kept)
+        self.delays.append(max(0, delay))
+    
+    def next_scrape(self, now):
+        """Return the epoch time of the next scrape"""
+        period = self.period()
+        if period is None:
+            self.planned = None
+            return now + self.default_interval
+        delay = self.availability_delay()
+        expected = self.publications[-1] + period + delay + CADENCE_GRACE
+        if (CADENCE_PROBE_EVERY and self.misses == 0 and delay >= CADENCE_MIN_INTERVAL
+                and self.published % CADENCE_PROBE_EVERY == 0):
+            probe = self.publications[-1] + period + delay - CADENCE_MIN_INTERVAL
+            if now < probe:
+                self.planned = 'probe'
+                return probe
+        if now < expected:
+            self.planned = 'expected'
+            return expected
+        
+        # Overdue: poll tightly at first, backing off while nothing changes
+        self.planned = 'poll'
+        missed_periods = int((now - expected) // period) + 1
+        next_expected = expected + missed_periods * period
+        backoff = CADENCE_MIN_INTERVAL * 2 ** max(self.misses - CADENCE_TIGHT_POLLS, 0)
+        return min(now + backoff, next_expected)
+    
+    def get_stats(self):
+        period = self.period()
+        return {
+            'period_seconds': period,
+            'offset_seconds': int(self.publications[-1] % period) if period else None,
+            'availability_delay_seconds': self.availability_delay(),
+            'last_publication': (
+                datetime.fromtimestamp(self.publications[-1], PAGASA_TZ).isoformat()
+                if self.publications else None
+            ),
+            'scrapes': self.scrapes,
+            'unchanged_scrapes': self.unchanged_scrapes,
+            'wasted_scrape_ratio': round(self.unchanged_scrapes / self.scrapes, 3) if self.scrapes else None,
+            'mean_lag_seconds': round(sum(self.lags) / len(self.lags), 1) if self.lags else None
+        }
+
+source_cadences = {source['name']: PublicationCadence(SCRAPE_INTERVAL) for source in SCRAPE_SOURCES}
+
+def seed_cadences():
+    """Learn publication times from the local history before the first scrape"""
+    if history_store is None:
+        return
+    for name, cadence in source_cadences.items():
+        try:
+            cadence.seed(run_blocking(history_store.publication_times, name))
+        except Exception as e:
+            logger.error(f"Error loading publication times for {name}: {str(e)}")
+
+# Fetch mode: 'auto' tries plain HTTP first and falls back to Selenium,
+# 'http' and 'selenium' force a single path
+FETCH_MODE = os.environ.get('FETCH_MODE', 'auto')
+# How often a source that needed Selenium is re-probed over plain HTTP
+HTTP_REPROBE_INTERVAL = int(os.environ.get('HTTP_REPROBE_INTERVAL', 3600))
+
+http_session = None
+http_session_lock = threading.Lock()
+
+def get_http_session():
+    """Return the shared keep-alive session for plain HTTP fetches, creating it on first use"""
+    global http_session
+    with http_session_lock:
+        if http_session is None:
+            session = requests.Session()
+            session.headers.update({
+                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+                'Connection': 'keep-alive'
+            })
+            session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=4, max_retries=1))
+            http_session = session
+        return http_session
+
+source_fetch_modes = {}  # Cached fetch mode per source
+fetch_modes_lock = threading.Lock()
+
+# Upper bound on how long to wait for the table to settle after it appears
+SETTLE_TIMEOUT = float(os.environ.get('SETTLE_TIMEOUT', 10))
+# How long the row count and search time must stay unchanged to count as settled
+SETTLE_STABLE_WINDOW = float(os.environ.get('SETTLE_STABLE_WINDOW', 2))
+SETTLE_POLL_INTERVAL = 0.25
+# The fixed sleep this replaced, used to report the time saved
+LEGACY_SETTLE_SLEEP = 10
+
+# Returns [row count, search time text, page idle] for the table matching
+# arguments[0]. The page counts as idle once the document has loaded and no
+# jQuery AJAX requests are in flight.
+READINESS_SCRIPT = """
+var table = document.querySelector(arguments[0]);
+var rows = table ? table.querySelectorAll('tbody tr').length : 0;
+var searchTime = document.querySelector('div.search-time');
+var ajaxIdle = !(window.jQuery && window.jQuery.active > 0);
+return [rows, searchTime ? searchTime.textContent.trim() : '', document.readyState === 'complete' && ajaxIdle];
+"""
+
+settle_waits = {}  # Recent settle wait durations per source
+settle_waits_lock = threading.Lock()
+
+class BeautifulSoupExtractor:
+    """Reference extractor that parses the whole page with html.parser"""
+    name = 'bs4'
+    
+    def extract(self, html, source):
+        """Parse a PAGASA table page into row dicts, returning (data, search_time)"""
+        soup = BeautifulSoup(html, 'html.parser')
+        
+        search_time_div = soup.find('div', {'class': 'search-time'})
+        search_time = search_time_div.get_text(strip=True) if search_time_div else datetime.now().strftime("%Y-%m-%d %H:%M")
+        
+        table = soup.select_one(source['table_selector'])
+        if not table or not table.find('tbody'):
+            return None, search_time
+        
+        columns = source['columns']
+        data = []
+        for row in table.find('tbody').find_all('tr'):
+            cols = row.find_all(['th', 'td'])
+            # Rows without <td> cells are headings, as in a table shell waiting for its data
+            if len(cols) >= source['min_columns'] and row.find('td'):
+                entry = {name: cols[i].get_text(strip=True) for i, name in enumerate(columns)}
+                entry['timestamp'] = search_time
+                data.append(entry)
+        
+        return data, search_time
+
+def cut_html_fragment(html, tag, class_name):
+    """Return the outer HTML of the first <tag> whose class list contains class_name"""
+    open_pattern = re.compile(rf'<{tag}\b[^>]*>', re.IGNORECASE)
+    class_pattern = re.compile(r'\bclass\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>]+))', re.IGNORECASE)
+    nested_pattern = re.compile(rf'<(/?){tag}\b[^>]*>', re.IGNORECASE)
+    
+    for match in open_pattern.finditer(html):
+        class_match = class_pattern.search(match.group(0))
+        if not class_match:
+            continue
+        classes = next(group for group in class_match.groups() if group is not None).split()
+        if class_name not in classes:
+            continue
+        
+        # Walk forward to the matching close tag, allowing for nested tags
+        depth = 0
+        for tag_match in nested_pattern.finditer(html, match.start()):
+            depth += -1 if tag_match.group(1) else 1
+            if depth == 0:
+                return html[match.start():tag_match.end()]
+        return html[match.start():]
+    return None
+
+class LxmlExtractor:
+    """Extractor that cuts the table and search time out of the page and parses only those with lxml"""
+    name = 'lxml'
+    
+    simple_selector = re.compile(r'^([a-zA-Z][a-zA-Z0-9]*)\.([\w-]+)$')
+    
+    def __init__(self):
+        self.tbody_xpath = etree.XPath('(.//tbody)[1]')
+        self.row_xpath = etree.XPath('.//tr')
+        self.cell_xpath = etree.XPath('.//th | .//td')
+        # get_text() in BeautifulSoup skips comments and script/style contents
+        self.text_xpath = etree.XPath('.//text()[not(ancestor::script) and not(ancestor::style) and not(ancestor::template)]')
+        self.fallback = BeautifulSoupExtractor()
+    
+    def text(self, element):
+        return ''.join(text.strip() for text in self.text_xpath(element))
+    
+    def parse_fragment(self, fragment):
+        """Parse an HTML fragment and return its root element"""
+        return lxml_html.fragment_fromstring(fragment, create_parent='div')[0]
+    
+    def extract(self, html, source):
+        """Parse a PAGASA table page into row dicts, returning (data, search_time)"""
+        selector = self.simple_selector.match(source['table_selector'])
+        if not selector:
+            # Only tag.class selectors can be cut out of the raw page
+            return self.fallback.extract(html, source)
+        
+        search_time = None
+        search_time_fragment = cut_html_fragment(html, 'div', 'search-time')
+        if search_time_fragment:
+            search_time = self.text(self.parse_fragment(search_time_fragment))
+        if search_time is None:
+            search_time = datetime.now().strftime("%Y-%m-%d %H:%M")
+        
+        table_fragment = cut_html_fragment(html, selector.group(1), selector.group(2))
+        if not table_fragment:
+            return None, search_time
+        
+        tbody = self.tbody_xpath(self.parse_fragment(table_fragment))
+        if not tbody:
+            return None, search_time
+        
+        columns = source['columns']
+        min_columns = source['min_columns']
+        data = []
+        for row in self.row_xpath(tbody[0]):
+            cols = self.cell_xpath(row)
+            if len(cols) >= min_columns and any(col.tag == 'td' for col in cols):
+                entry = {name: self.text(cols[i]) for i, name in enumerate(columns)}
+                entry['timestamp'] = search_time
+                data.append(entry)
+        
+        return data, search_time
+
+def get_table_extractor(name):
+    """Return the table extractor for a name, falling back to BeautifulSoup"""
+    if name == 'lxml':
+        if lxml_html is not None:
+            return LxmlExtractor()
+        logger.warning("lxml is not installed, falling back to the BeautifulSoup extractor")
+    return BeautifulSoupExtractor()
+
+table_extractor = get_table_extractor(os.environ.get('TABLE_EXTRACTOR', 'lxml'))
+
+def parse_pagasa_table(html, source):
+    """Parse a PAGASA table page into row dicts, returning (data, search_time)"""
+    return table_extractor.extract(html, source)
+
+def get_fetch_mode(source):
+    """Return the cached fetch mode for a source, re-probing HTTP periodically"""
+    if FETCH_MODE in ('http', 'selenium'):
+        return FETCH_MODE
+    
+    with fetch_modes_lock:
+        cached = source_fetch_modes.get(source)
+    if cached is None:
+        return 'http'
+    if cached['mode'] == 'selenium' and time.time() - cached['decided_at'] > HTTP_REPROBE_INTERVAL:
+        logger.info(f"Re-probing plain HTTP for {source}")
+        return 'http'
+    return cached['mode']
+
+def set_fetch_mode(source, mode, reason):
+    """Cache the fetch mode for a source and log when it changes"""
+    with fetch_modes_lock:
+        previous = source_fetch_modes.get(source)
+        source_fetch_modes[source] = {'mode': mode, 'decided_at': time.time(), 'reason': reason}
+    if previous is None or previous['mode'] != mode:
+        logger.info(f"Using {mode} fetch mode for {source}: {reason}")
+
+# Markup of pages whose table is filled in by scripts: a <noscript> notice
+# asking for JavaScript, or a loading placeholder shown until the data arrives
+NOSCRIPT_PATTERN = re.compile(r'<noscript\b[^>]*>(?:(?!</noscript>).)*javascript', re.IGNORECASE | re.DOTALL)
+LOADER_PATTERN = re.compile(r'''<[a-z][^>]*\b(?:class|id)\s*=\s*["']?[^"'>]*\b(?:loading|loader|spinner)\b''', re.IGNORECASE)
+
+def javascript_required(html, data):
+    """Return (failure, reason) if a server-rendered page looks like it needs JavaScript, or None"""
+    if data:
+        # Rows in the HTML win over site-wide banners and spinners elsewhere on the page
+        return None
+    if NOSCRIPT_PATTERN.search(html):
+        return 'http_needs_js', 'page asks for JavaScript in <noscript>'
+    if LOADER_PATTERN.search(html):
+        return 'http_needs_js', 'page shows a loading placeholder'
+    if data is None:
+        return 'http_no_table', 'table missing from server-rendered HTML'
+    return 'http_empty_table', 'table empty in server-rendered HTML'
+
+def fetch_table_via_http(source):
+    """Fetch a table page over plain HTTP and parse the server-rendered HTML.
+    
+    Returns (data, search_time, javascript_required), where the last item is
+    None when the rows can be trusted.
+    """
+    with timed_phase('http_get', source['name']):
+        response = get_http_session().get(source['url'], timeout=15)
+        response.raise_for_status()
+        html = response.text
+    with timed_phase('parse', source['name']):
+        data, search_time = parse_pagasa_table(html, source)
+    return data, search_time, javascript_required(html, data)
+
+def wait_for_table_ready(driver, table_selector='table.table-type1', timeout=SETTLE_TIMEOUT, stable_window=SETTLE_STABLE_WINDOW):
+    """Wait until the table's rows and search time stop changing, returning the seconds waited"""
+    start = time.monotonic()
+    last_state = None
+    stable_since = start
+    
+    while True:
+        rows, search_time, idle = driver.execute_script(READINESS_SCRIPT, table_selector)
+        now = time.monotonic()
+        state = (rows, search_time)
+        
+        if rows > 0 and state == last_state:
+            # Unchanged since the previous poll: settled once the page reports
+            # idle, or once the state has held for the whole stable window
+            if idle or now - stable_since >= stable_window:
+                break
+        else:
+            last_state = state
+            stable_since = now
+        
+        if now - start >= timeout:
+            logger.warning(f"Table did not settle within {timeout}s, continuing with current contents")
+            break
+        time.sleep(SETTLE_POLL_INTERVAL)
+    
+    return time.monotonic() - start
+
+def record_settle_wait(source, seconds):
+    """Keep the measured settle wait so the saving over the fixed sleep is visible"""
+    with settle_waits_lock:
+        settle_waits.setdefault(source, deque(maxlen=100)).append(seconds)
+    logger.info(f"Table for {source} settled after {seconds:.2f}s")
+
+def get_settle_wait_stats():
+    with settle_waits_lock:
+        waits = {source: list(values) for source, values in settle_waits.items()}
+    return {
+        source: {
+            'count': len(values),
+            'last': round(values[-1], 3),
+            'mean': round(sum(values) / len(values), 3),
+            'max': round(max(values), 3),
+            'saved_vs_fixed_sleep': round(sum(LEGACY_SETTLE_SLEEP - value for value in values), 3)
+        }
+        for source, values in waits.items() if values
+    }
+
+def read_loaded_table(driver, source):
+    """Wait for the current tab's table to settle and parse it"""
+    # Wait for table to load with increased timeout
+    with timed_phase('table_wait', source['name']):
+        WebDriverWait(driver, 30).until(
+            EC.presence_of_element_located((By.CSS_SELECTOR, source['table_selector']))
+        )
+    with timed_phase('settle', source['name']):
+        record_settle_wait(source['name'], wait_for_table_ready(driver, source['table_selector']))
+    
+    # Check if page is loaded
+    if urlparse(source['url']).path not in driver.current_url:
+        logger.error(f"Failed to load {source['label']} page")
+        note_scrape_failure(source['name'], 'wrong_page')
+        return None, None
+    
+    with timed_phase('page_source', source['name']):
+        html = driver.page_source
+    with timed_phase('parse', source['name']):
+        return parse_pagasa_table(html, source)
+
+def fetch_tables_via_selenium(sources):
+    """Fetch several table pages with a single pooled Chrome session"""
+    results = {}
+    driver = driver_pool.acquire()
+    if not driver:
+        logger.error("Failed to initialize webdriver for scraping")
+        for source in sources:
+            note_scrape_failure(source['name'], 'no_driver')
+        return results
+    
+    page_loads = 0
+    try:
+        if SCRAPE_TAB_MODE == 'tabs' and len(sources) > 1:
+            # Start every page loading in its own tab before reading any of them
+            driver.get('about:blank')
+            handles = []
+            for i, source in enumerate(sources):
+                if i > 0:
+                    driver.switch_to.new_window('tab')
+                handles.append(driver.current_window_handle)
+                driver.execute_script("window.location.href = arguments[0];", source['url'])
+                page_loads += 1
+            
+            for handle, source in zip(handles, sources):
+                try:
+                    driver.switch_to.window(handle)
+                    results[source['name']] = read_loaded_table(driver, source)
+                except Exception as e:
+                    logger.error(f"Error during {source['label']} scraping: {str(e)}")
+                    note_scrape_failure(source['name'], type(e).__name__)
+            
+            for handle in handles[1:]:
+                driver.switch_to.window(handle)
+                driver.close()
+            driver.switch_to.window(handles[0])
+        else:
+            for source in sources:
+                try:
+                    logger.info(f"Navigating to {source['label']} page...")
+                    page_loads += 1
+                    with timed_phase('page_load', source['name']):
+                        driver.get(source['url'])
+                    results[source['name']] = read_loaded_table(driver, source)
+                except Exception as e:
+                    logger.error(f"Error during {source['label']} scraping: {str(e)}")
+                    note_scrape_failure(source['name'], type(e).__name__)
+    finally:
+        driver_pool.release(driver, page_loads=page_loads)
+    
+    return results
+
+def fetch_sources(sources):
+    """Fetch every given source, preferring plain HTTP and sharing one browser for the rest"""
+    results = {}
+    selenium_sources = []
+    
+    for source in sources:
+        name = source['name']
+        if get_fetch_mode(name) == 'http':
+            try:
+                data, search_time, needs_javascript = fetch_table_via_http(source)
+                if needs_javascript is None:
+                    set_fetch_mode(name, 'http', 'table rows present in server-rendered HTML')
+                    results[name] = (data, search_time)
+                    continue
+                failure, reason = needs_javascript
+            except Exception as e:
+                reason = f"HTTP fetch failed: {str(e)}"
+                failure = type(e).__name__
+            
+            if FETCH_MODE == 'http':
+                logger.error(f"Plain HTTP fetch for {name} returned no data: {reason}")
+                note_scrape_failure(name, failure)
+                continue
+            set_fetch_mode(name, 'selenium', reason)
+        
+        selenium_sources.append(source)
+    
+    if selenium_sources:
+        results.update(fetch_tables_via_selenium(selenium_sources))
+    
+    return results
+
+def full_changes(snapshot):
+    """Return a changes response that carries the whole table"""
+    return {
+        'status': 'success',
+        'version': snapshot.version,
+        'full': True,
+        'last_updated': snapshot.search_time,
+        'data': snapshot.to_dicts()
+    }
+
+def announce_snapshot(source):
+    """Notify stream subscribers and caches of a source's new snapshot"""
+    state = source_states[source['name']]
+    # Sent to stream clients when they connect or fall too far behind
+    state['stream_snapshot'] = json.dumps(full_changes(state['snapshot']))
+    if state['delta'] is None:
+        # A snapshot without a delta (one restored from disk, shared by the leader)
+        # can't be reached with ?since=, so clients get the whole table instead
+        source_changes[source['name']].clear()
+        snapshot_events.publish(stream_event_name(source['name']), state['stream_snapshot'])
+    else:
+        source_changes[source['name']].append(state['delta'])
+        snapshot_events.publish(f"{stream_event_name(source['name'])}-changes", json.dumps(state['delta']))
+    date_cache.invalidate(source['collection'], timestamp_date(state['snapshot'].search_time))
+    evaluate_alerts(source)
+    update_analytics(source)
+
+def update_analytics(source):
+    """Add a source's current snapshot to its rolling analytics"""
+    analytics = source_analytics.get(source['name'])
+    if analytics is None:
+        return
+    try:
+        with timed_phase('analytics', source['name']):
+            analytics.update(source_states[source['name']]['snapshot'])
+    except Exception as e:
+        logger.error(f"Error updating {source['label']} analytics: {str(e)}")
+
+def evaluate_alerts(source):
+    """Update the flood alert state from a source's current snapshot"""
+    if source['name'] != flood_alerts.source_name:
+        return
+    try:
+        with timed_phase('alerts', source['name']):
+            transitions = flood_alerts.evaluate(source_states[source['name']]['snapshot'])
+        if transitions:
+            snapshot_events.publish('alert-transitions', json.dumps(transitions))
+    except Exception as e:
+        logger.error(f"Error evaluating flood alerts: {str(e)}")
+
+def publish_snapshot(source, data, search_time):
+    """Publish freshly scraped rows for a source, returning True if they changed"""
+    global last_updated, last_published_at
+    
+    state = source_states[source['name']]
+    with timed_phase('hash', source['name']):
+        snapshot = TableSnapshot.from_rows(source, data, search_time)
+    
+    # Only update if data has changed
+    if snapshot.digest != state['hash']:
+        previous = state['snapshot']
+        snapshot.version = next_version(previous)
+        with timed_phase('delta', source['name']):
+            state['delta'] = compute_delta(previous, snapshot)
+        state['snapshot'] = snapshot
+        state['last_updated'] = search_time
+        state['hash'] = snapshot.digest
+        state['stale'] = False
+        last_updated = search_time
+        last_published_at = datetime.now(timezone.utc)
+        refresh_latest_payloads()
+        share_latest_snapshots()
+        announce_snapshot(source)
+        
+        # Keep the snapshot on local disk for the next start
+        if SNAPSHOT_DIR:
+            try:
+                with timed_phase('snapshot_persist', source['name']):
+                    persist_snapshot(state)
+            except Exception as e:
+                logger.error(f"Error saving {source['label']} snapshot file: {str(e)}")
+        
+        # Keep the reading in the local history
+        if history_store is not None:
+            try:
+                with timed_phase('history_append', source['name']):
+                    # Appending can also compact the previous day, which takes a while
+                    run_blocking(history_store.append, state['snapshot'])
+            except Exception as e:
+                logger.error(f"Error appending {source['label']} data to history: {str(e)}")
+        
+        # Save to storage
+        save_to_storage(source['collection'], snapshot.to_dicts(), search_time, snapshot.version, state['delta'])
+        logger.info(f"{source['label'].capitalize()} data updated at {search_time}")
+        return True
+    
+    if state['stale']:
+        # The restored snapshot is still current
+        state['stale'] = False
+        refresh_latest_payloads()
+        share_latest_snapshots()
+    
+    logger.info(f"No changes in {source['label']} data")
+    return False
+
+def scrape_due_sources(sources):
+    """Run one scrape cycle over the given sources and schedule their next runs"""
+    max_failures = 5  # Maximum number of consecutive failures before longer delay
+    
+    logger.info(f"Starting scrape of {', '.join(source['label'] for source in sources)}...")
+    started = time.time()
+    cycle = {
+        'started_at': datetime.now(timezone.utc).isoformat(),
+        'sources': [source['name'] for source in sources],
+        'phases': [],
+        'failures': {},
+        'results': {}
+    }
+    scrape_trace.cycle = cycle
+    try:
+        try:
+            results = fetch_sources(sources)
+        except Exception as e:
+            logger.error(f"Error during scraping: {str(e)}")
+            results = {}
+        
+        for source in sources:
+            state = source_states[source['name']]
+            data, search_time = results.get(source['name'], (None, None))
+            
+            if not data:
+                logger.error(f"No {source['label']} data was scraped")
+                reason = cycle['failures'].setdefault(source['name'], 'no_data')
+                scrapes_total.inc(source['name'], 'failed')
+                scrape_failures_total.inc(source['name'], reason)
+                cycle['results'][source['name']] = f"failed: {reason}"
+                state['consecutive_failures'] += 1
+                state['next_due'] = time.time() + 60 * min(state['consecutive_failures'], max_failures)
+                continue
+            
+            # Reset consecutive failures on success
+            state['consecutive_failures'] = 0
+            
+            try:
+                changed = publish_snapshot(source, data, search_time)
+            except Exception as e:
+                logger.error(f"Error publishing {source['label']} data: {str(e)}")
+                scrape_failures_total.inc(source['name'], 'publish_error')
+                changed = False
+            result = 'changed' if changed else 'unchanged'
+            scrapes_total.inc(source['name'], result)
+            cycle['results'][source['name']] = result
+            
+            # Plan the next scrape around the source's publication cadence
+            now = time.time()
+            cadence = source_cadences[source['name']]
+            published_at = parse_search_time(search_time)
+            cadence.observe(published_at.timestamp() if published_at else None, changed, started, now)
+            state['next_due'] = cadence.next_scrape(now) if ADAPTIVE_CADENCE else now + SCRAPE_INTERVAL
+    finally:
+        scrape_trace.cycle = None
+        elapsed = time.time() - started
+        scrape_cycle_seconds.observe(elapsed)
+        cycle['duration_ms'] = round(elapsed * 1000, 1)
+        recent_scrapes.append(cycle)
+
+def run_scrape_scheduler():
+    """Scrape every due source in one pass, sharing a single browser session"""
+    while scraping_active:
+        now = time.time()
+        due = [source for source in SCRAPE_SOURCES if source_states[source['name']]['next_due'] <= now]
+        if due:
+            scrape_due_sources(due)
+        
+        next_due = min(state['next_due'] for state in source_states.values())
+        time.sleep(max(1, next_due - time.time()))
+
+class WaterLevelData(Resource):
+    def get(self):
+        date = request.args.get('date')
+        if date:
+            # Checked before the date cache so junk values can't crowd out real dates
+            if not is_valid_date(date):
+                return {'error': "'date' must be YYYY-MM-DD"}, 400
+            try:
+                # Try to get data for specific date
+                doc = get_dated_document('water_levels', date)
+                if doc is not None:
+                    return doc['payload'].respond()
+            except Exception as e:
+                logger.error(f"Error fetching water level data for date {date}: {str(e)}")
+        
+        # Fallback to latest data
+        if source_states['water_level']['payload'] is None:
+            return {'error': 'Water level data not available yet'}, 503
+        
+        return source_states['water_level']['payload'].respond()
+
+class RainfallData(Resource):
+    def get(self):
+        date = request.args.get('date')
+        if date:
+            # Checked before the date cache so junk values can't crowd out real dates
+            if not is_valid_date(date):
+                return {'error': "'date' must be YYYY-MM-DD"}, 400
+            try:
+                # Try to get data for specific date
+                doc = get_dated_document('rainfall_data', date)
+                if doc is not None:
+                    return doc['payload'].respond()
+            except Exception as e:
+                logger.error(f"Error fetching rainfall data for date {date}: {str(e)}")
+        
+        # Fallback to latest data
+        if source_states['rainfall']['payload'] is None:
+            return {'error': 'Rainfall data not available yet'}, 503
+        
+        return source_states['rainfall']['payload'].respond()
+
+BUCKET_UNITS = {'m': 60, 'h': 3600, 'd': 86400}
+# Upper bound on buckets per station so payload size stays bounded
+MAX_HISTORY_BUCKETS = int(os.environ.get('MAX_HISTORY_BUCKETS', 5000))
+
+def parse_bucket(value):
+    """Parse a bucket size such as '5m', '1h' or '1d' into seconds"""
+    match = re.fullmatch(r'(\d+)([mhd])', value.strip().lower())
+    if not match or int(match.group(1)) == 0:
+        raise ValueError(f"Invalid bucket '{value}', expected e.g. 5m, 1h or 1d")
+    return int(match.group(1)) * BUCKET_UNITS[match.group(2)]
+
+def parse_history_time(value):
+    """Parse a from/to query value (epoch seconds, date or date and time in PAGASA time)"""
+    value = value.strip()
+    if re.fullmatch(r'\d{9,}', value):
+        return int(value)
+    for fmt in ("%Y-%m-%d", "%Y-%m-%dT%H:%M", "%Y-%m-%dT%H:%M:%S") + SEARCH_TIME_FORMATS:
+        try:
+            return int(datetime.strptime(value, fmt).replace(tzinfo=PAGASA_TZ).timestamp())
+        except ValueError:
+            continue
+    raise ValueError(f"Invalid time '{value}'")
+
+# Bucket boundaries are aligned to PAGASA local midnight so daily buckets are calendar days
+BUCKET_OFFSET = int(PAGASA_TZ.utcoffset(None).total_seconds())
+
+def downsample(ts, values, bucket, first_bucket, bucket_count):
+    """Aggregate a sorted series onto a fixed bucket grid, ignoring NaN readings.
+    
+    Returns (min, max, mean, last, count) arrays of length bucket_count, with
+    NaN and a zero count for buckets that have no readings.
+    """
+    bucket_ids = (ts + BUCKET_OFFSET) // bucket
+    starts = np.flatnonzero(np.r_[True, bucket_ids[1:] != bucket_ids[:-1]])
+    positions = bucket_ids[starts] - first_bucket
+    
+    valid = ~np.isnan(values)
+    counts = np.add.reduceat(valid.astype(np.int64), starts)
+    sums = np.add.reduceat(np.where(valid, values, 0.0), starts)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = sums / counts
+    last_index = np.maximum.reduceat(np.where(valid, np.arange(len(values)), -1), starts)
+    
+    grid = np.full((4, bucket_count), np.nan)
+    grid[0, positions] = np.fmin.reduceat(values, starts)
+    grid[1, positions] = np.fmax.reduceat(values, starts)
+    grid[2, positions] = means
+    grid[3, positions] = np.where(last_index >= 0, values[np.maximum(last_index, 0)], np.nan)
+    grid_counts = np.zeros(bucket_count, dtype=np.int64)
+    grid_counts[positions] = counts
+    return grid[0], grid[1], grid[2], grid[3], grid_counts
+
+def float_list(values):
+    """Convert an array to a JSON-friendly list with None for NaN"""
+    out = np.round(values, 3).astype(object)
+    out[np.isnan(values)] = None
+    return out.tolist()
+
+class RollingAnalytics:
+    """Rolling per-station metrics of one column, updated in constant time per snapshot.
+    
+    Every published snapshot adds one row to a fixed-size ring holding the
+    column for all stations, which share the snapshot's timestamp. Each window
+    keeps running sums: the new row is added, and rows that left the window
+    are subtracted, so an update costs the same however much history is
+    buffered. The sums give rolling totals and, with slopes=True, the
+    least-squares slope of each window. Peaks are tracked for the current day
+    and since tracking began. The sums are rebuilt from the ring once per lap
+    so floating point error can't accumulate.
+    """
+    
+    def __init__(self, source_name, field, windows, capacity=1152, slopes=False):
+        self.source_name = source_name
+        self.field = field
+        self.windows = windows  # name -> seconds
+        self.capacity = capacity
+        self.slopes = slopes
+        self.payload = None
+        self.report = None
+        self._lock = threading.Lock()
+        self.stats = {'updates': 0, 'rebuilds': 0, 'last_update_ms': None}
+        # The ring is allocated on the first update or seed, so importing the app doesn't load numpy
+        self.names = []
+        self.count = 0
+        self.ts = None
+    
+    def _reset(self):
+        self.names = []
+        self._columns = {}
+        self._stations = None
+        self._index = None
+        self.ts = np.zeros(self.capacity, dtype=np.int64)
+        self.values = np.full((self.capacity, 0), np.nan)
+        self.count = 0  # Rows ever appended; row i lives in slot i % capacity
+        self.base = None  # Time origin of the slope sums, in epoch seconds
+        self._tails = {name: 0 for name in self.windows}  # Oldest row still in each window
+        self._expired = {name: False for name in self.windows}  # Whether the window is fully covered
+        self._sums = {name: np.zeros((5 if self.slopes else 2, 0)) for name in self.windows}
+        self.day = None
+        self.day_peak = np.full(0, np.nan)
+        self.day_peak_ts = np.zeros(0, dtype=np.int64)
+        self.peak = np.full(0, np.nan)
+        self.peak_ts = np.zeros(0, dtype=np.int64)
+    
+    def _add_stations(self, names):
+        for name in names:
+            self._columns[name] = len(self.names)
+            self.names.append(name)
+        extra = len(names)
+        self.values = np.hstack([self.values, np.full((self.capacity, extra), np.nan)])
+        for window in self._sums:
+            self._sums[window] = np.hstack([self._sums[window], np.zeros((self._sums[window].shape[0], extra))])
+        self.day_peak = np.concatenate([self.day_peak, np.full(extra, np.nan)])
+        self.day_peak_ts = np.concatenate([self.day_peak_ts, np.zeros(extra, dtype=np.int64)])
+        self.peak = np.concatenate([self.peak, np.full(extra, np.nan)])
+        self.peak_ts = np.concatenate([self.peak_ts, np.zeros(extra, dtype=np.int64)])
+    
+    def _contribution(self, slot):
+        """Return what one ring row adds to the window sums"""
+        row = self.values[slot]
+        present = ~np.isnan(row)
+        value = np.where(present, row, 0.0)
+        if not self.slopes:
+            return np.stack([present, value])
+        hours = (self.ts[slot] - self.base) / 3600
+        return np.stack([present, value, present * hours, present * hours * hours, value * hours])
+    
+    def _append(self, t, row):
+        capacity = self.capacity
+        if self.count >= capacity:
+            # The oldest row is about to be overwritten; drop it from windows still holding it
+            oldest = self.count - capacity
+            contribution = None
+            for name in self.windows:
+                if self._tails[name] == oldest:
+                    if contribution is None:
+                        contribution = self._contribution(oldest % capacity)
+                    self._sums[name] -= contribution
+                    self._tails[name] += 1
+        
+        slot = self.count % capacity
+        self.ts[slot] = t
+        self.values[slot] = row
+        if self.base is None:
+            self.base = t
+        self.count += 1
+        contribution = self._contribution(slot)
+        for name, seconds in self.windows.items():
+            sums = self._sums[name]
+            sums += contribution
+            tail = self._tails[name]
+            while tail < self.count - 1 and self.ts[tail % capacity] <= t - seconds:
+                sums -= self._contribution(tail % capacity)
+                tail += 1
+                self._expired[name] = True
+            self._tails[name] = tail
+        
+        if self.count % capacity == 0:
+            self._rebuild()
+    
+    def _rebuild(self):
+        """Recompute the window sums from the ring, relative to the newest timestamp"""
+        self.base = int(self.ts[(self.count - 1) % self.capacity])
+        for name in self.windows:
+            slots = np.arange(self._tails[name], self.count) % self.capacity
+            rows = self.values[slots]
+            present = ~np.isnan(rows)
+            value = np.where(present, rows, 0.0)
+            sums = [present.sum(axis=0), value.sum(axis=0)]
+            if self.slopes:
+                hours = ((self.ts[slots] - self.base) / 3600)[:, None]
+                sums += [(present * hours).sum(axis=0), (present * hours * hours).sum(axis=0), (value * hours).sum(axis=0)]
+            self._sums[name] = np.stack(sums).astype(np.float64)
+        self.stats['rebuilds'] += 1
+    
+    def _track_peaks(self, t, row):
+        day = datetime.fromtimestamp(t, PAGASA_TZ).strftime('%Y-%m-%d')
+        if day != self.day:
+            self.day = day
+            self.day_peak = np.full(len(self.names), np.nan)
+        with np.errstate(invalid='ignore'):
+            higher = ~np.isnan(row) & ~(row <= self.day_peak)
+            self.day_peak = np.where(higher, row, self.day_peak)
+            self.day_peak_ts[higher] = t
+            higher = ~np.isnan(row) & ~(row <= self.peak)
+            self.peak = np.where(higher, row, self.peak)
+            self.peak_ts[higher] = t
+    
+    def _build_report(self, last_updated, version):
+        columns = self._index if self._index is not None else np.arange(len(self.names))
+        metrics = {}
+        for name in self.windows:
+            sums = self._sums[name][:, columns]
+            count = sums[0]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                if self.slopes:
+                    spread = count * sums[3] - sums[2] ** 2
+                    slope = (count * sums[4] - sums[2] * sums[1]) / spread
+                    metrics[f'slope_{name}'] = float_list(np.where((count >= 2) & (spread > 1e-9), slope, np.nan))
+                else:
+                    metrics[f'sum_{name}'] = float_list(np.where(count > 0, sums[1], np.nan))
+        
+        def times(ts, values):
+            # Peaks share the few timestamps of recent snapshots, so format each one once
+            labels = {t: datetime.fromtimestamp(t, PAGASA_TZ).strftime("%Y-%m-%d %H:%M") for t in np.unique(ts).tolist()}
+            return [labels[t] if value is not None else None for t, value in zip(ts.tolist(), values)]
+        metrics['peak_today'] = float_list(self.day_peak[columns])
+        metrics['peak_today_time'] = times(self.day_peak_ts[columns], metrics['peak_today'])
+        metrics['peak'] = float_list(self.peak[columns])
+        metrics['peak_time'] = times(self.peak_ts[columns], metrics['peak'])
+        
+        return {
+            'status': 'success',
+            'field': self.field,
+            'last_updated': last_updated,
+            'version': version,
+            'since': datetime.fromtimestamp(int(self.ts[max(0, self.count - self.capacity) % self.capacity]), PAGASA_TZ).strftime("%Y-%m-%d %H:%M"),
+            'windows': {
+                name: {'seconds': seconds, 'readings': self.count - self._tails[name], 'complete': self._expired[name]}
+                for name, seconds in self.windows.items()
+            },
+            'data': {
+                self.names[column]: {key: values[i] for key, values in metrics.items()}
+                for i, column in enumerate(columns.tolist())
+            }
+        }
+    
+    def _publish(self, last_updated, version, tag):
+        self.report = self._build_report(last_updated, version)
+        self.payload = EncodedPayload(self.report, payload_etag('analytics', self.source_name, version, tag),
+                                      last_published_at or datetime.now(timezone.utc))
+    
+    def update(self, snapshot):
+        """Add a published snapshot, returning False if it is not newer than the last one"""
+        started = time.perf_counter()
+        t = snapshot_epoch(snapshot)
+        with self._lock:
+            if self.ts is None:
+                self._reset()
+            if self.count and t <= self.ts[(self.count - 1) % self.capacity]:
+                return False
+            if snapshot.stations != self._stations:
+                missing = [station for station in snapshot.stations if station not in self._columns]
+                if missing:
+                    self._add_stations(missing)
+                self._index = np.fromiter((self._columns[station] for station in snapshot.stations),
+                                          dtype=np.int64, count=len(snapshot.stations))
+                self._stations = snapshot.stations
+            row = np.full(len(self.names), np.nan)
+            row[self._index] = snapshot.values[self.field]
+            self._append(t, row)
+            self._track_peaks(t, row)
+            self._publish(snapshot.search_time, snapshot.version, snapshot.digest)
+            self.stats['updates'] += 1
+            self.stats['last_update_ms'] = round((time.perf_counter() - started) * 1000, 2)
+        return True
+    
+    def seed(self, series):
+        """Refill the ring from history, given {station: (ts array, values matrix)} as returned by HistoryStore.query"""
+        with self._lock:
+            self._reset()
+            series = {station: item for station, item in series.items() if len(item[0])}
+            if not series:
+                return
+            times = np.unique(np.concatenate([ts for ts, _ in series.values()]))[-self.capacity:]
+            self._add_stations(sorted(series))
+            matrix = np.full((len(times), len(self.names)), np.nan)
+            for station, (ts, values) in series.items():
+                positions = np.searchsorted(times, ts)
+                found = (positions < len(times)) & (times[np.minimum(positions, len(times) - 1)] == ts)
+                matrix[positions[found], self._columns[station]] = values[found, 0]
+            for t, row in zip(times.tolist(), matrix):
+                self._append(t, row)
+                self._track_peaks(t, row)
+            self._publish(datetime.fromtimestamp(times[-1], PAGASA_TZ).strftime("%Y-%m-%d %H:%M"), None, int(times[-1]))
+    
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['readings'] = min(self.count, self.capacity)
+            stats['stations'] = len(self.names)
+        return stats
+
+def parse_windows(value):
+    """Parse a comma separated list of windows such as '2h,48h,7d' into {name: seconds}"""
+    return {name.strip().lower(): parse_bucket(name) for name in value.split(',') if name.strip()}
+
+ANALYTICS_BUFFER_SIZE = int(os.environ.get('ANALYTICS_BUFFER_SIZE', 1152))
+source_analytics = {
+    'rainfall': RollingAnalytics(
+        'rainfall', 'current_rf', parse_windows(os.environ.get('RAINFALL_ANALYTICS_WINDOWS', '2h,48h,72h,7d')),
+        capacity=ANALYTICS_BUFFER_SIZE
+    ),
+    'water_level': RollingAnalytics(
+        'water_level', 'current_wl', parse_windows(os.environ.get('WATER_LEVEL_ANALYTICS_WINDOWS', '30m,1h,3h,6h')),
+        capacity=ANALYTICS_BUFFER_SIZE, slopes=True
+    )
+}
+
+def seed_analytics():
+    """Fill the rolling analytics from the local history, then add the current snapshots"""
+    if history_store is None:
+        return
+    now = int(time.time())
+    for name, analytics in source_analytics.items():
+        try:
+            start_of_day = datetime.now(PAGASA_TZ).replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+            start = min(now - max(analytics.windows.values(), default=0), int(start_of_day))
+            analytics.seed(run_blocking(history_store.query, name, [analytics.field], start=start))
+            if source_states[name]['snapshot'] is not None:
+                analytics.update(source_states[name]['snapshot'])
+        except Exception as e:
+            logger.error(f"Error seeding {name} analytics from history: {str(e)}")
+
+class AnalyticsResource(Resource):
+    """Rolling window metrics per station, precomputed when snapshots are published"""
+    source_name = None
+    
+    def get(self):
+        analytics = source_analytics[self.source_name]
+        payload = analytics.payload
+        if payload is None:
+            return {'error': f"{SOURCES_BY_NAME[self.source_name]['label'].capitalize()} analytics not available yet"}, 503
+        
+        stations = request.args.getlist('station')
+        if not stations:
+            return payload.respond()
+        stations = [name for value in stations for name in value.split(',') if name]
+        report = analytics.report
+        return dict(report, data={station: report['data'][station] for station in stations if station in report['data']})
+
+class WaterLevelAnalytics(AnalyticsResource):
+    source_name = 'water_level'
+
+class RainfallAnalytics(AnalyticsResource):
+    source_name = 'rainfall'
+
+class HistoryResource(Resource):
+    """Downsampled history for one scrape source"""
+    source_name = None
+    default_field = None
+    
+    def get(self):
+        if history_store is None:
+            return {'error': 'History is not available'}, 503
+        
+        source = SOURCES_BY_NAME[self.source_name]
+        field = request.args.get('field', self.default_field)
+        if field not in source['columns'][1:]:
+            return {'error': f"Unknown field '{field}'"}, 400
+        
+        try:
+            bucket = parse_bucket(request.args.get('bucket', '1h'))
+            end = parse_history_time(request.args['to']) if request.args.get('to') else int(time.time())
+            start = parse_history_time(request.args['from']) if request.args.get('from') else end - 86400
+        except ValueError as e:
+            return {'error': str(e)}, 400
+        if start > end:
+            return {'error': "'from' must not be after 'to'"}, 400
+        first_bucket = (start + BUCKET_OFFSET) // bucket
+        bucket_count = (end + BUCKET_OFFSET) // bucket - first_bucket + 1
+        if bucket_count > MAX_HISTORY_BUCKETS:
+            return {'error': f"Too many buckets, use a larger bucket or a shorter window (limit {MAX_HISTORY_BUCKETS})"}, 400
+        
+        stations = request.args.getlist('station') or None
+        if stations:
+            stations = [name for value in stations for name in value.split(',') if name]
+        
+        series = run_blocking(history_store.aggregate, self.source_name, field, bucket, start, end, stations=stations)
+        
+        data = {}
+        for station, (mins, maxs, means, lasts, counts) in series.items():
+            data[station] = {
+                'min': float_list(mins),
+                'max': float_list(maxs),
+                'mean': float_list(means),
+                'last': float_list(lasts),
+                'count': counts.tolist()
+            }
+        
+        return {
+            'status': 'success',
+            'field': field,
+            'bucket': bucket,
+            'from': datetime.fromtimestamp(start, PAGASA_TZ).strftime("%Y-%m-%d %H:%M"),
+            'to': datetime.fromtimestamp(end, PAGASA_TZ).strftime("%Y-%m-%d %H:%M"),
+            # Start of each bucket; every station's arrays line up with this list
+            'time': [
+                datetime.fromtimestamp(index * bucket - BUCKET_OFFSET, PAGASA_TZ).strftime("%Y-%m-%d %H:%M")
+                for index in range(first_bucket, first_bucket + bucket_count)
+            ],
+            'data': data
+        }
+
+class WaterLevelHistory(HistoryResource):
+    source_name = 'water_level'
+    default_field = 'current_wl'
+
+class RainfallHistory(HistoryResource):
+    source_name = 'rainfall'
+    default_field = 'current_rf'
+
+class ChangesResource(Resource):
+    """Incremental sync: the deltas after a client's version, or the whole table"""
+    source_name = None
+    
+    def get(self):
+        snapshot = source_states[self.source_name]['snapshot']
+        if snapshot is None:
+            return {'error': f"{SOURCES_BY_NAME[self.source_name]['label'].capitalize()} data not available yet"}, 503
+        
+        since = request.args.get('since')
+        if not since:
+            return full_changes(snapshot)
+        try:
+            since = int(since)
+        except ValueError:
+            return {'error': "'since' must be a version number"}, 400
+        
+        changes = source_changes[self.source_name].since(since)
+        if changes is None:
+            # Too old or from another chain (e.g. before a restart): resync
+            return full_changes(snapshot)
+        return {
+            'status': 'success',
+            'version': changes[-1]['version'] if changes else since,
+            'full': False,
+            'since': since,
+            'changes': changes
+        }
+
+class WaterLevelChanges(ChangesResource):
+    source_name = 'water_level'
+
+class RainfallChanges(ChangesResource):
+    source_name = 'rainfall'
+
+class Alerts(Resource):
+    """Stations at alert level or above (every station with ?all=1), precomputed per snapshot"""
+    
+    def get(self):
+        show_all = request.args.get('all', '').lower() in ('1', 'true', 'yes')
+        payload = flood_alerts.all_payload if show_all else flood_alerts.over_payload
+        if payload is None:
+            return {'error': 'Flood alerts not available yet'}, 503
+        return payload.respond()
+
+class AlertTransitions(Resource):
+    """Changes of flood alert level after a snapshot version"""
+    
+    def get(self):
+        if flood_alerts.version is None:
+            return {'error': 'Flood alerts not available yet'}, 503
+        since = request.args.get('since')
+        if since:
+            try:
+                since = int(since)
+            except ValueError:
+                return {'error': "'since' must be a version number"}, 400
+        else:
+            since = None
+        
+        transitions, truncated = flood_alerts.transitions_since(since)
+        return {
+            'status': 'success',
+            'version': flood_alerts.version,
+            'since': since,
+            'truncated': truncated,
+            'transitions': transitions
+        }
+
+BATCH_MAX_DATES = int(os.environ.get('BATCH_MAX_DATES', 31))
+batch_payloads = OrderedDict()  # combined tag -> EncodedPayload, most recent last
+batch_payloads_lock = threading.Lock()
+
+class Batch(Resource):
+    """Several sources and dates in one response, with the dated documents read together"""
+    
+    def get(self):
+        names = [name.replace('-', '_') for value in request.args.getlist('source') for name in value.split(',') if name]
+        names = list(dict.fromkeys(names)) or [source['name'] for source in SCRAPE_SOURCES]
+        unknown = [name for name in names if name not in SOURCES_BY_NAME]
+        if unknown:
+            return {'error': f"Unknown source '{unknown[0]}'"}, 400
+        
+        dates = [date for value in request.args.getlist('date') for date in value.split(',') if date]
+        bounds = [request.args[key] for key in ('from', 'to') if request.args.get(key)]
+        # The same check as the dated endpoints, so junk never reaches the cache or a collection name
+        if not all(date == 'latest' or is_valid_date(date) for date in dates) or not all(map(is_valid_date, bounds)):
+            return {'error': "Dates must be 'latest' or YYYY-MM-DD"}, 400
+        if request.args.get('from'):
+            start = datetime.strptime(request.args['from'], "%Y-%m-%d")
+            end = datetime.strptime(request.args['to'], "%Y-%m-%d") if request.args.get('to') else datetime.now(PAGASA_TZ).replace(tzinfo=None)
+            if start > end:
+                return {'error': "'from' must not be after 'to'"}, 400
+            if (end - start).days >= BATCH_MAX_DATES:
+                return {'error': f"Too many dates (limit {BATCH_MAX_DATES})"}, 400
+            dates.extend((start + timedelta(days=i)).strftime("%Y-%m-%d") for i in range((end - start).days + 1))
+        dates = list(dict.fromkeys(dates)) or ['latest']
+        if len(dates) > BATCH_MAX_DATES:
+            return {'error': f"Too many dates (limit {BATCH_MAX_DATES})"}, 400
+        
+        keys = [(SOURCES_BY_NAME[name]['collection'], date) for name in names for date in dates if date != 'latest']
+        documents = {}
+        if keys:
+            try:
+                documents = get_dated_documents(keys)
+            except Exception as e:
+                logger.error(f"Error fetching batch of {len(keys)} dated documents: {str(e)}")
+                return {'error': 'Stored data is not available right now'}, 503
+        
+        # Tag the combination by the tags of its parts, so unchanged batches are served from cache
+        entries = []
+        for name in names:
+            for date in dates:
+                if date == 'latest':
+                    state = source_states[name]
+                    entries.append((name, date, state['payload'], state))
+                else:
+                    doc = documents.get((SOURCES_BY_NAME[name]['collection'], date))
+                    entries.append((name, date, doc['payload'] if doc else None, doc))
+        tag = payload_etag('batch', *(f"{name}/{date}/{payload.etag if payload else ''}" for name, date, payload, _ in entries))
+        with batch_payloads_lock:
+            payload = batch_payloads.get(tag)
+            if payload is not None:
+                batch_payloads.move_to_end(tag)
+        if payload is None:
+            payload = run_blocking(self._encode, entries, tag)
+            with batch_payloads_lock:
+                batch_payloads[tag] = payload
+                while len(batch_payloads) > 32:
+                    batch_payloads.popitem(last=False)
+        return payload.respond()
+    
+    def _encode(self, entries, tag):
+        results = {}
+        for name, date, payload, source in entries:
+            if payload is None:
+                if date == 'latest':
+                    entry = {'error': f"{SOURCES_BY_NAME[name]['label'].capitalize()} data not available yet"}
+                else:
+                    entry = {'error': f"No {SOURCES_BY_NAME[name]['label']} data for {date}"}
+            elif date == 'latest':
+                snapshot = source['snapshot']
+                entry = {'last_updated': last_updated, 'data': snapshot.to_dicts() if snapshot else []}
+                if source['stale']:
+                    entry['stale'] = True
+            else:
+                entry = {'last_updated': source['last_updated'], 'data': source['data']}
+            results.setdefault(name, {})[date] = entry
+        
+        modified = [payload.last_modified for _, _, payload, _ in entries if payload is not None and payload.last_modified]
+        return EncodedPayload({'status': 'success', 'results': results}, tag, max(modified) if modified else None)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_latency(response):
+    started = getattr(g, 'request_started', None)
+    if started is not None:
+        endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        http_request_seconds.observe(time.perf_counter() - started, endpoint, request.method, str(response.status_code))
+    return response
+
+metrics.register(CollectedMetric(
+    'floodpath_consecutive_failures', 'Consecutive failed scrapes per source', 'gauge', ('source',),
+    lambda: {name: state['consecutive_failures'] for name, state in source_states.items()}
+))
+metrics.register(CollectedMetric(
+    'floodpath_snapshot_version', 'Version of the published snapshot per source', 'gauge', ('source',),
+    lambda: {name: state['snapshot'].version for name, state in source_states.items() if state['snapshot'] is not None}
+))
+metrics.register(CollectedMetric(
+    'floodpath_scraper_leader', 'Whether this worker runs the scrapers', 'gauge', (),
+    lambda: {(): 1 if scraper_leadership.is_leader else 0}
+))
+metrics.register(CollectedMetric(
+    'floodpath_driver_pool_events_total', 'Webdriver pool events', 'counter', ('event',),
+    lambda: {event: value for event, value in driver_pool.get_stats().items() if event in ('hits', 'cold_starts', 'failed_starts', 'recycles', 'health_check_failures')}
+))
+metrics.register(CollectedMetric(
+    'floodpath_storage_writes_total', 'Storage writer outcomes', 'counter', ('outcome',),
+    lambda: {outcome: storage_writer.stats[outcome] for outcome in ('commits', 'checkpoints', 'failures', 'coalesced', 'dropped')}
+))
+metrics.register(CollectedMetric(
+    'floodpath_stream_subscribers', 'Connected /stream clients', 'gauge', (),
+    lambda: {(): snapshot_events.get_stats()['subscribers']}
+))
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Metrics of this worker in the Prometheus text format"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/debug/scrapes')
+def debug_scrapes():
+    """Recent scrape cycles with their phase timings, newest first"""
+    return jsonify({'cycles': list(reversed(recent_scrapes))})
+
+@app.route('/stream')
+def stream():
+    """Server-Sent Events stream of published snapshots"""
+    if snapshot_events.full():
+        return jsonify({'error': 'Too many stream subscribers'}), 503
+    
+    try:
+        last_id = int(request.headers.get('Last-Event-ID') or request.args.get('last_event_id') or 0)
+    except ValueError:
+        last_id = 0
+    
+    def current_snapshots():
+        """Events carrying every source's current snapshot"""
+        event_id = snapshot_events.last_id
+        events = []
+        for name, state in source_states.items():
+            if state['stream_snapshot'] is not None:
+                events.append(format_sse(event_id, stream_event_name(name), state['stream_snapshot']))
+        return event_id, events
+    
+    def generate(last_id):
+        # The slot is taken here, not in the view, so that a client gone before
+        # the first chunk (when the generator never starts) doesn't hold one
+        if not snapshot_events.subscribe():
+            return
+        try:
+            yield "retry: 5000\n\n"
+            if last_id == 0 or last_id > snapshot_events.last_id:
+                # New client (or one from before a restart): start from the current state
+                last_id, events = current_snapshots()
+                yield from events
+            
+            while True:
+                events = snapshot_events.events_since(last_id, STREAM_HEARTBEAT)
+                if events is None:
+                    # Missed more events than the buffer holds, resend everything
+                    last_id, events = current_snapshots()
+                    yield from events
+                elif not events:
+                    yield ": heartbeat\n\n"
+                else:
+                    for event_id, event, data in events:
+                        yield format_sse(event_id, event, data)
+                        last_id = event_id
+        finally:
+            snapshot_events.unsubscribe()
+    
+    return Response(generate(last_id), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/')
+def index():
+    # Available dates come from the maintained index, newest first
+    available_dates = date_index.dates()
+    
+    water_snapshot = source_states['water_level']['snapshot']
+    rainfall_snapshot = source_states['rainfall']['snapshot']
+    latest_water_data = water_snapshot.to_dicts() if water_snapshot else None
+    latest_rainfall_data = rainfall_snapshot.to_dicts() if rainfall_snapshot else None
+    return render_template_string(HTML_TEMPLATE, 
+                                water_data={'data': latest_water_data, 'last_updated': last_updated} if latest_water_data else None,
+                                rainfall_data={'data': latest_rainfall_data, 'last_updated': last_updated} if latest_rainfall_data else None,
+                                available_dates=available_dates)
+
+api.add_resource(WaterLevelData, '/water-level')
+api.add_resource(RainfallData, '/rainfall')
+api.add_resource(WaterLevelHistory, '/water-level/history')
+api.add_resource(RainfallHistory, '/rainfall/history')
+api.add_resource(WaterLevelChanges, '/water-level/changes')
+api.add_resource(RainfallChanges, '/rainfall/changes')
+api.add_resource(WaterLevelAnalytics, '/water-level/analytics')
+api.add_resource(RainfallAnalytics, '/rainfall/analytics')
+api.add_resource(Alerts, '/alerts')
+api.add_resource(AlertTransitions, '/alerts/transitions')
+api.add_resource(Batch, '/batch')
+
+def start_scrapers():
+    """Start the background scraper thread"""
+    global scraper_thread, scraping_active
+    
+    try:
+        # Test webdriver initialization before starting threads; the session
+        # goes back into the pool so the first scrape starts warm
         logger.info("Testing webdriver initialization...")
-        test_driver = initialize_webdriver()
+        test_driver = driver_pool.acquire()
         if test_driver:
-            test_driver.quit()
+            driver_pool.release(test_driver)
             logger.info("Webdriver test successful")
-        else:
+        elif FETCH_MODE == 'selenium':
             logger.error("Webdriver test failed")
             scraping_active = False
+            scraper_leadership.release()
             return
+        else:
+            logger.warning("Webdriver test failed, only sources served over plain HTTP will be scraped")
         
-        water_thread = threading.Thread(target=scrape_pagasa_water_level)
-        rainfall_thread = threading.Thread(target=scrape_pagasa_rainfall)
-        
-        water_thread.daemon = True
-        rainfall_thread.daemon = True
-        
-        water_thread.start()
-        rainfall_thread.start()
-        logger.info("Scraper threads started successfully")
+        seed_cadences()
+        scraper_thread = threading.Thread(target=run_scrape_scheduler)
+        scraper_thread.daemon = True
+        scraper_thread.start()
+        logger.info(f"Scraper thread started for {len(SCRAPE_SOURCES)} sources")
         
         # Add error handling for thread monitoring
         def monitor_threads():
-            global water_thread, rainfall_thread, scraping_active
+            global scraper_thread, scraping_active
             while scraping_active:
                 try:
-                    if not water_thread.is_alive():
-                        logger.error("Water level scraper thread died, restarting...")
-                        water_thread = threading.Thread(target=scrape_pagasa_water_level)
-                        water_thread.daemon = True
-                        water_thread.start()
-                    
-                    if not rainfall_thread.is_alive():
-                        logger.error("Rainfall scraper thread died, restarting...")
-                        rainfall_thread = threading.Thread(target=scrape_pagasa_rainfall)
-                        rainfall_thread.daemon = True
-                        rainfall_thread.start()
+                    if not scraper_thread.is_alive():
+                        logger.error("Scraper thread died, restarting...")
+                        thread_restarts_total.inc()
+                        scraper_thread = threading.Thread(target=run_scrape_scheduler)
+                        scraper_thread.daemon = True
+                        scraper_thread.start()
                     
                     time.sleep(60)  # Check every minute
                 except Exception as e:
@@ -790,26 +4449,100 @@ def start_scrapers():
         logger.error(f"Error starting scraper threads: {str(e)}")
         scraping_active = False
 
-# Initialize scraping when the module is imported
-try:
-    logger.info("Starting scraper initialization...")
-    start_scrapers()
-except Exception as e:
-    logger.error(f"Failed to start scrapers: {str(e)}")
-    scraping_active = False
+def start_follower():
+    """Serve the leader's snapshots from this worker"""
+    follower_thread = threading.Thread(target=follow_shared_snapshots)
+    follower_thread.daemon = True
+    follower_thread.start()
+    logger.info("Scraper lock held by another worker, following its snapshots")
+
+startup_started = time.monotonic()
+warmup_state = {'state': 'warming', 'step': None, 'ready_after_ms': None}
+warmup_done = threading.Event()
+
+def warm_up():
+    """Connect storage and start the scrapers in the background"""
+    global db, storage, is_leader, scraping_active
+    # Benchmarks and tools that only need the parsing code set SCRAPERS_ENABLED=0.
+    # Every gunicorn worker imports the app, but only the one holding the
+    # scraper lock scrapes.
+    try:
+        # The last snapshots saved locally can be served right away
+        warmup_state['step'] = 'restore'
+        restore_snapshots()
+        
+        warmup_state['step'] = 'analytics'
+        seed_analytics()
+        
+        warmup_state['step'] = 'storage'
+        if STORAGE_BACKEND == 'firestore':
+            db = initialize_firebase()
+        storage = create_storage(STORAGE_BACKEND)
+        if storage is not None:
+            storage_writer.start()
+            atexit.register(storage_writer.stop)
+            # Sources without a local snapshot fall back to the stored 'latest' documents
+            restore_snapshots(from_storage=True)
+        
+        scrapers_enabled = os.environ.get('SCRAPERS_ENABLED', '1') != '0'
+        if scrapers_enabled:
+            os.makedirs(SHARED_STATE_DIR, exist_ok=True)
+            is_leader = scraper_leadership.try_acquire()
+        
+        # Rebuild the date index once at startup; followers read the leader's copy
+        if storage is not None:
+            date_index_thread = threading.Thread(target=date_index.rebuild if is_leader else date_index.load)
+            date_index_thread.daemon = True
+            date_index_thread.start()
+        
+        if not scrapers_enabled:
+            logger.info("Scrapers disabled by SCRAPERS_ENABLED=0")
+            scraping_active = False
+        elif is_leader:
+            warmup_state['step'] = 'webdriver'
+            logger.info("Starting scraper initialization...")
+            start_scrapers()
+        else:
+            start_follower()
+    except Exception as e:
+        logger.error(f"Failed to start scrapers: {str(e)}")
+        scraping_active = False
+    finally:
+        warmup_state['state'] = 'ready'
+        warmup_state['step'] = None
+        warmup_state['ready_after_ms'] = round((time.monotonic() - startup_started) * 1000, 1)
+        warmup_done.set()
+        logger.info(f"Warmup finished after {warmup_state['ready_after_ms']} ms")
+
+# Warm up in the background, so gunicorn can serve requests (and /health
+# reports "warming") as soon as the module is imported
+is_leader = True
+warmup_thread = threading.Thread(target=warm_up, name='warmup')
+warmup_thread.daemon = True
+warmup_thread.start()
 
 # Add health check endpoint
 @app.route('/health')
 def health_check():
     """Health check endpoint for uptime monitoring"""
     try:
+        # Storage and the webdriver are still starting in the background
+        if not warmup_done.is_set():
+            return jsonify({
+                'status': 'warming',
+                'step': warmup_state['step'],
+                'uptime_seconds': round(time.monotonic() - startup_started, 1),
+                'water_data_available': source_states['water_level']['snapshot'] is not None,
+                'rainfall_data_available': source_states['rainfall']['snapshot'] is not None,
+                'stale_sources': [name for name, state in source_states.items() if state['stale']]
+            }), 200
+        
         # Check if scraping is active
         if not scraping_active:
             return jsonify({
                 'status': 'error',
                 'message': 'Scraping is not active',
-                'water_thread_alive': water_thread.is_alive() if water_thread else False,
-                'rainfall_thread_alive': rainfall_thread.is_alive() if rainfall_thread else False
+                'scraper_thread_alive': scraper_thread.is_alive() if scraper_thread else False
             }), 503
         
         # Check if we have recent data
@@ -824,22 +4557,49 @@ def health_check():
                     'status': 'warning',
                     'message': f'No data updates in {int(time_diff/60)} minutes',
                     'last_update': last_updated,
-                    'water_thread_alive': water_thread.is_alive() if water_thread else False,
-                    'rainfall_thread_alive': rainfall_thread.is_alive() if rainfall_thread else False
+                    'scraper_thread_alive': scraper_thread.is_alive() if scraper_thread else False
                 }), 200
         
         return jsonify({
             'status': 'healthy',
             'last_update': last_updated,
-            'water_data_available': latest_water_data is not None,
-            'rainfall_data_available': latest_rainfall_data is not None,
-            'water_thread_alive': water_thread.is_alive() if water_thread else False,
-            'rainfall_thread_alive': rainfall_thread.is_alive() if rainfall_thread else False
+            'water_data_available': source_states['water_level']['snapshot'] is not None,
+            'rainfall_data_available': source_states['rainfall']['snapshot'] is not None,
+            'stale_sources': [name for name, state in source_states.items() if state['stale']],
+            'scraper_thread_alive': scraper_thread.is_alive() if scraper_thread else False,
+            'role': 'leader' if scraper_leadership.is_leader else 'follower',
+            'driver_pool': driver_pool.get_stats()
         }), 200
     except Exception as e:
         logger.error(f"Health check failed: {str(e)}")
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+@app.route('/stats')
+def stats():
+    """Internal scraper statistics"""
+    with fetch_modes_lock:
+        fetch_modes = {source: dict(mode) for source, mode in source_fetch_modes.items()}
+    return jsonify({
+        'role': 'leader' if scraper_leadership.is_leader else 'follower',
+        'startup': dict(warmup_state),
+        'pid': os.getpid(),
+        'driver_pool': driver_pool.get_stats(),
+        'fetch_modes': fetch_modes,
+        'settle_waits': get_settle_wait_stats(),
+        'cadence': {name: cadence.get_stats() for name, cadence in source_cadences.items()},
+        'history': history_store.get_stats() if history_store is not None else None,
+        'storage': storage.name if storage is not None else None,
+        'storage_writer': storage_writer.get_stats(),
+        'date_cache': date_cache.get_stats(),
+        'stream': snapshot_events.get_stats(),
+        'alerts': flood_alerts.get_stats(),
+        'analytics': {name: analytics.get_stats() for name, analytics in source_analytics.items()},
+        'changes': {
+            name: {'version': state['snapshot'].version if state['snapshot'] else None, 'buffered': len(source_changes[name])}
+            for name, state in source_states.items()
+        }
+    })
+
 if __name__ == '__main__':
     # Get port from environment variable or use default
     port = int(os.environ.get('PORT', 10000))
@@ -0,0 +1,146 @@
+"""Rolling analytics benchmark: per-update cost as the buffered history grows.
+
+Usage:
+    python benchmarks/bench_analytics.py [--stations 400] [--sizes 144,1152,8640,52560]
+                                         [--updates 300] [--json]
+
+For each ring size, fills a RollingAnalytics buffer for rainfall and for
+water level slopes to capacity with 10-minute readings, then times further
+snapshot updates in steady state (every update evicts the oldest reading).
+The windows cover the whole ring, so a naive implementation would rescan
+all of it. For comparison the same windows are recomputed from the ring with
+numpy on every update. The sums are rebuilt once per lap of the ring, which
+is reported separately with its cost amortized over the lap.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+STEP = 600  # Seconds between readings
+START = 1767225600  # 2026-01-01 00:00 UTC
+
+def make_snapshots(app, source, stations, count, first_index):
+    """Build snapshots with random readings, one reading interval apart"""
+    rng = random.Random(first_index)
+    names = [f"Station {i}" for i in range(stations)]
+    snapshots = []
+    for k in range(count):
+        t = START + (first_index + k) * STEP
+        search_time = time.strftime('%Y-%m-%d %H:%M', time.gmtime(t + 8 * 3600))
+        rows = [
+            dict(zip(source['columns'], [name, f"{rng.uniform(0, 20):.2f}"] + ['0'] * (len(source['columns']) - 2)))
+            for name in names
+        ]
+        snapshot = app.TableSnapshot.from_rows(source, rows, search_time)
+        snapshot.version = first_index + k
+        snapshot.values  # Parse the readings outside the timed section
+        snapshots.append(snapshot)
+    return snapshots
+
+def naive_update(analytics):
+    """Recompute every window of the current ring from scratch, as a request-time implementation would"""
+    latest = analytics.ts[(analytics.count - 1) % analytics.capacity]
+    filled = min(analytics.count, analytics.capacity)
+    ts = analytics.ts[:filled]
+    values = analytics.values[:filled]
+    for seconds in analytics.windows.values():
+        rows = values[ts > latest - seconds]
+        if analytics.slopes:
+            hours = ((ts[ts > latest - seconds] - latest) / 3600)[:, None]
+            present = ~np.isnan(rows)
+            count = present.sum(axis=0)
+            t_sum = (present * hours).sum(axis=0)
+            v_sum = np.nansum(rows, axis=0)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                (count * np.nansum(rows * hours, axis=0) - t_sum * v_sum) / (count * (present * hours * hours).sum(axis=0) - t_sum ** 2)
+        else:
+            np.nansum(rows, axis=0)
+
+def bench_size(app, source, size, args, slopes):
+    windows = {'1h': 3600, '24h': 86400, 'full': size * STEP}
+    analytics = app.RollingAnalytics(source['name'], source['columns'][1], windows, capacity=size, slopes=slopes)
+    fill = make_snapshots(app, source, args.stations, min(size, 24), 0)
+    # Fill the ring quickly by reusing a handful of snapshots' readings at increasing times
+    for k in range(size):
+        snapshot = fill[k % len(fill)]
+        row = snapshot.values[source['columns'][1]]
+        if k == 0:
+            analytics.update(snapshot)
+            continue
+        analytics._append(START + k * STEP, row)
+        analytics._track_peaks(START + k * STEP, row)
+
+    updates = make_snapshots(app, source, args.stations, args.updates, size + 1)
+    timings = []
+    naive = []
+    for snapshot in updates:
+        started = time.perf_counter()
+        analytics.update(snapshot)
+        timings.append((time.perf_counter() - started) * 1e6)
+        started = time.perf_counter()
+        naive_update(analytics)
+        naive.append((time.perf_counter() - started) * 1e6)
+
+    started = time.perf_counter()
+    analytics._rebuild()
+    rebuild_us = (time.perf_counter() - started) * 1e6
+    return {
+        'size': size,
+        'history_days': round(size * STEP / 86400, 1),
+        'update_us': {'mean': round(statistics.mean(timings), 1), 'p50': round(statistics.median(timings), 1),
+                      'p95': round(sorted(timings)[int(0.95 * len(timings))], 1)},
+        'naive_us': {'mean': round(statistics.mean(naive), 1), 'p50': round(statistics.median(naive), 1)},
+        'rebuild_us': round(rebuild_us, 1),
+        'rebuild_amortized_us': round(rebuild_us / size, 2)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stations', type=int, default=400)
+    parser.add_argument('--sizes', default='144,1152,8640,52560', help='Comma separated ring sizes (readings per station)')
+    parser.add_argument('--updates', type=int, default=300, help='Timed updates per ring size')
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench-analytics-')
+    os.environ.update({
+        'SCRAPERS_ENABLED': '0',
+        'HISTORY_DB_PATH': '',
+        'SNAPSHOT_DIR': '',
+        'STORAGE_BACKEND': 'none',
+        'SHARED_STATE_DIR': workdir
+    })
+    import app
+
+    results = []
+    for name, slopes in (('rainfall', False), ('water_level', True)):
+        source = app.SOURCES_BY_NAME[name]
+        for size in [int(size) for size in args.sizes.split(',') if size.strip()]:
+            result = bench_size(app, source, size, args, slopes)
+            result['source'] = name
+            results.append(result)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+    print(f"{args.stations} stations, {args.updates} timed updates per size, windows 1h, 24h and the whole ring")
+    print(f"{'source':<12} {'size':>7} {'days':>6} {'update us':>10} {'p95 us':>9} {'naive us':>10} "
+          f"{'rebuild ms':>11} {'amortized us':>13}")
+    for result in results:
+        print(f"{result['source']:<12} {result['size']:>7} {result['history_days']:>6} "
+              f"{result['update_us']['mean']:>10.1f} {result['update_us']['p95']:>9.1f} "
+              f"{result['naive_us']['mean']:>10.1f} {result['rebuild_us'] / 1000:>11.2f} "
+              f"{result['rebuild_amortized_us']:>13.2f}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
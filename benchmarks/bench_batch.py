@@ -0,0 +1,284 @@
+"""Batch read benchmark: /batch against one ?date= request per source and day.
+
+Usage:
+    python benchmarks/bench_batch.py [--days 14] [--stations 400] [--latency MS]
+                                     [--worker-class gevent|gthread|sync] [--runs 3] [--json]
+
+Starts the app under gunicorn with the worker class it is deployed with
+(gevent by default; werkzeug's threaded server if gunicorn isn't installed)
+and points its storage at a stand-in Firestore client held in the worker.
+The stand-in serves --days dated documents per source, each with a few
+deltas, and sleeps --latency milliseconds per round-trip. That is one per
+document get(), get_all() and delta query. FirestoreStorage's own read paths
+run against it, so the numbers cover get_all() plus the pooled delta
+queries of /batch against two reads per day for ?date=. Every run starts a
+fresh worker, so the date cache starts cold. A second pass shows the
+cached cost. While a batch loads, /health is polled every few milliseconds.
+Its worst latency shows whether the reads stall the worker's other clients.
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import date, datetime, timedelta, timezone
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+FIRST_DAY = date(2026, 9, 1)
+SOURCES = {'water_level': 'water_levels', 'rainfall': 'rainfall_data'}
+
+class StandInSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.exists = data is not None
+        self.update_time = datetime(2026, 9, 1, tzinfo=timezone.utc) if data is not None else None
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data)
+
+class StandInQuery:
+    def __init__(self, client, path, after=None):
+        self.client = client
+        self.path = path
+        self.after = after
+
+    def where(self, field, op, value):
+        return StandInQuery(self.client, self.path, value)
+
+    def order_by(self, field):
+        return self
+
+    def stream(self):
+        self.client.round_trip()
+        deltas = sorted(self.client.deltas.get(self.path, []), key=lambda delta: delta['version'])
+        return iter([StandInSnapshot(self, delta) for delta in deltas if self.after is None or delta['version'] > self.after])
+
+class StandInDocument:
+    def __init__(self, client, path):
+        self.client = client
+        self.path = path
+
+    def get(self):
+        self.client.round_trip()
+        return StandInSnapshot(self, self.client.documents.get(self.path))
+
+    def collection(self, name):
+        return StandInQuery(self.client, f"{self.path}/{name}")
+
+class StandInCollection:
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+
+    def document(self, name):
+        return StandInDocument(self.client, f"{self.name}/{name}")
+
+class StandInFirestore:
+    """The part of the Firestore client the read paths use, with a fixed delay per round-trip"""
+
+    def __init__(self, latency_ms):
+        self.latency = latency_ms / 1000
+        self.documents = {}
+        self.deltas = {}
+        self.round_trips = 0
+
+    def round_trip(self):
+        self.round_trips += 1
+        time.sleep(self.latency)
+
+    def collection(self, name):
+        return StandInCollection(self, name)
+
+    def get_all(self, references):
+        self.round_trip()
+        return [StandInSnapshot(reference, self.documents.get(reference.path)) for reference in references]
+
+def seed(client, days, stations):
+    """Store a checkpoint and three deltas per source and day"""
+    for source, collection in SOURCES.items():
+        for offset in range(days):
+            day = (FIRST_DAY + timedelta(days=offset)).isoformat()
+            version = (offset + 1) * 100
+            path = f"{collection}_{day}/latest"
+            client.documents[path] = {
+                'last_updated': f"{day} 08:00",
+                'version': version,
+                'date': day,
+                'data': [
+                    {'station': f"Station {i}", 'current': f"{i % 17 + 0.5:.2f}", 'timestamp': f"{day} 08:00"}
+                    for i in range(stations)
+                ]
+            }
+            client.deltas[f"{path}/deltas"] = [
+                {
+                    'version': version + k, 'base_version': version + k - 1, 'last_updated': f"{day} 08:{k}0",
+                    'added': [], 'removed': [],
+                    'changed': [{'station': f"Station {k}", 'old': {}, 'new': {'current': f"{k}.00"}}]
+                }
+                for k in range(1, 4)
+            ]
+
+def create_app():
+    """Worker side: load the app and give it storage backed by a seeded stand-in"""
+    import app
+    client = StandInFirestore(float(os.environ['BENCH_BATCH_LATENCY_MS']))
+    seed(client, int(os.environ['BENCH_BATCH_DAYS']), int(os.environ['BENCH_BATCH_STATIONS']))
+    app.warmup_done.wait(30)
+    app.storage = app.FirestoreStorage(client)
+    return app.app
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def get(url, timeout=60):
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, b''
+    except (urllib.error.URLError, ConnectionError):
+        return None, b''
+
+def start_server(args, env):
+    """Start one worker serving the app, returning (process, base URL, server name)"""
+    port = free_port()
+    try:
+        import gunicorn  # noqa: F401
+        command = [sys.executable, '-m', 'gunicorn', 'bench_batch:create_app()', '--chdir', os.path.dirname(os.path.abspath(__file__)),
+                   '--bind', f"127.0.0.1:{port}", '--workers', '1', '--worker-class', args.worker_class, '--timeout', '120']
+        if args.worker_class == 'gevent':
+            command += ['--worker-connections', '2000']
+        elif args.worker_class == 'gthread':
+            command += ['--threads', '8']
+        server = f"gunicorn {args.worker_class}"
+    except ImportError:
+        command = [sys.executable, os.path.abspath(__file__), '--serve', str(port)]
+        server = 'werkzeug threaded (gunicorn not installed)'
+    process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if get(f"{url}/health", timeout=2)[0] is not None:
+            return process, url, server
+        time.sleep(0.05)
+    process.kill()
+    raise RuntimeError(f"{server} did not start")
+
+def serve(port):
+    from werkzeug.serving import make_server
+    make_server('127.0.0.1', port, create_app(), threaded=True).serve_forever()
+
+class HealthProbe:
+    """Polls /health in the background and keeps the worst latency"""
+
+    def __init__(self, url, interval=0.005):
+        self.url = url
+        self.interval = interval
+        self.latencies = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            started = time.perf_counter()
+            get(f"{self.url}/health", timeout=30)
+            self.latencies.append((time.perf_counter() - started) * 1000)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+def load(url, mode, days):
+    """Fetch every source and day once, returning the wall time in milliseconds"""
+    dates = [(FIRST_DAY + timedelta(days=offset)).isoformat() for offset in range(days)]
+    started = time.perf_counter()
+    if mode == 'batch':
+        status, body = get(f"{url}/batch?source=water_level,rainfall&from={dates[0]}&to={dates[-1]}")
+        results = json.loads(body)['results'] if status == 200 else {}
+        assert all(len(results.get(source, {})) == days for source in SOURCES), f"/batch returned {status}"
+    else:
+        paths = {'water_level': 'water-level', 'rainfall': 'rainfall'}
+        for source in SOURCES:
+            for day in dates:
+                status, _ = get(f"{url}/{paths[source]}?date={day}")
+                assert status == 200, f"?date={day} returned {status}"
+    return (time.perf_counter() - started) * 1000
+
+def run_once(args, mode):
+    workdir = tempfile.mkdtemp(prefix='bench-batch-')
+    env = dict(os.environ,
+               PYTHONPATH=ROOT,
+               SCRAPERS_ENABLED='0',
+               STORAGE_BACKEND='none',
+               HISTORY_DB_PATH='',
+               SNAPSHOT_DIR='',
+               SHARED_STATE_DIR=workdir,
+               BENCH_BATCH_LATENCY_MS=str(args.latency),
+               BENCH_BATCH_DAYS=str(args.days),
+               BENCH_BATCH_STATIONS=str(args.stations))
+    process, url, server = start_server(args, env)
+    try:
+        with HealthProbe(url) as probe:
+            cold = load(url, mode, args.days)
+        warm = load(url, mode, args.days)
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+    return server, {'cold_ms': cold, 'warm_ms': warm,
+                    'health_max_ms': max(probe.latencies) if probe.latencies else None}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--days', type=int, default=14, help='Days per source (at most BATCH_MAX_DATES)')
+    parser.add_argument('--stations', type=int, default=400)
+    parser.add_argument('--latency', type=float, default=30, help='Milliseconds per stand-in Firestore round-trip')
+    parser.add_argument('--worker-class', default='gevent', help='Gunicorn worker class (default gevent, as deployed)')
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+    parser.add_argument('--serve', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve)
+        return 0
+
+    report = {'days': args.days, 'stations': args.stations, 'latency_ms': args.latency, 'modes': {}}
+    for mode in ('per-date', 'batch'):
+        samples = []
+        for _ in range(args.runs):
+            report['server'], sample = run_once(args, mode)
+            samples.append(sample)
+        report['modes'][mode] = {
+            key: round(statistics.median(sample[key] for sample in samples), 1)
+            for key in ('cold_ms', 'warm_ms', 'health_max_ms')
+        }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return 0
+    print(f"{report['server']}, {args.days} days x {len(SOURCES)} sources, {args.stations} stations, "
+          f"{args.latency:g} ms per stand-in round-trip, median of {args.runs} runs")
+    print(f"{'mode':<10} {'cold ms':>10} {'warm ms':>10} {'/health max ms':>15}")
+    for mode, stats in report['modes'].items():
+        print(f"{mode:<10} {stats['cold_ms']:>10.1f} {stats['warm_ms']:>10.1f} {stats['health_max_ms']:>15.1f}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
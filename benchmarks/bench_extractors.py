@@ -0,0 +1,101 @@
+"""Micro-benchmark comparing the table extractors on saved PAGASA pages.
+
+Usage:
+    python benchmarks/bench_extractors.py [--iterations N] [page.html ...]
+
+Pages whose file name starts with "water" are parsed as the water level
+table, "rainfall" pages as the rainfall table. Every extractor must produce
+exactly the same rows as the BeautifulSoup reference before it is timed.
+"""
+import argparse
+import glob
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Only the extractors are measured, so keep the app away from storage and local state
+os.environ.update({
+    'SCRAPERS_ENABLED': '0',
+    'HISTORY_DB_PATH': '',
+    'SNAPSHOT_DIR': '',
+    'STORAGE_BACKEND': 'none',
+    'SHARED_STATE_DIR': tempfile.mkdtemp(prefix='bench-extractors-')
+})
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import app  # noqa: E402
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+def source_for_page(path):
+    """Pick the scrape source matching a fixture file name"""
+    name = os.path.basename(path)
+    if name.startswith('water'):
+        return app.SOURCES_BY_NAME['water_level']
+    if name.startswith('rainfall'):
+        return app.SOURCES_BY_NAME['rainfall']
+    return None
+
+def measure_latency(extractor, html, source, iterations):
+    """Return per-call latencies in milliseconds"""
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        extractor.extract(html, source)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+def measure_allocations(extractor, html, source):
+    """Return (peak bytes, allocated blocks still referenced by the result) for one call"""
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    before = tracemalloc.take_snapshot()
+    result = extractor.extract(html, source)
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, 'filename') if stat.count_diff > 0)
+    del result
+    return peak, blocks
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('pages', nargs='*', help='HTML pages to parse (default: benchmarks/fixtures/*.html)')
+    parser.add_argument('--iterations', type=int, default=200)
+    args = parser.parse_args()
+    
+    pages = args.pages or sorted(glob.glob(os.path.join(FIXTURES_DIR, '*.html')))
+    extractors = [app.BeautifulSoupExtractor()]
+    if app.lxml_html is not None:
+        extractors.append(app.LxmlExtractor())
+    else:
+        print("lxml is not installed, only the BeautifulSoup extractor will be measured")
+    
+    print(f"{'page':<32} {'extractor':<10} {'rows':>5} {'mean ms':>9} {'p50 ms':>8} {'p95 ms':>8} {'peak KiB':>9} {'blocks':>7}")
+    for path in pages:
+        source = source_for_page(path)
+        if source is None:
+            continue
+        with open(path, encoding='utf-8') as f:
+            html = f.read()
+        
+        reference = extractors[0].extract(html, source)
+        for extractor in extractors:
+            result = extractor.extract(html, source)
+            if result != reference:
+                print(f"{os.path.basename(path)}: {extractor.name} output differs from the BeautifulSoup reference")
+                return 1
+            
+            timings = measure_latency(extractor, html, source, args.iterations)
+            peak, blocks = measure_allocations(extractor, html, source)
+            p95 = statistics.quantiles(timings, n=20)[-1] if len(timings) > 1 else timings[0]
+            print(f"{os.path.basename(path):<32} {extractor.name:<10} {len(result[0] or []):>5} "
+                  f"{statistics.mean(timings):>9.3f} {statistics.median(timings):>8.3f} {p95:>8.3f} "
+                  f"{peak / 1024:>9.1f} {blocks:>7}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
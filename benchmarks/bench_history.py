@@ -0,0 +1,122 @@
+"""History query benchmark: a month of every station through /water-level/history.
+
+Usage:
+    python benchmarks/bench_history.py [--days 30] [--stations 24] [--interval 5]
+                                       [--buckets 1h,1d] [--runs 20] [--target-ms 100] [--json]
+
+Fills a fresh history store with --days finished days of readings every
+--interval minutes for every station and compacts them into segments, then
+requests the whole window for all stations through the app's history
+endpoint (in process, through Flask's test client). The first request after
+the store is opened is reported separately from the median of the following
+ones. A correction is then appended to a day in the middle of the window and
+compacted, and the first request after it shows the cost of refreshing one
+day. Exits non-zero if the median of any bucket size is over --target-ms.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+def fill(app, store, days, stations, interval):
+    """Append a reading for every station every interval minutes over the finished days before today"""
+    source = app.SOURCES_BY_NAME['water_level']
+    rng = random.Random(0)
+    today = datetime.now(app.PAGASA_TZ).replace(hour=0, minute=0, second=0, microsecond=0)
+    first = today - timedelta(days=days)
+    for k in range(days * 24 * 60 // interval):
+        search_time = (first + timedelta(minutes=k * interval)).strftime('%Y-%m-%d %H:%M')
+        rows = [
+            dict(zip(source['columns'], [f"Station {i}", f"{rng.uniform(0, 20):.2f}"] + ['0'] * (len(source['columns']) - 2)))
+            for i in range(stations)
+        ]
+        store.append(app.TableSnapshot.from_rows(source, rows, search_time))
+    store.compact()
+    return first
+
+def timed_get(client, url):
+    started = time.perf_counter()
+    response = client.get(url)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    assert response.status_code == 200, f"{url} returned {response.status_code}"
+    return elapsed_ms, len(response.data)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--stations', type=int, default=24)
+    parser.add_argument('--interval', type=int, default=5, help='Minutes between readings')
+    parser.add_argument('--buckets', default='1h,1d', help='Comma separated bucket sizes to request')
+    parser.add_argument('--runs', type=int, default=20, help='Timed requests per bucket size after the first')
+    parser.add_argument('--target-ms', type=float, default=100)
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench-history-')
+    os.environ.update({
+        'SCRAPERS_ENABLED': '0',
+        'HISTORY_DB_PATH': '',
+        'SNAPSHOT_DIR': '',
+        'STORAGE_BACKEND': 'none',
+        'SHARED_STATE_DIR': workdir
+    })
+    import app
+
+    path = os.path.join(workdir, 'history.sqlite3')
+    started = time.perf_counter()
+    first = fill(app, app.HistoryStore(path), args.days, args.stations, args.interval)
+    fill_s = time.perf_counter() - started
+    # Query through a store opened afresh, as a worker that didn't write the history would
+    app.history_store = app.HistoryStore(path)
+    client = app.app.test_client()
+    client.get('/health')  # Keep Flask's own first-request setup out of the first timing
+    window = f"from={first.strftime('%Y-%m-%d')}&to={int(first.timestamp()) + args.days * 86400 - 1}"
+
+    report = {'days': args.days, 'stations': args.stations, 'interval_min': args.interval,
+              'segments': app.history_store.get_stats()['segments'], 'fill_s': round(fill_s, 1),
+              'target_ms': args.target_ms, 'buckets': {}}
+    for bucket in [bucket.strip() for bucket in args.buckets.split(',') if bucket.strip()]:
+        url = f"/water-level/history?{window}&bucket={bucket}"
+        first_ms, size = timed_get(client, url)
+        timings = [timed_get(client, url)[0] for _ in range(args.runs)]
+        report['buckets'][bucket] = {
+            'first_ms': round(first_ms, 1),
+            'median_ms': round(statistics.median(timings), 1),
+            'max_ms': round(max(timings), 1),
+            'bytes': size
+        }
+
+    # A late correction for one day in the window, compacted into its segments
+    source = app.SOURCES_BY_NAME['water_level']
+    corrected = (first + timedelta(days=args.days // 2, hours=12)).strftime('%Y-%m-%d %H:%M')
+    rows = [dict(zip(source['columns'], [f"Station {i}", '1.00'] + ['0'] * (len(source['columns']) - 2)))
+            for i in range(args.stations)]
+    app.history_store.append(app.TableSnapshot.from_rows(source, rows, corrected))
+    app.history_store.compact()
+    for bucket in report['buckets']:
+        report['buckets'][bucket]['after_correction_ms'] = round(
+            timed_get(client, f"/water-level/history?{window}&bucket={bucket}")[0], 1)
+
+    over = [bucket for bucket, stats in report['buckets'].items() if stats['median_ms'] > args.target_ms]
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{args.days} days x {args.stations} stations every {args.interval} min, {report['segments']} segments "
+              f"(filled in {report['fill_s']} s), median of {args.runs} requests, target {args.target_ms:g} ms")
+        print(f"{'bucket':<8} {'first ms':>9} {'median ms':>10} {'max ms':>8} {'corrected ms':>13} {'KB':>7}")
+        for bucket, stats in report['buckets'].items():
+            print(f"{bucket:<8} {stats['first_ms']:>9.1f} {stats['median_ms']:>10.1f} {stats['max_ms']:>8.1f} "
+                  f"{stats['after_correction_ms']:>13.1f} {stats['bytes'] / 1024:>7.0f}")
+        if over:
+            print(f"Over the {args.target_ms:g} ms target: {', '.join(over)}")
+    return 1 if over else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
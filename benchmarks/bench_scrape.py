@@ -0,0 +1,201 @@
+"""End-to-end scrape benchmark against the local PAGASA stand-in server.
+
+Usage:
+    python benchmarks/bench_scrape.py [--cycles N] [--paths http,selenium] [--size small|large]
+                                      [--latency MS] [--jitter MS] [--render server|js]
+                                      [--render-delay MS] [--render-chunks N] [--json]
+
+Starts benchmarks/fixture_server.py in-process, points the app at it and runs
+full scrape cycles (fetch, parse, hash, delta, publish, history) through the
+plain HTTP and the Selenium paths. Reports per-phase latency, throughput,
+peak RSS of this process and its children (Chrome included) and the largest
+number of Chrome processes seen. Needs no network access. The Selenium path
+needs a local Chrome and chromedriver and is skipped when none can be started.
+With --render js the HTTP path finds an empty table, as on a page that
+renders client-side.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from fixture_server import FixtureServer, add_server_arguments  # noqa: E402
+
+def process_tree(pid):
+    """Return [(pid, command name, rss bytes)] for a process and all of its descendants (Linux only)"""
+    page_size = os.sysconf('SC_PAGE_SIZE')
+    children = {}
+    names = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                stat = f.read()
+            names[int(entry)] = stat[stat.index('(') + 1:stat.rindex(')')]
+            ppid = int(stat.rsplit(')', 1)[1].split()[1])
+            children.setdefault(ppid, []).append(int(entry))
+        except (OSError, ValueError, IndexError):
+            continue
+
+    tree = []
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f'/proc/{current}/statm') as f:
+                rss = int(f.read().split()[1]) * page_size
+        except (OSError, ValueError, IndexError):
+            continue
+        tree.append((current, names.get(current, ''), rss))
+        pending.extend(children.get(current, []))
+    return tree
+
+class ResourceSampler:
+    """Samples the RSS and Chrome process count of this process tree in the background"""
+
+    def __init__(self, interval=0.1):
+        self.interval = interval
+        self.peak_rss = 0
+        self.peak_chrome = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def sample(self):
+        tree = process_tree(os.getpid())
+        self.peak_rss = max(self.peak_rss, sum(rss for _, _, rss in tree))
+        self.peak_chrome = max(self.peak_chrome, sum(1 for _, name, _ in tree if 'chrome' in name.lower()))
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def __enter__(self):
+        self.sample()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.sample()
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def run_path(app, path, cycles):
+    """Run scrape cycles with one fetch mode and return the measurements"""
+    app.FETCH_MODE = path
+    with app.fetch_modes_lock:
+        app.source_fetch_modes.clear()
+    if path == 'selenium':
+        driver = app.driver_pool.acquire()
+        if driver is None:
+            return {'path': path, 'skipped': 'no webdriver could be started'}
+        app.driver_pool.release(driver, discard=True)
+
+    app.recent_scrapes = deque()
+    with ResourceSampler() as sampler:
+        started = time.perf_counter()
+        for _ in range(cycles):
+            app.scrape_due_sources(app.SCRAPE_SOURCES)
+        elapsed = time.perf_counter() - started
+        app.driver_pool.shutdown()
+
+    phases = {}
+    results = {}
+    for cycle in app.recent_scrapes:
+        for phase in cycle['phases']:
+            phases.setdefault(phase['phase'], []).append(phase['ms'])
+        for result in cycle['results'].values():
+            results[result] = results.get(result, 0) + 1
+    pages = cycles * len(app.SCRAPE_SOURCES)
+    succeeded = sum(count for result, count in results.items() if not result.startswith('failed'))
+    return {
+        'path': path,
+        'cycles': cycles,
+        'seconds': round(elapsed, 3),
+        'pages_per_second': round(succeeded / elapsed, 2) if elapsed else None,
+        'cycle_ms': {
+            'mean': round(statistics.mean(cycle['duration_ms'] for cycle in app.recent_scrapes), 1),
+            'p95': round(percentile([cycle['duration_ms'] for cycle in app.recent_scrapes], 0.95), 1)
+        },
+        'results': results,
+        'failed_pages': pages - succeeded,
+        'peak_rss_mb': round(sampler.peak_rss / 1024 / 1024, 1),
+        'peak_chrome_processes': sampler.peak_chrome,
+        'phases': {
+            phase: {
+                'count': len(values),
+                'mean_ms': round(statistics.mean(values), 2),
+                'p50_ms': round(statistics.median(values), 2),
+                'p95_ms': round(percentile(values, 0.95), 2),
+                'max_ms': round(max(values), 2)
+            }
+            for phase, values in phases.items()
+        }
+    }
+
+def print_report(report):
+    if 'skipped' in report:
+        print(f"\n{report['path']}: skipped, {report['skipped']}")
+        return
+    print(f"\n{report['path']}: {report['cycles']} cycles in {report['seconds']}s, "
+          f"{report['pages_per_second']} pages/s, cycle mean {report['cycle_ms']['mean']} ms "
+          f"(p95 {report['cycle_ms']['p95']} ms)")
+    print(f"results {report['results']}, peak RSS {report['peak_rss_mb']} MiB, "
+          f"peak Chrome processes {report['peak_chrome_processes']}")
+    print(f"{'phase':<16} {'count':>6} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}")
+    for phase, stats in report['phases'].items():
+        print(f"{phase:<16} {stats['count']:>6} {stats['mean_ms']:>9.2f} {stats['p50_ms']:>9.2f} "
+              f"{stats['p95_ms']:>9.2f} {stats['max_ms']:>9.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cycles', type=int, default=10)
+    parser.add_argument('--paths', default='http,selenium', help='Comma separated fetch modes to run (http, selenium, auto)')
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    server = FixtureServer(size=args.size, latency_ms=args.latency, jitter_ms=args.jitter, render=args.render,
+                           render_delay_ms=args.render_delay, render_chunks=args.render_chunks, vary=True).start()
+    workdir = tempfile.mkdtemp(prefix='bench-scrape-')
+    os.environ.update({
+        'PAGASA_BASE_URL': server.base_url,
+        'SCRAPERS_ENABLED': '0',
+        'HISTORY_DB_PATH': os.path.join(workdir, 'history.sqlite3'),
+        'SNAPSHOT_DIR': os.path.join(workdir, 'snapshots'),
+        'STORAGE_BACKEND': 'none',
+        'SHARED_STATE_DIR': workdir
+    })
+    import app
+
+    reports = []
+    try:
+        for path in [path.strip() for path in args.paths.split(',') if path.strip()]:
+            report = run_path(app, path, args.cycles)
+            report['server'] = {'size': args.size, 'latency_ms': args.latency, 'jitter_ms': args.jitter,
+                                'render': args.render, 'render_delay_ms': args.render_delay}
+            reports.append(report)
+            if not args.json:
+                print_report(report)
+    finally:
+        server.stop()
+
+    if args.json:
+        print(json.dumps(reports, indent=2))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,193 @@
+"""Startup benchmark: time from process start to the first served request.
+
+Usage:
+    python benchmarks/bench_startup.py [--runs N] [--storage memory|sqlite|firestore|none]
+                                       [--fetch-mode http|selenium|auto] [--no-scrapers]
+                                       [--latency MS] [--restore] [--timeout S] [--json]
+
+Starts the app in a fresh process behind werkzeug's server (a single worker,
+like one gunicorn worker) and polls it from the moment the process is spawned.
+Reports the time until /health first answers, until it stops reporting
+"warming" and until /water-level first returns data, along with the time
+spent importing the app module. Scrapers run against the local PAGASA
+stand-in (benchmarks/fixture_server.py), so no network access is needed.
+With --restore the runs share a snapshot directory seeded by one uncounted
+run, so /water-level is first answered from the restored (stale) snapshot;
+combine it with a large --latency to keep the first scrape out of the way.
+With --no-scrapers and no --restore nothing ever publishes data, so the
+time to first data is reported as n/a instead of waiting out --timeout.
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fixture_server import FixtureServer  # noqa: E402
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+def serve(port):
+    """Child process: import the app, report the import time and serve it"""
+    started = time.perf_counter()
+    import app
+    import_ms = (time.perf_counter() - started) * 1000
+    from werkzeug.serving import make_server
+    server = make_server('127.0.0.1', port, app.app, threaded=True)
+    print(json.dumps({'import_ms': round(import_ms, 1)}), flush=True)
+    server.serve_forever()
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def get(url):
+    """Return (status, parsed JSON body), or None if nothing is listening yet"""
+    try:
+        with urllib.request.urlopen(url, timeout=5) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, None
+    except (urllib.error.URLError, ConnectionError):
+        return None
+
+def expects_data(args):
+    """Return whether /water-level will ever return data: a scrape or a restored snapshot"""
+    return not args.no_scrapers or args.restore
+
+def run_once(args, base_url, snapshot_dir):
+    """Start one app process and return its startup timings in milliseconds"""
+    workdir = tempfile.mkdtemp(prefix='bench-startup-')
+    env = dict(os.environ,
+               SNAPSHOT_DIR=snapshot_dir or os.path.join(workdir, 'snapshots'),
+               PYTHONPATH=ROOT,
+               PAGASA_BASE_URL=base_url,
+               FETCH_MODE=args.fetch_mode,
+               STORAGE_BACKEND=args.storage,
+               STORAGE_SQLITE_PATH=os.path.join(workdir, 'storage.sqlite3'),
+               HISTORY_DB_PATH=os.path.join(workdir, 'history.sqlite3'),
+               SHARED_STATE_DIR=workdir,
+               SCRAPERS_ENABLED='0' if args.no_scrapers else '1')
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    timings = {'first_response_ms': None, 'ready_ms': None, 'first_data_ms': None, 'import_ms': None,
+               'stale_data': None}
+    measures = ['first_response_ms', 'ready_ms'] + (['first_data_ms'] if expects_data(args) else [])
+
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--serve', str(port)],
+                               env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    deadline = started + args.timeout
+    try:
+        while time.perf_counter() < deadline and any(timings[key] is None for key in measures):
+            if process.poll() is not None:
+                break
+            elapsed = round((time.perf_counter() - started) * 1000, 1)
+            health = get(f"{url}/health")
+            if health is None:
+                time.sleep(0.005)
+                continue
+            if timings['first_response_ms'] is None:
+                timings['first_response_ms'] = elapsed
+            if timings['ready_ms'] is None and (health[1] or {}).get('status') != 'warming':
+                timings['ready_ms'] = elapsed
+            if 'first_data_ms' in measures and timings['first_data_ms'] is None:
+                data = get(f"{url}/water-level")
+                if data is not None and data[0] == 200:
+                    timings['first_data_ms'] = round((time.perf_counter() - started) * 1000, 1)
+                    timings['stale_data'] = bool(data[1].get('stale'))
+            time.sleep(0.02)
+    finally:
+        process.terminate()
+        try:
+            output, _ = process.communicate(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            output, _ = process.communicate()
+    for line in output.splitlines():
+        if line.startswith('{'):
+            timings['import_ms'] = json.loads(line)['import_ms']
+    return timings
+
+def summarize(runs, measured):
+    summary = {}
+    for key in ('first_response_ms', 'ready_ms', 'first_data_ms', 'import_ms'):
+        if key not in measured:
+            summary[key] = None
+            continue
+        values = [run[key] for run in runs if run[key] is not None]
+        summary[key] = {
+            'median': round(statistics.median(values), 1) if values else None,
+            'min': min(values) if values else None,
+            'max': max(values) if values else None,
+            'missing': len(runs) - len(values)
+        }
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--storage', default='memory', help='STORAGE_BACKEND of the app (default memory)')
+    parser.add_argument('--fetch-mode', default='http', help='FETCH_MODE of the app (default http)')
+    parser.add_argument('--no-scrapers', action='store_true', help='Start the app with SCRAPERS_ENABLED=0')
+    parser.add_argument('--latency', type=float, default=0, help='Response latency of the PAGASA stand-in in milliseconds')
+    parser.add_argument('--restore', action='store_true', help='Start from snapshot files saved by a previous run')
+    parser.add_argument('--timeout', type=float, default=120, help='Seconds to wait for each run')
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+    parser.add_argument('--serve', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve)
+        return 0
+
+    server = FixtureServer(latency_ms=args.latency).start()
+    snapshot_dir = tempfile.mkdtemp(prefix='bench-startup-snapshots-') if args.restore else None
+    try:
+        if args.restore:
+            # Seed the snapshot files, waiting out the stand-in's latency
+            seed_args = argparse.Namespace(**dict(vars(args), no_scrapers=False, timeout=args.timeout + args.latency / 1000))
+            run_once(seed_args, server.base_url, snapshot_dir)
+        runs = [run_once(args, server.base_url, snapshot_dir) for _ in range(args.runs)]
+    finally:
+        server.stop()
+    measured = ['first_response_ms', 'ready_ms', 'import_ms'] + (['first_data_ms'] if expects_data(args) else [])
+    report = {
+        'runs': args.runs,
+        'storage': args.storage,
+        'fetch_mode': args.fetch_mode,
+        'scrapers': not args.no_scrapers,
+        'restore': args.restore,
+        'latency_ms': args.latency,
+        'summary': summarize(runs, measured),
+        'samples': runs
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return 0
+    print(f"{args.runs} runs, storage {args.storage}, fetch mode {args.fetch_mode}, "
+          f"scrapers {'off' if args.no_scrapers else 'on'}, restore {'on' if args.restore else 'off'}, "
+          f"stand-in latency {args.latency:g} ms")
+    print(f"{'measure':<20} {'median ms':>10} {'min ms':>10} {'max ms':>10} {'missing':>8}")
+    for key, stats in report['summary'].items():
+        if stats is None:
+            print(f"{key:<20} {'n/a':>10}")
+            continue
+        cells = [f"{stats[name]:>10.1f}" if stats[name] is not None else f"{'-':>10}" for name in ('median', 'min', 'max')]
+        print(f"{key:<20} {' '.join(cells)} {stats['missing']:>8}")
+    if expects_data(args):
+        print(f"first data was stale in {sum(1 for run in runs if run['stale_data'])} of {len(runs)} runs")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
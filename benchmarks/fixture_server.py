@@ -0,0 +1,218 @@
+"""Local stand-in for the PAGASA flood forecasting site.
+
+Serves the fixture pages in benchmarks/fixtures/ as water/table.do and
+rainfall/table.do so the scrapers can be benchmarked without network access.
+
+Usage:
+    python benchmarks/fixture_server.py [--port 8765] [--size small|large] [--latency MS] [--jitter MS]
+                                        [--render server|js] [--render-delay MS] [--render-chunks N] [--vary]
+    python benchmarks/fixture_server.py --write-fixtures [--stations 400]
+
+Point the app at it with PAGASA_BASE_URL=http://127.0.0.1:8765. With
+--render js the table arrives empty and is filled in by a script after
+--render-delay milliseconds (optionally in several chunks), as on a page
+that renders client-side, so only the Selenium path can read it. --vary
+perturbs the readings and advances the search time on every request, so
+each scrape publishes a new snapshot.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+PAGES = {
+    '/water/table.do': 'water_table',
+    '/rainfall/table.do': 'rainfall_table'
+}
+
+ROW_PATTERN = re.compile(r'<tr>\s*<th scope="row">.*?</tr>\s*', re.S)
+STATION_PATTERN = re.compile(r'(<th scope="row">(?:<a [^>]*>)?)([^<]+)')
+CELL_PATTERN = re.compile(r'(<td[^>]*>)(-?\d+(?:\.\d+)?)(</td>)')
+SEARCH_TIME_PATTERN = re.compile(r'(<div class="search-time">)([^<]*)(</div>)')
+TBODY_PATTERN = re.compile(r'(<tbody>\s*)(.*?)(\s*</tbody>)', re.S)
+
+def load_fixture(name, size='small'):
+    """Return a fixture page; large pages fall back to scaling the small one"""
+    if size == 'large':
+        path = os.path.join(FIXTURES_DIR, f'{name}_large.html')
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                return f.read()
+    with open(os.path.join(FIXTURES_DIR, f'{name}.html'), encoding='utf-8') as f:
+        html = f.read()
+    return scale_page(html, 400) if size == 'large' else html
+
+def scale_page(html, stations):
+    """Repeat the table rows of a page until it has the given number of stations"""
+    body = TBODY_PATTERN.search(html)
+    rows = ROW_PATTERN.findall(body.group(2))
+    rng = random.Random(stations)
+    scaled = []
+    for i in range(stations):
+        row = rows[i % len(rows)]
+        copy = i // len(rows)
+        if copy:
+            row = STATION_PATTERN.sub(lambda m: f"{m.group(1)}{m.group(2)} {copy + 1}", row, count=1)
+            row = CELL_PATTERN.sub(lambda m: f"{m.group(1)}{float(m.group(2)) + rng.uniform(0, 1):.2f}{m.group(3)}", row)
+        scaled.append(row)
+    return html[:body.start(2)] + ''.join(scaled).rstrip() + html[body.end(2):]
+
+def vary_page(html, request_number):
+    """Perturb every reading and advance the search time for one request"""
+    rng = random.Random(request_number)
+    html = CELL_PATTERN.sub(lambda m: f"{m.group(1)}{max(0.0, float(m.group(2)) + rng.uniform(-0.05, 0.05)):.2f}{m.group(3)}", html)
+
+    def advance(match):
+        try:
+            base = datetime.strptime(match.group(2).strip(), "%Y-%m-%d %H:%M")
+        except ValueError:
+            return match.group(0)
+        return f"{match.group(1)}{(base + timedelta(minutes=10 * request_number)):%Y-%m-%d %H:%M}{match.group(3)}"
+    return SEARCH_TIME_PATTERN.sub(advance, html)
+
+def client_rendered(html, delay_ms, chunks):
+    """Move the table rows and search time into a script that inserts them after a delay"""
+    body = TBODY_PATTERN.search(html)
+    rows = ROW_PATTERN.findall(body.group(2))
+    search_time = SEARCH_TIME_PATTERN.search(html)
+    html = html[:body.start(2)] + html[body.end(2):]
+    html = SEARCH_TIME_PATTERN.sub(r'\1\3', html)
+
+    chunk_size = max(1, -(-len(rows) // max(1, chunks)))
+    parts = [''.join(rows[i:i + chunk_size]) for i in range(0, len(rows), chunk_size)]
+    script = f"""<script type="text/javascript">
+    (function() {{
+        var parts = {json.dumps(parts)};
+        var searchTime = {json.dumps(search_time.group(2) if search_time else '')};
+        parts.forEach(function(part, i) {{
+            setTimeout(function() {{
+                document.querySelector('table.table-type1 tbody').insertAdjacentHTML('beforeend', part);
+                document.querySelector('.search-time').textContent = searchTime;
+            }}, {int(delay_ms)} + i * 200);
+        }});
+    }})();
+</script>
+</body>"""
+    return html.replace('</body>', script, 1)
+
+class FixtureServer:
+    """Threaded HTTP server serving the PAGASA table fixtures"""
+
+    def __init__(self, host='127.0.0.1', port=0, size='small', latency_ms=0, jitter_ms=0,
+                 render='server', render_delay_ms=1000, render_chunks=1, vary=False):
+        self.pages = {path: load_fixture(name, size) for path, name in PAGES.items()}
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.render = render
+        self.render_delay_ms = render_delay_ms
+        self.render_chunks = render_chunks
+        self.vary = vary
+        self.requests = 0
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def page(self, path):
+        """Return the body served for a path, or None for unknown paths"""
+        html = self.pages.get(path.split('?', 1)[0])
+        if html is None:
+            return None
+        with self._lock:
+            self.requests += 1
+            request_number = self.requests
+        if self.vary:
+            html = vary_page(html, request_number)
+        if self.render == 'js':
+            html = client_rendered(html, self.render_delay_ms, self.render_chunks)
+        return html.encode('utf-8')
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                delay = server.latency_ms + random.uniform(0, server.jitter_ms)
+                if delay:
+                    time.sleep(delay / 1000)
+                body = server.page(self.path)
+                if body is None:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html;charset=UTF-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='fixture-server')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+def write_large_fixtures(stations):
+    """Write the large synthetic variants next to the recorded fixtures"""
+    for name in PAGES.values():
+        with open(os.path.join(FIXTURES_DIR, f'{name}.html'), encoding='utf-8') as f:
+            html = f.read()
+        path = os.path.join(FIXTURES_DIR, f'{name}_large.html')
+        with open(path, 'w', encoding='utf-8', newline='\n') as f:
+            f.write(scale_page(html, stations))
+        print(f"Wrote {path} ({stations} stations)")
+
+def add_server_arguments(parser):
+    parser.add_argument('--size', choices=('small', 'large'), default='small')
+    parser.add_argument('--latency', type=float, default=0, help='Response latency in milliseconds')
+    parser.add_argument('--jitter', type=float, default=0, help='Random extra latency in milliseconds')
+    parser.add_argument('--render', choices=('server', 'js'), default='server')
+    parser.add_argument('--render-delay', type=float, default=1000, help='Milliseconds before the script inserts the table')
+    parser.add_argument('--render-chunks', type=int, default=1, help='Insert the rows in this many steps')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--vary', action='store_true', help='Change the readings on every request')
+    parser.add_argument('--write-fixtures', action='store_true', help='Write the large fixture pages and exit')
+    parser.add_argument('--stations', type=int, default=400, help='Stations in the large fixture pages')
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    if args.write_fixtures:
+        write_large_fixtures(args.stations)
+        return 0
+
+    server = FixtureServer(args.host, args.port, args.size, args.latency, args.jitter,
+                           args.render, args.render_delay, args.render_chunks, args.vary)
+    print(f"Serving PAGASA fixtures at {server.base_url} (Ctrl+C to stop)")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+    return 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,33 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Keep the app away from Firestore, Chrome and the data/ directory before it is imported
+os.environ.update({
+    'SCRAPERS_ENABLED': '0',
+    'STORAGE_BACKEND': 'none',
+    'HISTORY_DB_PATH': '',
+    'SNAPSHOT_DIR': '',
+    'SHARED_STATE_DIR': tempfile.mkdtemp(prefix='floodpath-tests-')
+})
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+@pytest.fixture(scope='session')
+def app_module():
+    import app
+    app.warmup_done.wait(10)
+    return app
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+def water_rows(levels):
+    """Water level rows for stations S0, S1, ... with the given current levels"""
+    return [
+        {'station': f"S{i}", 'current_wl': f"{level:.2f}", 'wl_30min': '0', 'wl_1hr': '0',
+         'alert_level': '10', 'alarm_level': '11', 'critical_level': '12'}
+        for i, level in enumerate(levels)
+    ]
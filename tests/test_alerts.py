@@ -0,0 +1,32 @@
+import json
+
+from conftest import water_rows
+
+def snapshot(app_module, levels, version, search_time='2026-10-17 10:00'):
+    snapshot = app_module.TableSnapshot.from_rows(app_module.SOURCES_BY_NAME['water_level'], water_rows(levels), search_time)
+    snapshot.version = version
+    return snapshot
+
+def test_levels_and_transitions(app_module):
+    # Thresholds are alert 10, alarm 11 and critical 12 for every station
+    engine = app_module.FloodAlertEngine()
+    transitions = engine.evaluate(snapshot(app_module, [5.0, 10.0, 11.5, 12.0, float('nan')], 1))
+    assert [(t['station'], t['from'], t['to']) for t in transitions] == [
+        ('S1', None, 'alert'), ('S2', None, 'alarm'), ('S3', None, 'critical')
+    ]
+    
+    over = json.loads(engine.over_payload.bodies['identity'])
+    assert [row['station'] for row in over['stations']] == ['S3', 'S2', 'S1']
+    assert over['counts'] == {'unknown': 1, 'normal': 1, 'alert': 1, 'alarm': 1, 'critical': 1}
+    
+    # S4 lost its reading and S3 keeps its last known level, so only real changes count
+    transitions = engine.evaluate(snapshot(app_module, [10.5, 9.0, 11.5, float('nan'), 12.5], 2))
+    assert [(t['station'], t['from'], t['to']) for t in transitions] == [
+        ('S0', 'normal', 'alert'), ('S1', 'alert', 'normal'), ('S4', None, 'critical')
+    ]
+    transitions = engine.evaluate(snapshot(app_module, [10.5, 9.0, 11.5, 11.0, 12.5], 3))
+    assert [(t['station'], t['from'], t['to']) for t in transitions] == [('S3', 'critical', 'alarm')]
+    
+    since, truncated = engine.transitions_since(1)
+    assert [t['version'] for t in since] == [2, 2, 2, 3]
+    assert not truncated
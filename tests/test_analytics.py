@@ -0,0 +1,47 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+from conftest import water_rows
+
+START = 1791000000  # 2026-10-03 09:20 UTC
+
+def snapshot(app_module, levels, t, version):
+    search_time = app_module.datetime.fromtimestamp(t, app_module.PAGASA_TZ).strftime('%Y-%m-%d %H:%M')
+    snapshot = app_module.TableSnapshot.from_rows(app_module.SOURCES_BY_NAME['water_level'], water_rows(levels), search_time)
+    snapshot.version = version
+    return snapshot
+
+def test_running_sums_match_a_recomputation(app_module):
+    rng = np.random.default_rng(0)
+    windows = {'30m': 1800, '2h': 7200}
+    analytics = app_module.RollingAnalytics('water_level', 'current_wl', windows, capacity=16, slopes=True)
+    readings = []
+    # Several laps of the ring, so evictions and rebuilds both happen
+    for k in range(50):
+        t = START + k * 600
+        levels = np.round(rng.uniform(0, 10, 3), 2)
+        if k % 7 == 0:
+            levels[1] = np.nan
+        assert analytics.update(snapshot(app_module, levels.tolist(), t, k))
+        readings.append((t, levels))
+    
+    assert not analytics.update(snapshot(app_module, [1.0, 1.0, 1.0], START, 99))
+    latest = readings[-1][0]
+    for name, seconds in windows.items():
+        window = [(t, levels) for t, levels in readings[-16:] if t > latest - seconds]
+        hours = np.array([(t - latest) / 3600 for t, _ in window])
+        values = np.array([levels for _, levels in window])
+        for i in range(3):
+            present = ~np.isnan(values[:, i])
+            expected = np.polyfit(hours[present], values[present, i], 1)[0]
+            assert abs(analytics.report['data'][f"S{i}"][f"slope_{name}"] - expected) < 1e-3  # Reported to 3 decimals
+        assert analytics.report['windows'][name]['readings'] == len(window)
+    assert analytics.stats['rebuilds'] >= 3
+
+def test_importing_the_app_does_not_load_numpy():
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+    check = "import sys, app; sys.exit('numpy' in sys.modules)"
+    assert subprocess.run([sys.executable, '-c', check], cwd=root, env=dict(os.environ), capture_output=True).returncode == 0
@@ -0,0 +1,39 @@
+import pytest
+
+from conftest import water_rows
+
+@pytest.fixture
+def memory_storage(app_module, monkeypatch):
+    storage = app_module.MemoryStorage()
+    for day in ('2026-10-01', '2026-10-02', '2026-10-03'):
+        storage.write_checkpoint('water_levels', day, {'last_updated': f"{day} 08:00", 'data': water_rows([1.0, 2.0]), 'version': 1})
+    calls = []
+    read_dated_many = storage.read_dated_many
+    storage.read_dated_many = lambda keys: calls.append(list(keys)) or read_dated_many(keys)
+    monkeypatch.setattr(app_module, 'storage', storage)
+    app_module.date_cache._entries.clear()
+    yield calls
+    app_module.date_cache._entries.clear()
+
+def test_batch_reads_every_uncached_date_in_one_call(client, memory_storage):
+    response = client.get('/batch?source=water_level,rainfall&from=2026-10-01&to=2026-10-04')
+    results = response.get_json()['results']
+    
+    assert response.status_code == 200
+    assert len(memory_storage) == 1 and len(memory_storage[0]) == 8
+    assert results['water_level']['2026-10-02']['last_updated'] == '2026-10-02 08:00'
+    assert results['water_level']['2026-10-04'] == {'error': 'No water level data for 2026-10-04'}
+    
+    # Cached now: the same batch reads nothing and is answered with 304
+    again = client.get('/batch?source=water_level,rainfall&from=2026-10-01&to=2026-10-04',
+                       headers={'If-None-Match': response.headers['ETag']})
+    assert again.status_code == 304
+    assert len(memory_storage) == 1
+
+@pytest.mark.parametrize('query', [
+    'date=2026-13-01', 'date=yesterday', 'date=2026-1-5', 'date=2026-10-01,2026-10-1', 'date=%202026-10-01',
+    'from=2026-10-1', 'from=2026-10-01&to=2026-10-4', 'from=latest', 'source=tide', 'from=2026-01-01&to=2026-12-31'
+])
+def test_batch_rejects_bad_parameters(client, memory_storage, query):
+    assert client.get(f'/batch?{query}').status_code == 400
+    assert memory_storage == []
@@ -0,0 +1,47 @@
+import statistics
+
+START = 1767225600  # 2026-01-01 00:00 UTC
+
+def simulate(app, cadence, seconds, delay_for, period=600, start=START):
+    """Drive a cadence like the scheduler does against a source publishing every period.
+    
+    delay_for(t) gives how long after its search time a publication becomes
+    visible. Returns the lag of every publication seen, by day.
+    """
+    t = start
+    seen = None
+    lags = {}
+    while t < start + seconds:
+        # Newest search time whose data is visible at t
+        published = (t // period) * period
+        while published + delay_for(published) > t:
+            published -= period
+        changed = published != seen
+        if changed:
+            lags.setdefault((t - start) // 86400, []).append(t - published)
+            seen = published
+        cadence.observe(published, changed, t, t + 1)
+        t = max(cadence.next_scrape(t + 1), t + 2)
+    return lags
+
+def test_learned_delay_does_not_ratchet(app_module):
+    cadence = app_module.PublicationCadence(300)
+    lags = simulate(app_module, cadence, 30 * 86400, lambda published: 30)
+    
+    assert cadence.availability_delay() <= 30 + app_module.CADENCE_MIN_INTERVAL
+    # Freshness stays close to the real availability delay on the last day too
+    assert statistics.mean(lags[29]) <= 30 + app_module.CADENCE_MIN_INTERVAL + app_module.CADENCE_GRACE
+    assert cadence.get_stats()['wasted_scrape_ratio'] < 0.3
+
+def test_learned_delay_follows_slower_and_faster_publication(app_module):
+    cadence = app_module.PublicationCadence(300)
+    switch = START + 2 * 86400
+    back = START + 4 * 86400
+    lags = simulate(app_module, cadence, 6 * 86400,
+                    lambda published: 150 if switch <= published < back else 30)
+    
+    # Slower: the misses raise the estimate within the day
+    assert statistics.mean(lags[3]) <= 150 + app_module.CADENCE_MIN_INTERVAL + app_module.CADENCE_GRACE
+    # Faster again: the probes bring it back down
+    assert cadence.availability_delay() <= 30 + app_module.CADENCE_MIN_INTERVAL
+    assert statistics.mean(lags[5]) <= 30 + app_module.CADENCE_MIN_INTERVAL + app_module.CADENCE_GRACE
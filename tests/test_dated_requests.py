@@ -0,0 +1,19 @@
+import pytest
+
+@pytest.mark.parametrize('path', ['/water-level', '/rainfall'])
+@pytest.mark.parametrize('date', ['yesterday', '2026-13-01', '2026-1-5', '2026-10-17x', "2026-10-17' OR 1=1"])
+def test_malformed_dates_are_rejected_before_the_cache(app_module, client, monkeypatch, path, date):
+    loads = []
+    monkeypatch.setattr(app_module, 'get_dated_document', lambda *args: loads.append(args))
+    misses = app_module.date_cache.get_stats()['misses']
+    
+    response = client.get(path, query_string={'date': date})
+    assert response.status_code == 400
+    assert loads == []
+    assert app_module.date_cache.get_stats()['misses'] == misses
+
+def test_valid_dates_are_looked_up(app_module, client, monkeypatch):
+    loads = []
+    monkeypatch.setattr(app_module, 'get_dated_document', lambda *args: loads.append(args))
+    client.get('/water-level', query_string={'date': '2026-10-16'})
+    assert loads == [('water_levels', '2026-10-16')]
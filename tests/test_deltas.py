@@ -0,0 +1,58 @@
+import time
+
+from conftest import water_rows
+
+def snapshot(app_module, rows, search_time, previous=None):
+    snapshot = app_module.TableSnapshot.from_rows(app_module.SOURCES_BY_NAME['water_level'], rows, search_time)
+    snapshot.version = app_module.next_version(previous)
+    return snapshot
+
+def edited(rows, changes=None, removed=(), added=(), order=None):
+    rows = [dict(row, **(changes or {}).get(row['station'], {})) for row in rows if row['station'] not in removed]
+    rows += list(added)
+    if order is not None:
+        rows = [next(row for row in rows if row['station'] == station) for station in order]
+    return rows
+
+def test_applying_a_delta_reproduces_the_snapshot(app_module):
+    first = snapshot(app_module, water_rows([1.0, 2.0, 3.0, 4.0]), '2026-10-17 10:00')
+    extra = water_rows([0, 0, 0, 0, 0, 7.5])[5]
+    rows = edited(water_rows([1.0, 2.0, 3.0, 4.0]), {'S1': {'current_wl': '2.50'}},
+                  removed={'S2'}, added=[extra], order=['S5', 'S0', 'S1', 'S3'])
+    second = snapshot(app_module, rows, '2026-10-17 10:10', first)
+    
+    delta = app_module.compute_delta(first, second)
+    assert delta['base_version'] == first.version
+    assert delta['removed'] == ['S2']
+    assert [row['station'] for row in delta['added']] == ['S5']
+    assert delta['changed'] == [{'station': 'S1', 'old': {'current_wl': '2.00'}, 'new': {'current_wl': '2.50'}}]
+    assert delta['order'] == ['S5', 'S0', 'S1', 'S3']
+    assert app_module.apply_delta(first.to_dicts(), delta) == [
+        dict(row, timestamp='2026-10-17 10:10') for row in second.to_dicts()
+    ]
+
+def test_checkpoints_and_deltas_replay_to_the_latest_snapshot(app_module, monkeypatch):
+    storage = app_module.MemoryStorage()
+    monkeypatch.setattr(app_module, 'storage', storage)
+    writer = app_module.StorageWriter(checkpoint_every=2)
+    writer.start()
+    try:
+        previous = None
+        for minute in range(5):
+            current = snapshot(app_module, water_rows([1.0, 2.0 + minute, 3.0]), f"2026-10-17 10:{minute}0", previous)
+            delta = app_module.compute_delta(previous, current) if previous is not None else None
+            writer.enqueue('water_levels', current.to_dicts(), current.search_time, current.version, delta)
+            deadline = time.monotonic() + 5
+            while writer.stats['commits'] < minute + 1 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            previous = current
+    finally:
+        writer.stop(timeout=5)
+    
+    # A checkpoint, two deltas, a checkpoint once they are used up, then one more delta
+    assert writer.stats['commits'] == 5
+    assert writer.stats['checkpoints'] == 2
+    checkpoint, deltas = storage.read_dated('water_levels', '2026-10-17')
+    assert len(deltas) == 1
+    data, last_updated, version, _ = app_module.replay_stored('water_levels', checkpoint, deltas)
+    assert (data, last_updated, version) == (previous.to_dicts(), previous.search_time, previous.version)
@@ -0,0 +1,75 @@
+import os
+import re
+
+import pytest
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks', 'fixtures')
+
+def fixture_page():
+    with open(os.path.join(FIXTURES, 'water_table.html'), encoding='utf-8') as f:
+        return f.read()
+
+def shell_page():
+    """The fixture page with its rows gone and the column headings left in the body, as before a script fills it"""
+    html = fixture_page()
+    headings = re.search(r'<thead>(.*?)</thead>', html, re.DOTALL).group(1)
+    return re.sub(r'<tbody>.*?</tbody>', f"<tbody>{headings}</tbody>", html, flags=re.DOTALL)
+
+def with_noscript(html):
+    return html.replace('<body>', '<body><noscript>Please enable JavaScript to view the table.</noscript>')
+
+PAGES = {
+    'rendered': fixture_page,
+    'shell': shell_page,
+    'no_table': lambda: re.sub(r'<table class="table-type1".*?</table>', '', fixture_page(), flags=re.DOTALL),
+    'noscript': lambda: with_noscript(shell_page()),
+    'loader': lambda: shell_page().replace('<div class="table-wrap">', '<div class="table-wrap"><div class="loading-spinner"></div>'),
+    'rendered_with_banners': lambda: with_noscript(fixture_page()).replace('<div id="wrap">', '<div id="wrap" class="page-loader">'),
+}
+
+class StandInResponse:
+    def __init__(self, text):
+        self.text = text
+    
+    def raise_for_status(self):
+        pass
+
+class StandInSession:
+    def __init__(self, text):
+        self.text = text
+    
+    def get(self, url, timeout=None):
+        return StandInResponse(self.text)
+
+@pytest.fixture
+def fetch(app_module, monkeypatch):
+    """Fetch the water level source from a given page, returning (results, pages handed to Selenium)"""
+    monkeypatch.setattr(app_module, 'FETCH_MODE', 'auto')
+    monkeypatch.setattr(app_module, 'source_fetch_modes', {})
+    
+    def run(page):
+        selenium = []
+        monkeypatch.setattr(app_module, 'get_http_session', lambda: StandInSession(PAGES[page]()))
+        monkeypatch.setattr(app_module, 'fetch_tables_via_selenium',
+                            lambda sources: selenium.extend(source['name'] for source in sources) or {})
+        return app_module.fetch_sources([app_module.SOURCES_BY_NAME['water_level']]), selenium
+    return run
+
+@pytest.mark.parametrize('page', ['rendered', 'rendered_with_banners'])
+def test_server_rendered_rows_stay_on_plain_http(app_module, fetch, page):
+    results, selenium = fetch(page)
+    assert selenium == []
+    assert len(results['water_level'][0]) == 24
+    assert app_module.source_fetch_modes['water_level']['mode'] == 'http'
+
+@pytest.mark.parametrize('page', ['shell', 'no_table', 'noscript', 'loader'])
+def test_pages_that_need_javascript_fall_back_to_selenium(app_module, fetch, page):
+    results, selenium = fetch(page)
+    assert selenium == ['water_level']
+    assert 'water_level' not in results
+    assert app_module.source_fetch_modes['water_level']['mode'] == 'selenium'
+
+@pytest.mark.parametrize('extractor', ['bs4', 'lxml'])
+def test_heading_rows_are_not_data(app_module, extractor):
+    data, _ = app_module.get_table_extractor(extractor).extract(shell_page(), app_module.SOURCES_BY_NAME['water_level'])
+    assert data == []
@@ -0,0 +1,100 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from conftest import water_rows
+
+def snapshot(app_module, levels, search_time):
+    return app_module.TableSnapshot.from_rows(app_module.SOURCES_BY_NAME['water_level'], water_rows(levels), search_time)
+
+def test_compaction_keeps_the_newest_sample_for_a_timestamp(app_module, tmp_path):
+    store = app_module.HistoryStore(str(tmp_path / 'history.sqlite3'))
+    yesterday = (datetime.now(app_module.PAGASA_TZ) - timedelta(days=1)).strftime('%Y-%m-%d')
+    
+    # Appending compacts finished days, so the first reading lands in a segment
+    store.append(snapshot(app_module, [1.0, 2.0], f"{yesterday} 10:00"))
+    store.append(snapshot(app_module, [1.5, 2.0], f"{yesterday} 10:10"))
+    assert store.get_stats()['segments'] == 2
+    
+    # A corrected reading for a time that is already compacted
+    store.append(snapshot(app_module, [9.0, 2.0], f"{yesterday} 10:00"))
+    store.compact()
+    
+    history = store.query('water_level', ['current_wl'], stations=['S0'])
+    ts, values = history['S0']
+    assert list(values[:, 0]) == [9.0, 1.5]
+    assert list(ts) == sorted(ts)
+
+def expected_aggregates(app_module, store, bucket, start, end, stations=None):
+    """Aggregate the raw readings the way the history endpoint did before days were cached"""
+    first_bucket = (start + app_module.BUCKET_OFFSET) // bucket
+    bucket_count = (end + app_module.BUCKET_OFFSET) // bucket - first_bucket + 1
+    return {
+        station: app_module.downsample(ts, values[:, 0], bucket, first_bucket, bucket_count)
+        for station, (ts, values) in store.query('water_level', ['current_wl'], stations, start, end).items()
+        if len(ts)
+    }
+
+def assert_same_aggregates(actual, expected):
+    assert sorted(actual) == sorted(expected)
+    for station, arrays in expected.items():
+        for got, want in zip(actual[station], arrays):
+            np.testing.assert_allclose(got, want, equal_nan=True)
+
+def test_cached_day_aggregates_match_the_readings(app_module, tmp_path):
+    store = app_module.HistoryStore(str(tmp_path / 'history.sqlite3'))
+    today = datetime.now(app_module.PAGASA_TZ).replace(hour=0, minute=0, second=0, microsecond=0)
+    for hour in range(-4 * 24, 1, 3):
+        moment = today + timedelta(hours=hour, minutes=hour % 7)
+        levels = [hour % 5 + 0.5, float('nan') if hour % 4 == 0 else hour % 3 + 1.0]
+        store.append(snapshot(app_module, levels, moment.strftime('%Y-%m-%d %H:%M')))
+    store.compact()
+    # Readings still in the samples table: today, and a late one for a compacted day
+    store.append(snapshot(app_module, [7.0, 7.0], (today - timedelta(days=2, minutes=-30)).strftime('%Y-%m-%d %H:%M')))
+    
+    start = int((today - timedelta(days=4, hours=-5)).timestamp())
+    end = int(today.timestamp()) + 3600
+    for bucket, stations in ((3600, None), (86400, None), (4 * 3600, ['S1']), (420, None)):
+        for _ in range(2):
+            assert_same_aggregates(store.aggregate('water_level', 'current_wl', bucket, start, end, stations),
+                                   expected_aggregates(app_module, store, bucket, start, end, stations))
+    assert store.cache_stats['hits'] > 0
+    
+    # Compacting the late reading rewrites its day, which must not be served from the cache
+    store.compact()
+    store.append(snapshot(app_module, [9.0, 9.0], (today - timedelta(days=3, hours=-12)).strftime('%Y-%m-%d %H:%M')))
+    store.compact()
+    other = app_module.HistoryStore(store.path)
+    for reader in (store, other):
+        assert_same_aggregates(reader.aggregate('water_level', 'current_wl', 3600, start, end),
+                               expected_aggregates(app_module, store, 3600, start, end))
+
+def test_history_endpoint_serves_cached_days(app_module, client, tmp_path, monkeypatch):
+    store = app_module.HistoryStore(str(tmp_path / 'history.sqlite3'))
+    yesterday = datetime.now(app_module.PAGASA_TZ).replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=1)
+    for hour in range(24):
+        store.append(snapshot(app_module, [hour, 2 * hour], (yesterday + timedelta(hours=hour)).strftime('%Y-%m-%d %H:%M')))
+    store.compact()
+    monkeypatch.setattr(app_module, 'history_store', store)
+    
+    url = f"/water-level/history?from={yesterday.strftime('%Y-%m-%d')}&bucket=6h&station=S1"
+    first = client.get(url).get_json()
+    second = client.get(url).get_json()
+    assert first == second
+    assert list(first['data']) == ['S1']
+    assert first['data']['S1']['max'][:4] == [10.0, 22.0, 34.0, 46.0]
+    assert first['data']['S1']['count'][:4] == [6, 6, 6, 6]
+    assert store.cache_stats['hits'] == 1
+
+def test_stations_without_valid_readings_keep_their_empty_series(app_module, tmp_path):
+    store = app_module.HistoryStore(str(tmp_path / 'history.sqlite3'))
+    yesterday = datetime.now(app_module.PAGASA_TZ).replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=1)
+    for hour in range(0, 24, 4):
+        store.append(snapshot(app_module, [hour, float('nan')], (yesterday + timedelta(hours=hour)).strftime('%Y-%m-%d %H:%M')))
+    store.compact()
+    
+    start, end = int(yesterday.timestamp()), int(yesterday.timestamp()) + 86399
+    for _ in range(2):
+        aggregates = store.aggregate('water_level', 'current_wl', 3600, start, end)
+        assert_same_aggregates(aggregates, expected_aggregates(app_module, store, 3600, start, end))
+        assert not aggregates['S1'][4].any()
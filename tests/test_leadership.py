@@ -0,0 +1,128 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+pytest.importorskip('fcntl')
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# One worker process: the leader publishes what it is told, a follower serves what
+# it reads from the shared regions. Each command on stdin gets one JSON line back.
+WORKER = '''
+import json, sys
+import app
+from conftest import water_rows
+
+app.warmup_done.wait(10)
+source = app.SOURCES_BY_NAME['water_level']
+client = app.app.test_client()
+if sys.argv[1] == 'leader':
+    assert app.scraper_leadership.try_acquire()
+else:
+    assert not app.scraper_leadership.try_acquire()
+    app.scraping_active = True
+    app.start_scrapers = lambda: None
+    app.start_follower()
+print(json.dumps({'pid': app.os.getpid()}), flush=True)
+
+for line in sys.stdin:
+    command = json.loads(line)
+    if command['cmd'] == 'restore':
+        # What restore_snapshots leaves behind after a restart
+        state = app.source_states['water_level']
+        snapshot = app.TableSnapshot.from_rows(source, water_rows(command['levels']), command['time'])
+        snapshot.version = app.next_version(None)
+        state.update(snapshot=snapshot, last_updated=snapshot.search_time, hash=snapshot.digest, delta=None, stale=True)
+        app.last_updated, app.last_published_at = snapshot.search_time, app.datetime.now(app.timezone.utc)
+        reply = {'version': snapshot.version}
+    elif command['cmd'] == 'publish':
+        changed = app.publish_snapshot(source, water_rows(command['levels']), command['time'])
+        reply = {'changed': changed, 'version': app.source_states['water_level']['snapshot'].version}
+    elif command['cmd'] == 'get':
+        response = client.get(command['path'])
+        reply = {'status': response.status_code, 'etag': response.headers.get('ETag'), 'body': response.get_json()}
+    elif command['cmd'] == 'leader':
+        reply = {'leader': app.scraper_leadership.is_leader}
+    print(json.dumps(reply), flush=True)
+'''
+
+class Worker:
+    def __init__(self, role, shared_dir):
+        self.shared_dir = shared_dir
+        env = dict(os.environ, SCRAPERS_ENABLED='0', STORAGE_BACKEND='none', HISTORY_DB_PATH='', SNAPSHOT_DIR='',
+                   SHARED_STATE_DIR=shared_dir, SHARED_POLL_INTERVAL='0.05', LEADER_RETRY_INTERVAL='0.2',
+                   PYTHONPATH=os.pathsep.join([os.path.dirname(TESTS_DIR), TESTS_DIR]))
+        self.process = subprocess.Popen([sys.executable, '-c', WORKER, role], env=env, text=True,
+                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        self.pid = self.read()['pid']
+    
+    def read(self):
+        line = self.process.stdout.readline()
+        assert line, f"worker exited with {self.process.wait()}"
+        return json.loads(line)
+    
+    def send(self, cmd, **args):
+        self.process.stdin.write(json.dumps(dict(args, cmd=cmd)) + '\n')
+        self.process.stdin.flush()
+        return self.read()
+    
+    def wait_for(self, cmd, predicate, timeout=10, **args):
+        deadline = time.monotonic() + timeout
+        while True:
+            reply = self.send(cmd, **args)
+            if predicate(reply) or time.monotonic() > deadline:
+                return reply
+            time.sleep(0.05)
+    
+    def stop(self):
+        if self.process.poll() is None:
+            self.process.stdin.close()
+            self.process.wait(10)
+
+@pytest.fixture
+def workers(tmp_path):
+    started = []
+    def start(role):
+        started.append(Worker(role, str(tmp_path)))
+        return started[-1]
+    yield start
+    for worker in started:
+        worker.process.kill()
+        worker.process.wait()
+
+def test_follower_serves_the_leaders_snapshots_and_takes_over(workers):
+    leader = workers('leader')
+    follower = workers('follower')
+    assert follower.send('get', path='/water-level')['status'] == 503
+    
+    # A restored snapshot the leader shares unchanged after its first scrape: no delta
+    restored = leader.send('restore', levels=[1.0, 2.0, 3.0], time='2026-10-17 10:00')['version']
+    assert leader.send('publish', levels=[1.0, 2.0, 3.0], time='2026-10-17 10:00')['changed'] is False
+    expected = leader.send('get', path='/water-level')
+    served = follower.wait_for('get', lambda reply: reply['etag'] == expected['etag'], path='/water-level')
+    assert served == expected
+    assert served['body']['data'][1]['current_wl'] == '2.00'
+    
+    # A change the follower can sync with ?since=
+    published = leader.send('publish', levels=[1.0, 2.5, 3.0], time='2026-10-17 10:10')
+    assert published == {'changed': True, 'version': published['version']}
+    expected = leader.send('get', path='/water-level')
+    served = follower.wait_for('get', lambda reply: reply['etag'] == expected['etag'], path='/water-level')
+    assert served == expected
+    changes = follower.send('get', path=f"/water-level/changes?since={restored}")['body']
+    assert changes['full'] is False
+    assert changes['version'] == published['version']
+    assert [change['changed'] for change in changes['changes']] == [
+        [{'station': 'S1', 'old': {'current_wl': '2.00'}, 'new': {'current_wl': '2.50'}}]
+    ]
+    
+    # The kernel drops the leader's lock when it exits and the follower takes it
+    assert follower.send('leader') == {'leader': False}
+    leader.stop()
+    assert follower.wait_for('leader', lambda reply: reply['leader']) == {'leader': True}
+    with open(os.path.join(follower.shared_dir, 'scraper.lock')) as f:
+        assert int(f.read()) == follower.pid
@@ -0,0 +1,32 @@
+from conftest import water_rows
+
+def test_snapshot_file_round_trip(app_module, tmp_path, monkeypatch):
+    monkeypatch.setattr(app_module, 'SNAPSHOT_DIR', str(tmp_path))
+    source = app_module.SOURCES_BY_NAME['water_level']
+    app_module.publish_snapshot(source, water_rows([1.5, 2.5]), '2026-10-17 10:00')
+    
+    snapshot, _ = app_module.read_persisted_snapshot('water_level')
+    assert snapshot.search_time == '2026-10-17 10:00'
+    assert snapshot.to_dicts()[1]['current_wl'] == '2.50'
+
+def test_snapshot_from_another_site_is_not_restored(app_module, tmp_path, monkeypatch):
+    monkeypatch.setattr(app_module, 'SNAPSHOT_DIR', str(tmp_path))
+    source = app_module.SOURCES_BY_NAME['water_level']
+    monkeypatch.setitem(source, 'url', 'http://127.0.0.1:8765/water/table.do')
+    app_module.publish_snapshot(source, water_rows([3.0]), '2026-10-17 10:10')
+    monkeypatch.undo()
+    monkeypatch.setattr(app_module, 'SNAPSHOT_DIR', str(tmp_path))
+    
+    assert app_module.read_persisted_snapshot('water_level') is None
+
+def test_corrupt_or_old_snapshot_files_are_ignored(app_module, tmp_path, monkeypatch):
+    monkeypatch.setattr(app_module, 'SNAPSHOT_DIR', str(tmp_path))
+    (tmp_path / 'water_level.snapshot').write_bytes(b'PGSTATE1' + b'\0' * 40)
+    assert app_module.read_persisted_snapshot('water_level') is None
+    
+    source = app_module.SOURCES_BY_NAME['water_level']
+    app_module.publish_snapshot(source, water_rows([4.0]), '2026-10-17 10:20')
+    record = bytearray((tmp_path / 'water_level.snapshot').read_bytes())
+    record[-1] ^= 0xFF
+    (tmp_path / 'water_level.snapshot').write_bytes(bytes(record))
+    assert app_module.read_persisted_snapshot('water_level') is None
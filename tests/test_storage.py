@@ -0,0 +1,69 @@
+from datetime import datetime
+
+import pytest
+
+from conftest import water_rows
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def storage(app_module, request, tmp_path):
+    if request.param == 'sqlite':
+        return app_module.SQLiteStorage(str(tmp_path / 'storage.sqlite3'))
+    return app_module.MemoryStorage()
+
+def snapshots(app_module, levels):
+    """Consecutive water level snapshots with S1 at each of the given levels, and the delta to each one"""
+    source = app_module.SOURCES_BY_NAME['water_level']
+    previous = None
+    for minute, level in enumerate(levels):
+        snapshot = app_module.TableSnapshot.from_rows(source, water_rows([1.0, level]), f"2026-10-17 10:{minute:02d}")
+        snapshot.version = app_module.next_version(previous)
+        yield snapshot, app_module.compute_delta(previous, snapshot) if previous is not None else None
+        previous = snapshot
+
+def checkpoint(snapshot):
+    return {'data': snapshot.to_dicts(), 'last_updated': snapshot.search_time, 'version': snapshot.version,
+            'date': snapshot.search_time[:10]}
+
+def test_checkpoint_round_trip(storage):
+    document = {'data': water_rows([1.0, 2.0]), 'last_updated': '2026-10-17 10:00', 'version': 3, 'date': '2026-10-17'}
+    storage.write_checkpoint('water_levels', '2026-10-17', document, new_date=True)
+    
+    latest = storage.read_latest('water_levels')
+    assert isinstance(latest.pop('update_time'), datetime)
+    assert latest == document
+    stored, deltas = storage.read_dated('water_levels', '2026-10-17')
+    assert isinstance(stored.pop('update_time'), datetime)
+    assert (stored, deltas) == (document, [])
+    assert storage.read_dated('water_levels', '2026-10-16') is None
+    assert storage.read_latest('rainfall_data') is None
+
+def test_deltas_after_a_checkpoint_replay_to_the_latest_snapshot(app_module, storage):
+    written = list(snapshots(app_module, [2.0, 2.5, 3.0, 3.5]))
+    storage.write_checkpoint('water_levels', '2026-10-17', checkpoint(written[0][0]))
+    for _, delta in written[1:]:
+        storage.write_delta('water_levels', '2026-10-17', delta)
+    # Written again after a retry: still one copy of it
+    storage.write_delta('water_levels', '2026-10-17', written[-1][1])
+    
+    stored, deltas = storage.read_dated('water_levels', '2026-10-17')
+    assert [delta['version'] for delta in deltas] == [snapshot.version for snapshot, _ in written[1:]]
+    data, last_updated, version, _ = app_module.replay_stored('water_levels', stored, deltas)
+    latest = written[-1][0]
+    assert (data, last_updated, version) == (latest.to_dicts(), latest.search_time, latest.version)
+    
+    # Only the deltas written after a newer checkpoint are replayed on top of it
+    storage.write_checkpoint('water_levels', '2026-10-17', checkpoint(written[2][0]))
+    stored, deltas = storage.read_dated('water_levels', '2026-10-17')
+    assert stored['version'] == written[2][0].version
+    assert [delta['version'] for delta in deltas] == [latest.version]
+    assert app_module.replay_stored('water_levels', stored, deltas)[0] == latest.to_dicts()
+
+def test_dates_are_listed_from_the_checkpoints(app_module, storage):
+    assert storage.load_dates() == set()
+    document = checkpoint(next(snapshots(app_module, [2.0]))[0])
+    for collection, date in [('water_levels', '2026-10-16'), ('water_levels', '2026-10-17'), ('rainfall_data', '2026-10-15')]:
+        storage.write_checkpoint(collection, date, dict(document, date=date))
+    
+    assert storage.load_dates() == {'2026-10-15', '2026-10-16', '2026-10-17'}
+    assert storage.scan_dates({'water_levels'}) == {'2026-10-16', '2026-10-17'}
+    assert storage.scan_dates({'rainfall_data', 'tide'}) == {'2026-10-15'}
@@ -0,0 +1,50 @@
+import time
+
+import pytest
+
+from conftest import water_rows
+
+class FailingStorage:
+    name = 'failing'
+    
+    def __init__(self):
+        self.attempts = []
+        self.fail = True
+    
+    def write_checkpoint(self, collection_name, date, document, new_date=False):
+        self.attempts.append(time.monotonic())
+        if self.fail:
+            raise RuntimeError('storage unavailable')
+
+@pytest.fixture
+def failing_storage(app_module, monkeypatch):
+    storage = FailingStorage()
+    monkeypatch.setattr(app_module, 'storage', storage)
+    return storage
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+def test_new_snapshots_do_not_cut_the_backoff_short(app_module, failing_storage):
+    writer = app_module.StorageWriter()
+    writer.start()
+    try:
+        writer.enqueue('water_levels', water_rows([1.0]), '2026-10-17 10:00')
+        assert wait_for(lambda: len(failing_storage.attempts) == 1)
+        
+        # First backoff is 2 s; snapshots keep arriving meanwhile
+        for minute in range(1, 10):
+            writer.enqueue('water_levels', water_rows([1.0 + minute]), f"2026-10-17 10:0{minute}")
+            time.sleep(0.1)
+        assert len(failing_storage.attempts) == 1
+        assert writer.stats['coalesced'] == 9
+        
+        failing_storage.fail = False
+        assert wait_for(lambda: writer.stats['commits'] == 1)
+        assert failing_storage.attempts[1] - failing_storage.attempts[0] >= 1.9
+        assert not writer._pending
+    finally:
+        writer.stop(timeout=0)
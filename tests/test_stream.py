@@ -0,0 +1,47 @@
+from werkzeug.test import EnvironBuilder
+
+from conftest import water_rows
+
+def test_stream_closed_before_first_chunk_keeps_no_slot(app_module):
+    before = app_module.snapshot_events._subscribers
+    for _ in range(5):
+        # As a WSGI server does when the client is gone before anything was sent
+        statuses = []
+        body = app_module.app(EnvironBuilder(path='/stream').get_environ(), lambda status, headers: statuses.append(status))
+        assert statuses == ['200 OK']
+        body.close()
+    assert app_module.snapshot_events._subscribers == before
+
+def test_stream_slot_is_released_after_streaming(app_module, client):
+    before = app_module.snapshot_events._subscribers
+    response = client.get('/stream', buffered=False)
+    chunks = iter(response.response)
+    assert next(chunks).startswith(b'retry:')
+    assert app_module.snapshot_events._subscribers == before + 1
+    response.close()
+    assert app_module.snapshot_events._subscribers == before
+
+def test_stream_refuses_subscribers_over_the_cap(app_module, client, monkeypatch):
+    monkeypatch.setattr(app_module.snapshot_events, 'max_subscribers', app_module.snapshot_events._subscribers)
+    assert client.get('/stream', buffered=False).status_code == 503
+
+def test_snapshot_without_a_delta_is_streamed_whole(app_module, monkeypatch):
+    source = app_module.SOURCES_BY_NAME['water_level']
+    state = dict(app_module.source_states['water_level'])
+    monkeypatch.setitem(app_module.source_states, 'water_level', state)
+    monkeypatch.setitem(app_module.source_changes, 'water_level', app_module.SnapshotChangeLog())
+    
+    # As a follower applies a restored snapshot the leader shared after an unchanged scrape
+    first = app_module.TableSnapshot.from_rows(source, water_rows([1.0, 2.0]), '2026-10-17 10:00')
+    first.version = app_module.next_version(None)
+    state.update(snapshot=first, delta=None)
+    last_id = app_module.snapshot_events.get_stats()['last_event_id']
+    app_module.announce_snapshot(source)
+    [(_, event, data)] = app_module.snapshot_events.events_since(last_id, 0)
+    assert (event, data) == ('water-level', state['stream_snapshot'])
+    
+    second = app_module.TableSnapshot.from_rows(source, water_rows([1.0, 2.5]), '2026-10-17 10:10')
+    second.version = app_module.next_version(first)
+    state.update(snapshot=second, delta=app_module.compute_delta(first, second))
+    app_module.announce_snapshot(source)
+    assert app_module.source_changes['water_level'].since(first.version) == [state['delta']]